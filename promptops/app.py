@@ -17,16 +17,47 @@ If this service gains execution capability, the architecture has failed.
 import os
 import sys
 import json
+import uuid
+import time
+import asyncio
+import argparse
 from datetime import datetime
 from pathlib import Path
 from typing import Optional, Dict, Any
 
-try:
-    from openai import OpenAI
-except ImportError:
-    print("Error: openai package not installed")
-    print("Run: pip install -r requirements.txt")
-    sys.exit(1)
+import candidates
+import fast_path
+from context_builder import build_full_prompt, cacheable_prefix_tokens, get_relevant_context
+from environments import (
+    ALL_ENVIRONMENTS, check_rollout, environment_instructions, environment_names, get_environments,
+    rollout_text, rollout_violations, tfvars_file, write_rollout,
+)
+from llm import get_backend
+from streaming import ChatStream, extract_json_block
+from response_cache import ResponseCache, response_cache_from_env
+from history import history_manager_from_env, estimate_tokens
+from intent_log import IntentRecord, content_hash, get_intent_log
+import tfvars
+from validator import REPAIR_ATTEMPTS, get_rule_set, repair_prompt
+from structured_output import structured_output_from_env
+from metrics import RequestMetrics, fill_token_counts, get_registry, start_metrics_server_from_env
+
+
+def tfvars_header() -> str:
+    """Comment header written at the top of a newly generated terraform.tfvars."""
+    return f"""# Terraform Variables for GPU Infrastructure
+# Generated by PromptOps service on {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+#
+# This file was generated by an LLM reasoning service.
+# The service cannot execute Terraform.
+# Review this file and run 'terraform plan' manually.
+
+"""
+
+
+def render_tfvars(vars_dict: Dict[str, Any]) -> str:
+    """Render Terraform variable values as terraform.tfvars content."""
+    return tfvars_header() + tfvars.dumps(vars_dict)
 
 
 class PromptOpsService:
@@ -37,44 +68,57 @@ class PromptOpsService:
     It has no ability to execute infrastructure changes.
     """
 
-    def __init__(self):
-        """Initialize the PromptOps service."""
-        # LLM Provider configuration
-        # Set PROMPTOPS_LOCAL=true to use Ollama instead of OpenAI
-        self.use_local = os.getenv("PROMPTOPS_LOCAL", "").lower() == "true"
-
-        if self.use_local:
-            local_url = os.getenv("PROMPTOPS_LOCAL_URL", "http://localhost:11434/v1")
-            self.model = os.getenv("PROMPTOPS_LOCAL_MODEL", "llama3.1")
-            self.client = OpenAI(base_url=local_url, api_key="ollama")
-            print(f"Using local model: {self.model} via {local_url}")
-        else:
-            self.api_key = os.getenv("OPENAI_API_KEY")
-            if not self.api_key:
-                raise ValueError(
-                    "OPENAI_API_KEY environment variable not set.\n"
-                    "Set OPENAI_API_KEY for OpenAI, or PROMPTOPS_LOCAL=true for Ollama.\n"
-                    "This service should NEVER have GCP, AWS, or Ansible credentials."
-                )
-            self.client = OpenAI(api_key=self.api_key)
-            self.model = os.getenv("PROMPTOPS_MODEL", "gpt-4o")
+    def __init__(self, environments: Optional[list[str]] = None):
+        """
+        Initialize the PromptOps service.
+
+        environments names the terraform/environments/<name>/ targets
+        (default: staging). With several, each intent is rolled out to all
+        of them from one LLM reply.
+        """
+        # LLM backend with retries and a circuit breaker (see llm.py).
+        # Set PROMPTOPS_LOCAL=true to use Ollama, PROMPTOPS_LLM_BACKEND=mock to run offline.
+        self.backend = get_backend()
+        self.client = self.backend
+        self.model = self.backend.model
+        if self.backend.name != "openai":
+            print(f"Using {self.backend.description}")
+
+        # Stream tokens to the terminal as they arrive (PROMPTOPS_STREAM=false to disable).
+        # Sampling several candidates (PROMPTOPS_CANDIDATES > 1) needs whole replies.
+        self.stream = (os.getenv("PROMPTOPS_STREAM", "true").lower() != "false"
+                       and candidates.CANDIDATES <= 1)
+
+        # JSON-schema constrained replies when not streaming (PROMPTOPS_STRUCTURED_OUTPUT)
+        self.structured = structured_output_from_env(self.backend.supports_structured)
 
         # Load system prompt
         self.system_prompt = self._load_prompt("system.txt")
         self.planning_prompt = self._load_prompt("planning.txt")
 
-        # Conversation history
-        self.messages = [
-            {"role": "system", "content": self.system_prompt}
-        ]
+        # Conversation history (user/assistant turns only), compacted to a
+        # token budget before every call. The system prompt, platform context
+        # and planning instructions form a static prefix added per request.
+        self.messages = []
+        self.history = history_manager_from_env()
 
         # Paths (write-only, no execution)
         self.repo_root = Path(__file__).parent.parent
-        self.intent_dir = self.repo_root / "plans" / "intent"
-        self.tfvars_path = self.repo_root / "terraform" / "environments" / "staging" / "terraform.tfvars"
-
-        # Ensure output directories exist
-        self.intent_dir.mkdir(parents=True, exist_ok=True)
+        self.terraform_dir = self.repo_root / "terraform"
+        if environments == [ALL_ENVIRONMENTS]:
+            environments = environment_names(self.terraform_dir)
+        self.environments = get_environments(self.terraform_dir, environments or ["staging"])
+        self.fanout = len(self.environments) > 1
+        self.tfvars_path = self.environments[0].tfvars_path
+        self.tfvars_file = tfvars.TfvarsFile(self.tfvars_path)
+
+        # Every request is appended to the intent log (python intent_log.py to query/export)
+        self.intent_log = get_intent_log()
+        self.session_id = f"cli-{uuid.uuid4().hex[:8]}"
+
+        # Replies to identical conversations are served from disk
+        # (PROMPTOPS_RESPONSE_CACHE=false to bypass)
+        self.response_cache = response_cache_from_env(self.repo_root / ".promptops" / "response_cache.sqlite")
 
     def _load_prompt(self, filename: str) -> str:
         """Load a prompt template from the prompts directory."""
@@ -84,30 +128,102 @@ class PromptOpsService:
         except FileNotFoundError:
             raise ValueError(f"Prompt file not found: {prompt_path}")
 
-    def _call_gpt4(self, user_message: str) -> str:
+    def _call_gpt4(self, user_message: str, on_json=None) -> str:
         """
         Call GPT-4.x for reasoning.
 
         This is the only external API this service calls.
         No cloud provider APIs. No infrastructure APIs.
+
+        In streaming mode tokens are printed as they arrive and on_json is
+        called with the ```json block the moment its closing fence arrives.
         """
         self.messages.append({"role": "user", "content": user_message})
+        self.messages = self.history.compact(self.messages)
+
+        # Static prefix first (identical bytes every turn, so the provider's
+        # prompt cache can reuse it), then the conversation. Large catalogs
+        # are pruned to the variables this conversation needs.
+        context_start = time.perf_counter()
+        context = get_relevant_context(self.terraform_dir, self.messages)
+        messages, _ = build_full_prompt(
+            self.system_prompt, context.platform_context, self.messages, planning_prompt=self.planning_prompt
+        )
+        request_metrics = RequestMetrics(
+            source="cli",
+            model=self.model,
+            context_build_s=time.perf_counter() - context_start,
+            context_tokens=context.tokens,
+            context_saved_tokens=context.saved_tokens,
+            history_tokens=sum(estimate_tokens(m["content"]) for m in self.messages),
+            prefix_tokens=cacheable_prefix_tokens(messages),
+        )
+        request_start = time.perf_counter()
+
+        # Streaming replies are single, plain-text completions
+        cache_key = ResponseCache.make_key(
+            self.model, 0.7, messages, context.context_hash,
+            structured=not self.stream and self.structured.enabled,
+            candidates=1 if self.stream else candidates.CANDIDATES,
+        )
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            if self.stream:
+                print(f"\n{cached}")
+            self.messages.append({"role": "assistant", "content": cached})
+            request_metrics.cached = True
+            request_metrics.total_s = time.perf_counter() - request_start
+            fill_token_counts(request_metrics, messages, cached)
+            get_registry().record(request_metrics)
+            return cached
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.messages,
-                temperature=0.7,
-                max_tokens=2000
-            )
-
-            assistant_message = response.choices[0].message.content
+            if self.stream:
+                stream = ChatStream(
+                    self.client,
+                    on_json=on_json,
+                    include_usage=self.backend.supports_usage,
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=2000
+                )
+                print()
+                for delta in stream:
+                    print(delta, end="", flush=True)
+                print()
+                assistant_message = stream.text
+                usage = stream.usage
+                request_metrics.first_token_s = stream.first_token_s
+                request_metrics.json_extract_s = stream.json_extract_s
+            else:
+                # Schema-constrained reply where the backend supports it;
+                # with PROMPTOPS_CANDIDATES > 1, the best of several samples
+                best, usage = candidates.generate(
+                    self.client,
+                    self.structured,
+                    get_rule_set(self.terraform_dir),
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=2000
+                )
+                assistant_message = best.text
+
+            request_metrics.total_s = time.perf_counter() - request_start
+            fill_token_counts(request_metrics, messages, assistant_message, usage)
+            get_registry().record(request_metrics)
+
             self.messages.append({"role": "assistant", "content": assistant_message})
+            self.response_cache.put(cache_key, assistant_message)
 
             return assistant_message
 
         except Exception as e:
-            return f"Error calling GPT-4: {str(e)}"
+            error = f"Error calling GPT-4: {str(e)}"
+            if self.stream:
+                print(f"\n{error}")
+            return error
 
     def _extract_terraform_vars(self, response: str) -> Optional[Dict[str, Any]]:
         """
@@ -115,112 +231,156 @@ class PromptOpsService:
 
         Looks for JSON blocks in the response that contain Terraform variables.
         """
-        # Simple extraction: look for JSON blocks
-        import re
-        json_pattern = r'```json\s*(\{.*?\})\s*```'
-        matches = re.findall(json_pattern, response, re.DOTALL)
-
-        if not matches:
-            return None
+        return extract_json_block(response)
 
-        try:
-            return json.loads(matches[0])
-        except json.JSONDecodeError:
+    def _fast_answer(self, user_intent: str) -> Optional[fast_path.FastAnswer]:
+        """
+        Answer a common intent from the current tfvars without calling the
+        LLM (fast_path.py). The exchange still joins the conversation.
+        """
+        if self.fanout:
+            # Each environment's file is layered over the shared terraform.tfvars
+            shared = tfvars.TfvarsFile(self.terraform_dir / "terraform.tfvars").load()
+            current = {env.name: {**shared, **tfvars_file(env).load()} for env in self.environments}
+        else:
+            current = {"": self.tfvars_file.load()}
+        answer = fast_path.answer(user_intent, self.terraform_dir, current)
+        if answer is None:
             return None
-
-    def _write_intent_document(self, user_intent: str, response: str):
-        """Write an intent document capturing the user's request and the service's reasoning."""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        intent_file = self.intent_dir / f"intent_{timestamp}.md"
-
-        content = f"""# Infrastructure Intent Document
-
-**Date**: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-
-## User Intent
-
-{user_intent}
-
-## PromptOps Analysis
-
-{response}
-
-## Status
-
-- Generated: {timestamp}
-- Terraform vars: {"Written" if self.tfvars_path.exists() else "Not yet generated"}
-- Speculative plan: Run `terraform/speculative/run_plan.sh` to validate
-
----
-
-This document was generated by the PromptOps reasoning service.
-The service has no execution privileges and cannot apply infrastructure changes.
-"""
-
-        intent_file.write_text(content)
-        print(f"\n[Intent document written to: {intent_file.relative_to(self.repo_root)}]")
-
-    def _write_terraform_vars(self, vars_dict: Dict[str, Any]):
+        self.messages.append({"role": "user", "content": f"User request: {user_intent}"})
+        self.messages.append({"role": "assistant", "content": answer.text})
+        if self.stream:
+            print(f"\n{answer.text}")
+        print(f"\n[Answered locally in {answer.duration_s * 1000:.1f} ms, no LLM call]")
+        return answer
+
+    def _log_intent(self, user_intent: str, response: str, tf_vars: Optional[Dict[str, Any]],
+                    tfvars_content: Optional[str], violations: list, model: Optional[str] = None):
+        """Append the request, the service's reasoning and its outcome to the intent log."""
+        record_id = self.intent_log.append(IntentRecord(
+            intent=user_intent,
+            response=response,
+            session_id=self.session_id,
+            source="cli",
+            model=model or self.model,
+            tfvars=tf_vars,
+            tfvars_hash=content_hash(tfvars_content) if tfvars_content is not None else None,
+            tfvars_written=tfvars_content is not None,
+            violations=[str(v) for v in violations],
+        ))
+        print(f"\n[Intent logged: {record_id} (python intent_log.py show {record_id})]")
+
+    def _write_terraform_vars(self, vars_dict: Dict[str, Any]) -> str:
         """
         Write Terraform variable values to terraform.tfvars.
 
         This is the ONLY infrastructure-affecting action this service takes.
         It writes files. It does not execute changes.
-        """
-        # Ensure parent directory exists
-        self.tfvars_path.parent.mkdir(parents=True, exist_ok=True)
 
-        # Generate tfvars content
-        content = f"""# Terraform Variables for GPU Infrastructure
-# Generated by PromptOps service on {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-#
-# This file was generated by an LLM reasoning service.
-# The service cannot execute Terraform.
-# Review this file and run 'terraform plan' manually.
-
-"""
+        Values are merged into the existing file: only keys whose value
+        changed are rewritten, comments and other keys are left as they are.
+        Returns the resulting file content.
+        """
+        self.tfvars_file.header = tfvars_header()
+        content, changed = self.tfvars_file.merge(vars_dict)
+        if not changed:
+            print(f"\n[Terraform vars unchanged: {self.tfvars_path.relative_to(self.repo_root)}]")
+            return content
+        print(f"\n[Terraform vars written to: {self.tfvars_path.relative_to(self.repo_root)} ({', '.join(changed)})]")
+        print("[Run speculative plan to validate: terraform/speculative/run_plan.sh]")
+        return content
 
-        for key, value in vars_dict.items():
-            if isinstance(value, str):
-                content += f'{key} = "{value}"\n'
-            elif isinstance(value, (int, float)):
-                content += f'{key} = {value}\n'
-            elif isinstance(value, bool):
-                content += f'{key} = {str(value).lower()}\n'
-            elif isinstance(value, list):
-                content += f'{key} = {json.dumps(value)}\n'
+    def _write_rollout(self, vars_dict: Dict[str, Any]) -> Optional[str]:
+        """
+        Write one proposal to every target environment's terraform.tfvars
+        (concurrently). Returns the combined content, None if nothing was written.
+        """
+        results = write_rollout(
+            check_rollout(self.environments, vars_dict, get_rule_set(self.terraform_dir)), tfvars_header()
+        )
+        for result in results:
+            path = result.environment.tfvars_path.relative_to(self.repo_root)
+            if result.error:
+                print(f"[{result.environment.name}: {result.error}]")
+            elif result.changed:
+                print(f"[{result.environment.name}: written to {path} ({', '.join(result.changed)})]")
             else:
-                content += f'{key} = {json.dumps(value)}\n'
-
-        self.tfvars_path.write_text(content)
-        print(f"\n[Terraform vars written to: {self.tfvars_path.relative_to(self.repo_root)}]")
-        print("[Run speculative plan to validate: terraform/speculative/run_plan.sh]")
+                print(f"[{result.environment.name}: unchanged ({path})]")
+        return rollout_text(results) or None
 
     def process_intent(self, user_intent: str) -> str:
         """
         Process infrastructure intent through GPT-4.
 
         This is the core reasoning loop:
-        1. Accept natural language intent
+        1. Accept natural language intent (common ones are answered
+           locally, see fast_path.py)
         2. Reason about infrastructure requirements
         3. Generate Terraform variable values
-        4. Write outputs to disk
+        4. Validate them locally, asking the LLM to repair violations
+        5. Write outputs to disk
 
         No execution occurs. Only reasoning and file writing.
         """
-        # Enhance the prompt with planning instructions
-        full_prompt = f"{self.planning_prompt}\n\nUser request: {user_intent}"
-
-        # Get response from GPT-4
-        response = self._call_gpt4(full_prompt)
-
-        # Write intent document
-        self._write_intent_document(user_intent, response)
+        # Planning instructions are part of the static prompt prefix
+        full_prompt = f"User request: {user_intent}"
+        if self.fanout:
+            # One reply covers every environment
+            full_prompt += "\n\n" + environment_instructions([env.name for env in self.environments])
+
+        # Proposals are checked against the platform constraints before
+        # anything is written; violations go back to the LLM as a repair turn.
+        rules = get_rule_set(self.terraform_dir)
+
+        def validate(tf_vars: Dict[str, Any]) -> list:
+            if self.fanout:
+                return rollout_violations(check_rollout(self.environments, tf_vars, rules))
+            return rules.validate(tf_vars)
+
+        # Get response from GPT-4. When streaming, valid Terraform vars are
+        # written as soon as the JSON block closes, before the explanation finishes.
+        written = []
+
+        def write_vars_early(tf_vars: Dict[str, Any]):
+            # A rollout is only written once every environment is valid
+            if self.fanout or rules.validate(tf_vars):
+                return
+            print()
+            written.append((tf_vars, self._write_terraform_vars(tf_vars)))
+
+        fast = self._fast_answer(user_intent)
+        if fast:
+            response, tf_vars = fast.text, fast.proposal
+        else:
+            response = self._call_gpt4(full_prompt, on_json=write_vars_early)
+            tf_vars = None if written else self._extract_terraform_vars(response)
 
-        # Extract and write Terraform vars if present
-        tf_vars = self._extract_terraform_vars(response)
-        if tf_vars:
-            self._write_terraform_vars(tf_vars)
+        rejected = []
+        for attempt in range(REPAIR_ATTEMPTS + 1):
+            violations = validate(tf_vars) if tf_vars else []
+            if not violations:
+                break
+            details = "; ".join(str(v) for v in violations)
+            if attempt == REPAIR_ATTEMPTS:
+                print(f"\n[Proposal rejected, not written: {details}]")
+                tf_vars = None
+                rejected = violations
+                break
+            print(f"\n[Proposal violates platform constraints ({details}); asking for a fix]")
+            response = self._call_gpt4(repair_prompt(violations), on_json=write_vars_early)
+            tf_vars = None if written else self._extract_terraform_vars(response)
+
+        # Write Terraform vars if present and not already written
+        tfvars_content = None
+        if written:
+            tf_vars, tfvars_content = written[-1]
+        elif tf_vars and self.fanout:
+            tfvars_content = self._write_rollout(tf_vars)
+        elif tf_vars:
+            tfvars_content = self._write_terraform_vars(tf_vars)
+
+        self._log_intent(user_intent, response, tf_vars, tfvars_content, rejected,
+                         model=fast_path.FAST_PATH_MODEL if fast else None)
 
         return response
 
@@ -238,6 +398,8 @@ The service has no execution privileges and cannot apply infrastructure changes.
         print("It has NO execution privileges and NO cloud credentials.")
         print("It can only write plans and Terraform variable files.")
         print()
+        print(f"Session: {self.session_id} (python intent_log.py query --session {self.session_id})")
+        print(f"Environments: {', '.join(env.name for env in self.environments)}")
         print("Type 'quit' or 'exit' to end the session.")
         print("=" * 70)
         print()
@@ -247,6 +409,10 @@ The service has no execution privileges and cannot apply infrastructure changes.
                 user_input = input("\n> ").strip()
 
                 if user_input.lower() in ['quit', 'exit', 'q']:
+                    stats = get_registry().fast_path_stats()
+                    if stats["hit_rate"] is not None:
+                        print(f"\nAnswered locally: {stats['hits']} of {stats['hits'] + stats['misses']} "
+                              f"requests ({stats['hit_rate']:.0%})")
                     print("\nEnding PromptOps session.")
                     break
 
@@ -255,7 +421,8 @@ The service has no execution privileges and cannot apply infrastructure changes.
 
                 print("\n[Reasoning...]")
                 response = self.process_intent(user_input)
-                print(f"\n{response}")
+                if not self.stream:
+                    print(f"\n{response}")
 
             except KeyboardInterrupt:
                 print("\n\nSession interrupted. Exiting.")
@@ -264,10 +431,159 @@ The service has no execution privileges and cannot apply infrastructure changes.
                 print(f"\nError: {e}")
 
 
+def load_batch_intents(path: Path) -> list[dict]:
+    """
+    Load intents from a JSONL file.
+
+    Each line is an object with the intent text in "body", "intent" or
+    "prompt" (optionally prefixed by "title") and an id in "request_id" or
+    "id". Lines without an id are numbered.
+    """
+    intents = []
+    for line_no, line in enumerate(path.read_text().splitlines(), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        text = record.get("body") or record.get("intent") or record.get("prompt") or ""
+        if record.get("title") and record.get("body"):
+            text = f"{record['title']}\n\n{text}"
+        request_id = str(record.get("request_id") or record.get("id") or f"line-{line_no:05d}")
+        intents.append({"request_id": request_id, "intent": text})
+    return intents
+
+
+async def _run_batch(intents: list[dict], output_dir: Path, concurrency: int, timeout: float) -> dict:
+    from async_service import AsyncPromptOpsService
+
+    service = AsyncPromptOpsService(max_concurrency=concurrency, request_timeout=timeout)
+    intent_log = get_intent_log()
+    results = []
+    done = 0
+
+    async def run_one(item: dict):
+        nonlocal done
+        # Each request is its own session so replays are independent
+        result = await service.process_intent(item["request_id"], item["intent"])
+
+        tfvars_content = None
+        if result.tfvars:
+            request_dir = output_dir / _safe_dirname(item["request_id"])
+            request_dir.mkdir(parents=True, exist_ok=True)
+            tfvars_content = render_tfvars(result.tfvars)
+            (request_dir / "terraform.tfvars").write_text(tfvars_content)
+        item["intent_id"] = intent_log.append(IntentRecord(
+            intent=item["intent"],
+            response=result.response or result.error or "",
+            session_id=item["request_id"],
+            source="batch",
+            model=fast_path.FAST_PATH_MODEL if result.fast_path else service.model,
+            tfvars=result.tfvars,
+            tfvars_hash=content_hash(tfvars_content) if tfvars_content is not None else None,
+            tfvars_written=tfvars_content is not None,
+            violations=[str(v) for v in result.violations],
+        ))
+
+        done += 1
+        status = "ok" if result.ok else "FAILED"
+        print(f"[{done}/{len(intents)}] {item['request_id']}: {status}"
+              + ("" if result.ok else f" ({result.error})"))
+        results.append((item, result))
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(run_one(item) for item in intents))
+    finally:
+        await service.close()
+    elapsed = time.perf_counter() - start
+
+    failed = [r for _, r in results if not r.ok]
+    latencies = sorted(r.metrics.total_s for _, r in results if r.ok and r.metrics)
+    summary = {
+        "total": len(intents),
+        "succeeded": len(results) - len(failed),
+        "failed": len(failed),
+        "with_tfvars": sum(1 for _, r in results if r.tfvars),
+        "rejected": sum(1 for _, r in results if r.violations),
+        "repairs": sum(r.repairs for _, r in results),
+        "cached": sum(1 for _, r in results if r.metrics and r.metrics.cached),
+        "fast_path": sum(1 for _, r in results if r.fast_path),
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(len(intents) / elapsed, 3) if elapsed else 0.0,
+        "latency_p50_s": round(latencies[len(latencies) // 2], 3) if latencies else None,
+        "latency_max_s": round(latencies[-1], 3) if latencies else None,
+        "requests": [
+            {
+                "request_id": item["request_id"],
+                "intent_id": item["intent_id"],
+                "ok": result.ok,
+                "error": result.error,
+                "tfvars": bool(result.tfvars),
+                "fast_path": result.fast_path,
+                "violations": [str(v) for v in result.violations],
+                "latency_s": round(result.metrics.total_s, 3) if result.ok and result.metrics else None,
+            }
+            for item, result in sorted(results, key=lambda pair: pair[0]["request_id"])
+        ],
+    }
+    (output_dir / "summary.json").write_text(json.dumps(summary, indent=2))
+    return summary
+
+
+def _safe_dirname(name: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in name) or "request"
+
+
+def run_batch(path: Path, output_dir: Optional[Path] = None, concurrency: int = 8, timeout: float = 120.0) -> dict:
+    """
+    Replay a JSONL file of intents concurrently.
+
+    Writes <output_dir>/<request_id>/terraform.tfvars per request that
+    produced valid vars plus <output_dir>/summary.json, appends every
+    request to the intent log, and returns the summary.
+    Like the interactive session, this only reasons and writes files.
+    """
+    intents = load_batch_intents(path)
+    if output_dir is None:
+        repo_root = Path(__file__).parent.parent
+        output_dir = repo_root / "plans" / "batch" / datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"Running {len(intents)} intents from {path} (concurrency {concurrency})")
+    summary = asyncio.run(_run_batch(intents, output_dir, concurrency, timeout))
+
+    print()
+    print("=" * 70)
+    print(f"Batch complete: {summary['succeeded']}/{summary['total']} succeeded, "
+          f"{summary['failed']} failed, {summary['with_tfvars']} produced tfvars, "
+          f"{summary['fast_path']} answered locally")
+    print(f"Elapsed: {summary['elapsed_s']}s  Throughput: {summary['throughput_per_s']} intents/s")
+    print(f"Results: {output_dir}")
+    print("=" * 70)
+    return summary
+
+
 def main():
     """Entry point for the PromptOps service."""
+    parser = argparse.ArgumentParser(description="PromptOps infrastructure reasoning service")
+    parser.add_argument("--batch", type=Path, metavar="JSONL",
+                        help="Replay intents from a JSONL file instead of an interactive session")
+    parser.add_argument("--output-dir", type=Path, help="Batch output directory (default: plans/batch/<timestamp>)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent LLM requests in batch mode")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in batch mode (seconds)")
+    parser.add_argument("--env", action="append", metavar="NAME",
+                        help="Target environment(s) under terraform/environments/ (repeat or comma-separate; "
+                             "'all' for every one). Default: staging")
+    args = parser.parse_args()
+    environments = [name.strip() for arg in args.env or [] for name in arg.split(",") if name.strip()]
+
+    start_metrics_server_from_env()
     try:
-        service = PromptOpsService()
+        if args.batch:
+            summary = run_batch(args.batch, args.output_dir, args.concurrency, args.timeout)
+            sys.exit(1 if summary["failed"] else 0)
+        service = PromptOpsService(environments or None)
         service.interactive_session()
     except ValueError as e:
         print(f"Configuration error: {e}")
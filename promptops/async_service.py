@@ -0,0 +1,305 @@
+"""
+Async PromptOps Service - Concurrent, multi-session reasoning core.
+
+WHAT THIS FILE DOES:
+1. Holds conversation state per session instead of one shared message list
+2. Calls the LLM through the async backend in llm.py, so one process can serve
+   dozens of operators without a thread per user
+3. Bounds concurrent LLM calls with a semaphore
+4. Applies a per-request timeout and supports cancelling a session's
+   in-flight request
+5. Validates proposed Terraform vars locally (validator.py) and asks the
+   LLM for a repaired proposal when they break platform constraints
+6. Answers the common intents from terraform/terraform.tfvars without an
+   LLM call (fast_path.py)
+
+Like PromptOpsService this has zero execution privilege. It only reasons;
+process_intent() returns the response and any extracted Terraform vars that
+pass validation, and leaves writing files to the caller.
+
+Usage:
+    service = AsyncPromptOpsService(max_concurrency=16)
+    result = await service.process_intent("alice", "I need a GPU VM")
+"""
+
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import candidates
+import fast_path
+from llm import backend_from_env
+from context_builder import build_full_prompt, cacheable_prefix_tokens, get_relevant_context
+from history import history_manager_from_env, estimate_tokens
+from metrics import RequestMetrics, fill_token_counts, get_registry
+from response_cache import ResponseCache, response_cache_from_env
+from streaming import extract_json_block
+from validator import REPAIR_ATTEMPTS, RuleSet, Violation, get_rule_set, repair_prompt
+from structured_output import structured_output_from_env
+from tfvars import TfvarsFile
+
+
+REPO_ROOT = Path(__file__).parent.parent
+PROMPTS_DIR = Path(__file__).parent / "prompts"
+
+
+@dataclass
+class Session:
+    """Conversation state for one operator."""
+    session_id: str
+    messages: list[dict] = field(default_factory=list)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    task: Optional[asyncio.Task] = None
+    # Set by cancel(), so process_intent can tell it from its caller being cancelled
+    cancel_requested: bool = False
+    last_used: float = 0.0
+
+
+@dataclass
+class IntentResult:
+    """Outcome of one process_intent() call."""
+    session_id: str
+    intent: str
+    response: str = ""
+    tfvars: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    cancelled: bool = False
+    metrics: Optional[RequestMetrics] = None
+    violations: list[Violation] = field(default_factory=list)
+    repairs: int = 0
+    fast_path: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and not self.cancelled
+
+
+def make_async_client():
+    """
+    Build the async LLM backend and model name from the environment.
+
+    Honours the same PROMPTOPS_LLM_BACKEND / PROMPTOPS_LOCAL / OPENAI_API_KEY
+    settings as app.py (see llm.py).
+    """
+    backend = backend_from_env(is_async=True)
+    return backend, backend.model
+
+
+class AsyncPromptOpsService:
+    """
+    Non-privileged infrastructure reasoning service for many concurrent sessions.
+
+    Turns within one session run in order; different sessions run concurrently,
+    up to max_concurrency LLM calls at a time.
+    """
+
+    def __init__(
+        self,
+        client=None,
+        model: Optional[str] = None,
+        terraform_dir: Optional[Path] = None,
+        max_concurrency: int = 8,
+        request_timeout: float = 60.0,
+        max_sessions: int = 1000,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+    ):
+        if client is None:
+            client, default_model = make_async_client()
+            model = model or default_model
+        self.client = client
+        self.model = model or os.getenv("PROMPTOPS_MODEL", "gpt-4o")
+        self.terraform_dir = terraform_dir or REPO_ROOT / "terraform"
+        self.request_timeout = request_timeout
+        self.max_sessions = max_sessions
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+
+        self.system_prompt = (PROMPTS_DIR / "system.txt").read_text().strip()
+        self.planning_prompt = (PROMPTS_DIR / "planning.txt").read_text().strip()
+        self.history = history_manager_from_env()
+        self.response_cache: ResponseCache = response_cache_from_env(
+            REPO_ROOT / ".promptops" / "response_cache.sqlite"
+        )
+
+        # JSON-schema constrained replies where the backend supports them
+        self.structured = structured_output_from_env(getattr(client, "supports_structured", True))
+
+        # Current values the fast path resolves against (read only)
+        self.tfvars_file = TfvarsFile(self.terraform_dir / "terraform.tfvars")
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+
+    def _session(self, session_id: str) -> Session:
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = Session(session_id=session_id)
+            self._sessions[session_id] = session
+            # Evict the least recently used idle sessions
+            for old_id in list(self._sessions):
+                if len(self._sessions) <= self.max_sessions:
+                    break
+                if not self._sessions[old_id].lock.locked():
+                    del self._sessions[old_id]
+        self._sessions.move_to_end(session_id)
+        session.last_used = time.time()
+        return session
+
+    def get_messages(self, session_id: str) -> list[dict]:
+        """Copy of a session's conversation (without the system prompt)."""
+        session = self._sessions.get(session_id)
+        return list(session.messages) if session else []
+
+    def reset(self, session_id: str):
+        """Forget a session's conversation."""
+        self._sessions.pop(session_id, None)
+
+    def cancel(self, session_id: str) -> bool:
+        """Cancel the session's in-flight request. Returns True if one was running."""
+        session = self._sessions.get(session_id)
+        if session and session.task and not session.task.done():
+            session.cancel_requested = True
+            session.task.cancel()
+            return True
+        return False
+
+    async def process_intent(self, session_id: str, intent: str) -> IntentResult:
+        """
+        Reason about one intent in the given session.
+
+        Never raises for LLM errors, timeouts or cancel(); those are reported
+        on the returned IntentResult. Cancelling the caller's own task still
+        propagates as usual.
+        """
+        session = self._session(session_id)
+        async with session.lock:
+            session.cancel_requested = False
+            session.task = asyncio.ensure_future(self._run(session, intent))
+            try:
+                return await session.task
+            except asyncio.CancelledError:
+                if not session.cancel_requested:
+                    raise
+                return IntentResult(session_id=session_id, intent=intent, cancelled=True,
+                                    error="Request cancelled")
+            finally:
+                session.task = None
+
+    async def _run(self, session: Session, intent: str) -> IntentResult:
+        result = IntentResult(session_id=session.session_id, intent=intent)
+
+        turns = session.messages + [
+            {"role": "user", "content": f"User request: {intent}"}
+        ]
+
+        fast = await asyncio.to_thread(self._fast_answer, intent)
+        if fast:
+            result.response = fast.text
+            result.tfvars = fast.proposal
+            result.fast_path = True
+            session.messages = turns + [{"role": "assistant", "content": fast.text}]
+            return result
+
+        context_start = time.perf_counter()
+        context = await asyncio.to_thread(get_relevant_context, self.terraform_dir, turns)
+        rules = await asyncio.to_thread(get_rule_set, self.terraform_dir)
+        context_build_s = time.perf_counter() - context_start
+        for attempt in range(REPAIR_ATTEMPTS + 1):
+            metrics = RequestMetrics(
+                source="async",
+                model=self.model,
+                context_build_s=context_build_s if attempt == 0 else 0.0,
+                context_tokens=context.tokens,
+                context_saved_tokens=context.saved_tokens,
+            )
+            result.metrics = metrics
+            history = self.history.compact(turns)
+            response_text = await self._complete(history, context, rules, metrics, result)
+            if response_text is None:
+                return result
+
+            extract_start = time.perf_counter()
+            tfvars = extract_json_block(response_text)
+            metrics.json_extract_s = time.perf_counter() - extract_start
+            get_registry().record(metrics)
+
+            # Only successful turns become part of the conversation
+            turns = history + [{"role": "assistant", "content": response_text}]
+            result.response = response_text
+            result.violations = rules.validate(tfvars) if tfvars else []
+            if not result.violations:
+                result.tfvars = tfvars
+                break
+            if attempt < REPAIR_ATTEMPTS:
+                # Ask the LLM to fix its proposal before anyone runs a plan
+                result.repairs += 1
+                turns.append({"role": "user", "content": repair_prompt(result.violations)})
+
+        session.messages = turns
+        return result
+
+    def _fast_answer(self, intent: str) -> Optional[fast_path.FastAnswer]:
+        return fast_path.answer(intent, self.terraform_dir, {"": self.tfvars_file.load()})
+
+    async def _complete(self, history: list[dict], context, rules: RuleSet, metrics: RequestMetrics,
+                        result: IntentResult) -> Optional[str]:
+        """One LLM call (or cache hit). Sets result.error and returns None on failure."""
+        messages, _ = build_full_prompt(
+            self.system_prompt, context.platform_context, history, planning_prompt=self.planning_prompt
+        )
+        metrics.history_tokens = sum(estimate_tokens(m["content"]) for m in history)
+        metrics.prefix_tokens = cacheable_prefix_tokens(messages)
+
+        cache_key = ResponseCache.make_key(self.model, self.temperature, messages, context.context_hash,
+                                           structured=self.structured.enabled, candidates=candidates.CANDIDATES)
+        request_start = time.perf_counter()
+        response_text = await asyncio.to_thread(self.response_cache.get, cache_key)
+        usage = None
+
+        if response_text is not None:
+            metrics.cached = True
+        else:
+            try:
+                async with self._semaphore:
+                    best, usage = await asyncio.wait_for(
+                        candidates.agenerate(
+                            self.client,
+                            self.structured,
+                            rules,
+                            model=self.model,
+                            messages=messages,
+                            temperature=self.temperature,
+                            max_tokens=self.max_tokens,
+                            timeout=self.request_timeout,
+                        ),
+                        timeout=self.request_timeout,
+                    )
+            except asyncio.TimeoutError:
+                result.error = f"LLM request timed out after {self.request_timeout:.0f}s"
+                return None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                result.error = f"Error calling LLM: {e}"
+                return None
+
+            response_text = best.text
+            await asyncio.to_thread(self.response_cache.put, cache_key, response_text)
+
+        metrics.total_s = time.perf_counter() - request_start
+        fill_token_counts(metrics, messages, response_text, usage)
+        return response_text
+
+    async def close(self):
+        """Cancel in-flight requests and close the HTTP client."""
+        for session in self._sessions.values():
+            if session.task and not session.task.done():
+                session.task.cancel()
+        close = getattr(self.client, "close", None)
+        if close:
+            await close()
@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+"""
+PromptOps Benchmarks - Offline performance checks.
+
+Nothing here calls an LLM or touches real infrastructure. Each benchmark
+builds synthetic input, times one stage of the pipeline and prints the
+results (or JSON with --json) so regressions show up in review.
+
+The pipeline benchmark runs every stage end to end - context build,
+prompt assembly, a streamed LLM call against a local stub of the OpenAI
+chat API, JSON extraction, validation and the tfvars merge - and reports
+p50/p95/p99 latency and throughput per stage.
+
+Run with:
+    python benchmark.py parser --sizes 100 1000 10000
+    python benchmark.py context --modules 10 100 500 --workers 1 8
+    python benchmark.py --json pipeline --modules 10 100 --turns 2 50 --latency 0.05
+"""
+
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+
+def generate_variables_tf(count: int) -> str:
+    """Generate a variables.tf with `count` variables in a realistic mix of shapes."""
+    blocks = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            blocks.append(f'''variable "machine_type_{i}" {{
+  description = "VM machine type. ALLOWED: n1-standard-4, n1-standard-8"
+  type        = string
+  default     = "n1-standard-4"
+
+  validation {{
+    condition     = contains(["n1-standard-4", "n1-standard-8"], var.machine_type_{i})
+    error_message = "Machine type must be n1-standard-4 or n1-standard-8."
+  }}
+}}
+''')
+        elif kind == 1:
+            blocks.append(f'''variable "disk_size_gb_{i}" {{
+  description = "Boot disk size in GB. ALLOWED: 50-200"
+  type        = number
+  default     = 100
+
+  validation {{
+    condition     = var.disk_size_gb_{i} >= 50 && var.disk_size_gb_{i} <= 200
+    error_message = "Disk size must be between 50 and 200 GB."
+  }}
+}}
+''')
+        elif kind == 2:
+            blocks.append(f'''variable "tags_{i}" {{
+  description = "Network tags for the instance"
+  type        = list(string)
+  default     = ["gpu-worker"]
+
+  validation {{
+    condition     = alltrue([for t in var.tags_{i} : length(t) > 0])
+    error_message = "Tags must not be empty."
+  }}
+}}
+''')
+        else:
+            blocks.append(f'''variable "enabled_{i}" {{
+  description = "Feature toggle"
+  type        = bool
+  default     = false
+}}
+''')
+    return "\n".join(blocks)
+
+
+def bench_parser(sizes: list[int], repeat: int = 3) -> list[dict]:
+    """Time parse_terraform_variables() on generated files of each size (best of `repeat`)."""
+    from context_builder import parse_terraform_variables
+
+    results = []
+    for size in sizes:
+        content = generate_variables_tf(size)
+        best = float("inf")
+        parsed = 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            parsed = len(parse_terraform_variables(content))
+            best = min(best, time.perf_counter() - start)
+        results.append({
+            "variables": size,
+            "parsed": parsed,
+            "bytes": len(content),
+            "seconds": round(best, 6),
+            "us_per_variable": round(best / size * 1e6, 2),
+        })
+    return results
+
+
+def generate_terraform_tree(root: Path, modules: int, variables_per_module: int = 20) -> Path:
+    """Write a synthetic terraform/ tree with root variables and `modules` module dirs."""
+    root.mkdir(parents=True, exist_ok=True)
+    (root / "variables.tf").write_text(generate_variables_tf(variables_per_module))
+    for i in range(modules):
+        module_dir = root / "modules" / f"module_{i:04d}"
+        module_dir.mkdir(parents=True, exist_ok=True)
+        (module_dir / "variables.tf").write_text(generate_variables_tf(variables_per_module))
+    return root
+
+
+def bench_context(modules: list[int], workers: list[int], executor: str = "thread") -> list[dict]:
+    """Time a cold build_platform_context() per tree size and worker count."""
+    from context_builder import build_platform_context
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in modules:
+            tree = generate_terraform_tree(Path(tmp) / f"tree_{count}", count)
+            for n in workers:
+                start = time.perf_counter()
+                result = build_platform_context(tree, workers=n, executor=executor)
+                elapsed = time.perf_counter() - start
+                results.append({
+                    "modules": count,
+                    "workers": n,
+                    "executor": executor if n > 1 else "serial",
+                    "variables": result.total_variables,
+                    "seconds": round(elapsed, 6),
+                })
+    return results
+
+
+class StubOpenAIServer:
+    """
+    Local HTTP server that mimics POST /v1/chat/completions.
+
+    Replies are deterministic (llm.mock_proposal) and padded to
+    reply_tokens. latency is the delay before the first byte and
+    tokens_per_s paces streamed chunks (0 = as fast as possible).
+    Supports stream=True (SSE, with stream_options.include_usage) and
+    plain JSON responses over keep-alive HTTP/1.1.
+    """
+
+    def __init__(self, latency: float = 0.05, tokens_per_s: float = 0.0, reply_tokens: int = 300):
+        self.latency = latency
+        self.tokens_per_s = tokens_per_s
+        self.reply_tokens = reply_tokens
+        self.requests = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def __enter__(self) -> "StubOpenAIServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reply(self, messages: list[dict]) -> str:
+        from llm import mock_proposal
+
+        explanation, proposal = mock_proposal(messages)
+        filler_words = max(0, self.reply_tokens * 4 // 6 - len(explanation) // 6)
+        filler = " ".join(["reason"] * filler_words)
+        return f"{explanation} {filler}\n\n```json\n{json.dumps(proposal, indent=2)}\n```\n"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                stub.requests += 1
+                messages = body.get("messages", [])
+                text = stub.reply(messages)
+                usage = {
+                    "prompt_tokens": sum(len(m.get("content") or "") for m in messages) // 4,
+                    "completion_tokens": len(text) // 4,
+                }
+                usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+                time.sleep(stub.latency)
+                if body.get("stream"):
+                    include_usage = (body.get("stream_options") or {}).get("include_usage")
+                    self._stream(body.get("model", "stub"), text, usage if include_usage else None)
+                else:
+                    self._complete(body.get("model", "stub"), text, usage)
+
+            def _complete(self, model: str, text: str, usage: dict):
+                time.sleep(len(text) / 4 / stub.tokens_per_s if stub.tokens_per_s else 0)
+                payload = json.dumps({
+                    "id": "chatcmpl-stub", "object": "chat.completion", "created": 0, "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": text}}],
+                    "usage": usage,
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self, model: str, text: str, usage):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                delay = 1 / stub.tokens_per_s if stub.tokens_per_s else 0
+                start = time.perf_counter()
+                for n, i in enumerate(range(0, len(text), 4), start=1):
+                    self._event({
+                        "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": 0, "model": model,
+                        "choices": [{"index": 0, "delta": {"content": text[i:i + 4]}, "finish_reason": None}],
+                    })
+                    # Pace against the schedule, not per sleep, so short sleeps don't drift
+                    if delay:
+                        time.sleep(max(0.0, start + n * delay - time.perf_counter()))
+                if usage:
+                    self._event({"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": 0,
+                                 "model": model, "choices": [], "usage": usage})
+                self._chunk(b"data: [DONE]\n\n")
+                self._chunk(b"")
+
+            def _event(self, payload: dict):
+                self._chunk(f"data: {json.dumps(payload)}\n\n".encode())
+
+            def _chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+_INTENTS = [
+    "I need a GPU VM",
+    "Make the VM cheaper",
+    "Enable access to the Streamlit app",
+    "Use a V100 GPU",
+    "Enable disk encryption",
+]
+
+
+def generate_conversation(turns: int, tokens_per_message: int = 200) -> list[dict]:
+    """A synthetic chat history of `turns` user/assistant exchanges."""
+    filler = " ".join(["context"] * (tokens_per_message * 4 // 8))
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"User request: {_INTENTS[i % len(_INTENTS)]}. {filler}"})
+        messages.append({"role": "assistant", "content": f"{filler}\n\n```json\n{{\"vm_count\": {i % 10 + 1}}}\n```"})
+    return messages
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def _stage_rows(timings: dict[str, list[float]], **labels) -> list[dict]:
+    rows = []
+    for stage, values in timings.items():
+        values = sorted(values)
+        total = sum(values)
+        rows.append({
+            **labels,
+            "stage": stage,
+            "p50_ms": round(_percentile(values, 50) * 1000, 3),
+            "p95_ms": round(_percentile(values, 95) * 1000, 3),
+            "p99_ms": round(_percentile(values, 99) * 1000, 3),
+            "ops_per_s": round(len(values) / total, 1) if total else None,
+        })
+    return rows
+
+
+def bench_pipeline(modules: list[int], turns: list[int], iterations: int = 20, latency: float = 0.05,
+                   tokens_per_s: float = 0.0, reply_tokens: int = 300) -> list[dict]:
+    """
+    Time every pipeline stage end to end against a local stub LLM server.
+
+    One row per (tree size, conversation length, stage). The end_to_end
+    stage is the sum of all stages for one request.
+    """
+    # context_builder logs at INFO; per-request HTTP logs would drown the results
+    logging.disable(logging.INFO)
+    try:
+        return _bench_pipeline(modules, turns, iterations, latency, tokens_per_s, reply_tokens)
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def _bench_pipeline(modules: list[int], turns: list[int], iterations: int, latency: float,
+                    tokens_per_s: float, reply_tokens: int) -> list[dict]:
+    from openai import OpenAI
+
+    from context_builder import ContextCache, build_full_prompt, build_platform_context
+    from history import HistoryManager
+    from llm import LLMBackend
+    from streaming import ChatStream, extract_json_block
+    from tfvars import TfvarsFile
+    from validator import RuleSet
+
+    prompts_dir = Path(__file__).parent / "prompts"
+    system_prompt = (prompts_dir / "system.txt").read_text().strip()
+    planning_prompt = (prompts_dir / "planning.txt").read_text().strip()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp, \
+            StubOpenAIServer(latency, tokens_per_s, reply_tokens) as server:
+        backend = LLMBackend("stub", "stub", OpenAI(base_url=server.base_url, api_key="stub", max_retries=0))
+        # Rules matching the stub's proposals, so validation does real work
+        rules = RuleSet.from_variables([
+            {"name": "vm_count", "type": "number", "min": 1, "max": 10},
+            {"name": "machine_type", "type": "string", "allowed": ["n1-standard-4", "n1-standard-8"]},
+            {"name": "gpu_type", "type": "string", "allowed": ["nvidia-tesla-t4"]},
+            {"name": "gpu_count", "type": "number", "min": 1, "max": 2},
+            {"name": "disk_size_gb", "type": "number", "min": 50, "max": 200},
+            {"name": "allow_streamlit", "type": "bool"},
+            {"name": "boot_disk_encrypted", "type": "bool"},
+        ])
+
+        for count in modules:
+            tree = generate_terraform_tree(Path(tmp) / f"tree_{count}", count)
+            cache = ContextCache()
+            cold_start = time.perf_counter()
+            build_platform_context(tree, cache=cache)
+            cold_s = time.perf_counter() - cold_start
+
+            for turn_count in turns:
+                history = HistoryManager()
+                conversation = generate_conversation(turn_count)
+                tfvars_file = TfvarsFile(Path(tmp) / f"tfvars_{count}_{turn_count}" / "terraform.tfvars")
+                stages = ["context", "prompt", "llm_first_token", "llm_total", "json_extract", "validate",
+                          "tfvars_merge", "end_to_end"]
+                timings: dict[str, list[float]] = {stage: [] for stage in stages}
+
+                for i in range(iterations):
+                    t0 = time.perf_counter()
+                    context = build_platform_context(tree, cache=cache)
+                    t1 = time.perf_counter()
+                    user_message = {"role": "user", "content": f"User request: {_INTENTS[i % len(_INTENTS)]}"}
+                    messages, _ = build_full_prompt(
+                        system_prompt, context.platform_context, history.compact(conversation + [user_message]),
+                        planning_prompt=planning_prompt,
+                    )
+                    t2 = time.perf_counter()
+                    stream = ChatStream(backend, include_usage=True, model="stub", messages=messages, max_tokens=2000)
+                    for _ in stream:
+                        pass
+                    t3 = time.perf_counter()
+                    tf_vars = extract_json_block(stream.text)
+                    t4 = time.perf_counter()
+                    violations = rules.validate(tf_vars or {})
+                    t5 = time.perf_counter()
+                    if tf_vars and not violations:
+                        tfvars_file.merge(tf_vars)
+                    t6 = time.perf_counter()
+
+                    timings["context"].append(t1 - t0)
+                    timings["prompt"].append(t2 - t1)
+                    timings["llm_first_token"].append(stream.first_token_s or 0.0)
+                    timings["llm_total"].append(t3 - t2)
+                    timings["json_extract"].append(t4 - t3)
+                    timings["validate"].append(t5 - t4)
+                    timings["tfvars_merge"].append(t6 - t5)
+                    timings["end_to_end"].append(t6 - t0)
+
+                prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+                results.extend(_stage_rows(
+                    timings, modules=count, turns=turn_count, prompt_tokens=prompt_tokens,
+                ))
+            results.append({"modules": count, "turns": None, "prompt_tokens": None, "stage": "context_cold",
+                            "p50_ms": round(cold_s * 1000, 3), "p95_ms": None, "p99_ms": None,
+                            "ops_per_s": None})
+        backend.close()
+    return results
+
+
+def _print_table(rows: list[dict]):
+    if not rows:
+        return
+    headers = list(rows[0].keys())
+    widths = [max(len(h), *(len(str(r[h])) for r in rows)) for h in headers]
+    print("  ".join(h.ljust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(str(row[h]).ljust(w) for h, w in zip(headers, widths)))
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="PromptOps offline benchmarks")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    p_parser = sub.add_parser("parser", help="HCL variable parser scaling")
+    p_parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    p_parser.add_argument("--repeat", type=int, default=3)
+
+    p_context = sub.add_parser("context", help="build_platform_context() on synthetic module trees")
+    p_context.add_argument("--modules", type=int, nargs="+", default=[10, 100, 500])
+    p_context.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    p_context.add_argument("--executor", choices=["thread", "process"], default="thread")
+
+    p_pipeline = sub.add_parser("pipeline", help="End-to-end pipeline against a local stub LLM server")
+    p_pipeline.add_argument("--modules", type=int, nargs="+", default=[10, 100])
+    p_pipeline.add_argument("--turns", type=int, nargs="+", default=[2, 50])
+    p_pipeline.add_argument("--iterations", type=int, default=20)
+    p_pipeline.add_argument("--latency", type=float, default=0.05, help="Stub time to first byte (seconds)")
+    p_pipeline.add_argument("--tokens-per-s", type=float, default=0.0, help="Stub generation speed (0 = instant)")
+    p_pipeline.add_argument("--reply-tokens", type=int, default=300, help="Approximate stub reply length")
+
+    args = parser.parse_args(argv)
+
+    if args.benchmark == "parser":
+        rows = bench_parser(args.sizes, args.repeat)
+    elif args.benchmark == "context":
+        rows = bench_context(args.modules, args.workers, args.executor)
+    elif args.benchmark == "pipeline":
+        rows = bench_pipeline(args.modules, args.turns, args.iterations, args.latency,
+                              args.tokens_per_s, args.reply_tokens)
+
+    if args.json:
+        print(json.dumps({"benchmark": args.benchmark, "results": rows}, indent=2))
+    else:
+        _print_table(rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
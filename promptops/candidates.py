@@ -0,0 +1,151 @@
+"""
+Candidates - Speculative multi-candidate generation.
+
+WHAT THIS FILE DOES:
+1. Asks for N completions at once: the `n` parameter where the backend
+   supports it, otherwise N concurrent calls
+2. Validates every candidate's proposal against the platform rule set
+3. Returns the first valid proposal, else the proposal with the fewest
+   violations (a reply without any proposal only if none has one)
+
+At temperature 0.7 one of several parallel samples is usually valid, so
+this trades extra tokens for one parallel wait instead of a sequence of
+repair turns. Streaming shows a single reply, so N > 1 turns it off.
+
+CONFIGURATION:
+- PROMPTOPS_CANDIDATES=1   completions per request
+"""
+
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Optional
+
+from streaming import extract_json_block
+from structured_output import StructuredOutput, render_reply
+from validator import RuleSet, Violation
+
+
+CANDIDATES = max(1, int(os.getenv("PROMPTOPS_CANDIDATES", "1")))
+
+
+@dataclass
+class Candidate:
+    """One completion and how well its proposal fits the platform."""
+    text: str
+    tfvars: Optional[dict] = None
+    violations: list[Violation] = field(default_factory=list)
+
+    @property
+    def valid(self) -> bool:
+        return self.tfvars is not None and not self.violations
+
+    def rank(self) -> tuple:
+        """
+        Lower is better: a proposal first, then the fewest violations. A
+        proposal with a violation can still be repaired; a reply without
+        one has nothing to write.
+        """
+        return (self.tfvars is None, len(self.violations))
+
+
+def evaluate(text: str, rules: RuleSet) -> Candidate:
+    tf_vars = extract_json_block(text)
+    return Candidate(text=text, tfvars=tf_vars, violations=rules.validate(tf_vars) if tf_vars else [])
+
+
+def best_candidate(candidates: list[Candidate]) -> Candidate:
+    """The first valid candidate, else the best-ranked one (earliest on ties)."""
+    for candidate in candidates:
+        if candidate.valid:
+            return candidate
+    return min(candidates, key=Candidate.rank)
+
+
+def _sum_usage(responses: list) -> Optional[SimpleNamespace]:
+    usages = [getattr(r, "usage", None) for r in responses]
+    usages = [u for u in usages if u is not None and getattr(u, "prompt_tokens", None) is not None]
+    if not usages:
+        return None
+    cached = sum(getattr(getattr(u, "prompt_tokens_details", None), "cached_tokens", None) or 0 for u in usages)
+    return SimpleNamespace(
+        prompt_tokens=sum(u.prompt_tokens for u in usages),
+        completion_tokens=sum(u.completion_tokens or 0 for u in usages),
+        prompt_tokens_details=SimpleNamespace(cached_tokens=cached),
+    )
+
+
+def generate(client, structured: StructuredOutput, rules: RuleSet, n: int = CANDIDATES, **kwargs):
+    """
+    Request n completions and pick the best. Returns (Candidate, usage).
+
+    With n == 1 this is a single call. Concurrent calls return as soon as a
+    valid candidate arrives; the rest finish in the background.
+    """
+    if n <= 1:
+        response, text = structured.create(client, rules, **kwargs)
+        return evaluate(text, rules), getattr(response, "usage", None)
+
+    if getattr(client, "supports_n", False):
+        response, _ = structured.create(client, rules, n=n, **kwargs)
+        candidates = [evaluate(render_reply(c.message.content or ""), rules) for c in response.choices]
+        return best_candidate(candidates), getattr(response, "usage", None)
+
+    candidates, responses = [], []
+    executor = ThreadPoolExecutor(max_workers=n, thread_name_prefix="candidate")
+    try:
+        futures = [executor.submit(structured.create, client, rules, **kwargs) for _ in range(n)]
+        errors = []
+        for future in as_completed(futures):
+            try:
+                response, text = future.result()
+            except Exception as e:
+                errors.append(e)
+                continue
+            responses.append(response)
+            candidates.append(evaluate(text, rules))
+            if candidates[-1].valid:
+                break
+    finally:
+        executor.shutdown(wait=False)
+
+    if not candidates:
+        raise errors[0]
+    return best_candidate(candidates), _sum_usage(responses)
+
+
+async def agenerate(client, structured: StructuredOutput, rules: RuleSet, n: int = CANDIDATES, **kwargs):
+    """Async generate(): pending calls are cancelled once a valid candidate arrives."""
+    if n <= 1:
+        response, text = await structured.acreate(client, rules, **kwargs)
+        return evaluate(text, rules), getattr(response, "usage", None)
+
+    if getattr(client, "supports_n", False):
+        response, _ = await structured.acreate(client, rules, n=n, **kwargs)
+        candidates = [evaluate(render_reply(c.message.content or ""), rules) for c in response.choices]
+        return best_candidate(candidates), getattr(response, "usage", None)
+
+    tasks = [asyncio.ensure_future(structured.acreate(client, rules, **kwargs)) for _ in range(n)]
+    candidates, responses, errors = [], [], []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                response, text = await next_done
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                errors.append(e)
+                continue
+            responses.append(response)
+            candidates.append(evaluate(text, rules))
+            if candidates[-1].valid:
+                break
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if not candidates:
+        raise errors[0]
+    return best_candidate(candidates), _sum_usage(responses)
@@ -26,19 +26,48 @@ WHAT IS NOT SENT:
 
 The LLM has NO background access to your environment.
 PromptOps explicitly copies text from the files listed above into the prompt.
+
+For large module catalogs, get_relevant_context() sends only the variables
+relevant to the current request (ranked by the BM25 index in relevance.py)
+and falls back to the full context whenever it cannot tell what is needed.
 """
 
 import os
 import re
+import json
+import hashlib
 import logging
+import threading
 from pathlib import Path
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, asdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from typing import Optional
 
+from hcl import IDENT, NUMBER, PUNCT, HCLSyntaxError, Token, iter_blocks
+from history import estimate_tokens
+from relevance import BM25Index, intent_query, module_document, variable_document
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("promptops.context_builder")
 
+# Parallel module scanning - opt-in for large module trees on slow filesystems.
+# PROMPTOPS_CONTEXT_WORKERS=8 reads/parses up to 8 modules at once;
+# PROMPTOPS_CONTEXT_EXECUTOR=process uses processes instead of threads.
+CONTEXT_WORKERS = int(os.getenv("PROMPTOPS_CONTEXT_WORKERS", "1"))
+CONTEXT_EXECUTOR = os.getenv("PROMPTOPS_CONTEXT_EXECUTOR", "thread").lower()
+
+# Relevance pruning - only for catalogs whose full context is at least
+# PROMPTOPS_CONTEXT_PRUNE_MIN_TOKENS; smaller ones are always sent whole so the
+# prompt prefix stays byte-stable and provider-cacheable.
+# PROMPTOPS_CONTEXT_TOP_K=12 variables per request (0 disables pruning);
+# PROMPTOPS_CONTEXT_MANDATORY=vm_count,machine_type are always included.
+CONTEXT_TOP_K = int(os.getenv("PROMPTOPS_CONTEXT_TOP_K", "12"))
+CONTEXT_PRUNE_MIN_TOKENS = int(os.getenv("PROMPTOPS_CONTEXT_PRUNE_MIN_TOKENS", "1500"))
+CONTEXT_MANDATORY = frozenset(
+    name.strip() for name in os.getenv("PROMPTOPS_CONTEXT_MANDATORY", "").split(",") if name.strip()
+)
+
 
 @dataclass
 class FileReadRecord:
@@ -47,6 +76,8 @@ class FileReadRecord:
     exists: bool
     bytes_read: int = 0
     variables_extracted: int = 0
+    # Why the file was skipped, if it could not be parsed
+    error: str = ""
 
 
 @dataclass
@@ -56,17 +87,65 @@ class ContextBuildResult:
     files_read: list[FileReadRecord] = field(default_factory=list)
     total_bytes: int = 0
     total_variables: int = 0
+    context_hash: str = ""
 
     def summary(self) -> str:
         """Human-readable summary of what was read."""
         lines = ["Files read by PromptOps:"]
         for f in self.files_read:
-            status = "OK" if f.exists else "NOT FOUND"
+            status = f"SKIPPED: {f.error}" if f.error else "OK" if f.exists else "NOT FOUND"
             lines.append(f"  - {f.path} [{status}] ({f.bytes_read} bytes, {f.variables_extracted} vars)")
         lines.append(f"Total: {self.total_bytes} bytes, {self.total_variables} variables extracted")
         return "\n".join(lines)
 
 
+@dataclass
+class RelevantContext:
+    """Platform context for one request, possibly pruned to the relevant variables."""
+    platform_context: str
+    context_hash: str
+    full_tokens: int
+    tokens: int
+    pruned: bool = False
+    variables: list[str] = field(default_factory=list)
+    reason: str = ""
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.full_tokens - self.tokens
+
+
+def _validation_constraints(condition: list[Token], var_info: dict):
+    """Pull contains([...]) lists and var.x >= N / var.x <= N bounds out of a condition."""
+    values = [t.value for t in condition]
+    for i, tok in enumerate(condition):
+        if (
+            "allowed" not in var_info
+            and tok.kind == IDENT and tok.value == "contains"
+            and values[i + 1:i + 3] == ["(", "["]
+        ):
+            allowed = []
+            for item in condition[i + 3:]:
+                if item.kind == PUNCT and item.value == "]":
+                    break
+                if item.kind != PUNCT:
+                    allowed.append(item.value)
+            var_info["allowed"] = allowed
+
+        # var . name (>=|<=) NUMBER
+        if (
+            tok.kind == IDENT and tok.value == "var"
+            and i + 4 < len(condition)
+            and values[i + 1] == "."
+            and condition[i + 2].kind == IDENT
+            and condition[i + 4].kind == NUMBER
+        ):
+            op = values[i + 3]
+            key = "min" if op == ">=" else "max" if op == "<=" else None
+            if key and key not in var_info:
+                var_info[key] = int(float(values[i + 4]))
+
+
 def parse_terraform_variables(content: str) -> list[dict]:
     """
     Parse a Terraform variables.tf file and extract variable metadata.
@@ -83,48 +162,44 @@ def parse_terraform_variables(content: str) -> list[dict]:
     - Actual variable values
     - Sensitive defaults
     - Comments with secrets
+
+    Runs in a single linear pass over the file using the streaming HCL
+    lexer in hcl.py, so nested blocks at any depth are handled.
     """
     variables = []
 
-    # Match variable blocks
-    var_pattern = r'variable\s+"(\w+)"\s*\{([^}]+(?:\{[^}]*\}[^}]*)*)\}'
+    for block in iter_blocks(content):
+        if block.type != "variable" or len(block.labels) != 1:
+            continue
 
-    for match in re.finditer(var_pattern, content, re.DOTALL):
-        var_name = match.group(1)
-        var_body = match.group(2)
-
-        var_info = {"name": var_name}
+        var_info = {"name": block.labels[0]}
+        attrs = block.attributes
 
         # Extract description
-        desc_match = re.search(r'description\s*=\s*"([^"]*)"', var_body)
-        if desc_match:
-            var_info["description"] = desc_match.group(1)
-
-        # Extract type
-        type_match = re.search(r'type\s*=\s*(\w+)', var_body)
-        if type_match:
-            var_info["type"] = type_match.group(1)
-
-        # Extract default (but NOT for sensitive types)
-        if "sensitive" not in var_body.lower():
-            default_match = re.search(r'default\s*=\s*("?[^"\n]*"?|\d+|true|false|\[.*?\])', var_body, re.DOTALL)
-            if default_match:
-                var_info["default"] = default_match.group(1).strip('"')
-
-        # Extract allowed values from validation condition
-        validation_match = re.search(r'condition\s*=\s*contains\(\[(.*?)\]', var_body)
-        if validation_match:
-            allowed = validation_match.group(1)
-            allowed = [v.strip().strip('"') for v in allowed.split(',')]
-            var_info["allowed"] = allowed
-
-        # Extract min/max from validation
-        min_match = re.search(r'var\.\w+\s*>=\s*(\d+)', var_body)
-        max_match = re.search(r'var\.\w+\s*<=\s*(\d+)', var_body)
-        if min_match:
-            var_info["min"] = int(min_match.group(1))
-        if max_match:
-            var_info["max"] = int(max_match.group(1))
+        if "description" in attrs:
+            description = attrs["description"].string_value()
+            if description is not None:
+                var_info["description"] = description
+
+        # Extract type (outer keyword only, e.g. list(string) -> list)
+        if "type" in attrs and attrs["type"].tokens and attrs["type"].tokens[0].kind == IDENT:
+            var_info["type"] = attrs["type"].tokens[0].value
+
+        if "sensitive" in attrs and [t.value for t in attrs["sensitive"].tokens] == ["true"]:
+            var_info["sensitive"] = True
+
+        # Extract default (but NOT for sensitive variables)
+        if "sensitive" not in attrs and "default" in attrs and attrs["default"].tokens:
+            default = attrs["default"]
+            value = default.string_value()
+            if value is None:
+                value = content[default.tokens[0].start:default.tokens[-1].end]
+            var_info["default"] = value
+
+        # Extract allowed values and min/max from validation conditions
+        for validation in block.child_blocks("validation"):
+            if "condition" in validation.attributes:
+                _validation_constraints(validation.attributes["condition"].tokens, var_info)
 
         # Extract ALLOWED hint from description
         allowed_in_desc = re.search(r'ALLOWED:\s*([^.]+)', var_info.get("description", ""))
@@ -136,7 +211,276 @@ def parse_terraform_variables(content: str) -> list[dict]:
     return variables
 
 
-def build_platform_context(terraform_dir: Path) -> ContextBuildResult:
+def _load_variables_file(path: str, known_sha256: Optional[str] = None) -> Optional[dict]:
+    """
+    Read, hash and parse one variables.tf.
+
+    Module-level (picklable) so it can run in a thread or process pool.
+    Parsing is skipped when the content hash equals known_sha256.
+    Returns None if the file does not exist. A file that is not valid HCL
+    contributes no variables; the parse error is returned under "error".
+    """
+    try:
+        stat = os.stat(path)
+        with open(path, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return None
+
+    digest = hashlib.sha256(raw).hexdigest()
+    variables, error = [], ""
+    if digest != known_sha256:
+        try:
+            variables = parse_terraform_variables(raw.decode('utf-8'))
+        except (HCLSyntaxError, UnicodeDecodeError) as e:
+            error = str(e)
+            logger.warning(f"Skipping {path}: {error}")
+    return {
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha256": digest,
+        "bytes_read": len(raw),
+        "variables": variables,
+        "error": error,
+    }
+
+
+def _cached_file(loaded: dict, render) -> "_CachedFile":
+    """Cache entry for a loaded file; a file that failed to parse renders no section."""
+    return _CachedFile(section=[] if loaded["error"] else render(loaded["variables"]), **loaded)
+
+
+@dataclass
+class _CachedFile:
+    """Parsed state of one variables.tf file, keyed by mtime and content hash."""
+    mtime_ns: int
+    size: int
+    sha256: str
+    bytes_read: int
+    variables: list[dict]
+    section: list[str]
+    error: str = ""
+
+
+class ContextCache:
+    """
+    Incremental cache for build_platform_context().
+
+    Each variables.tf is keyed by its path, mtime and SHA-256 of its content.
+    On every build the files are stat()ed (cheap); only files whose mtime or
+    size moved are re-read, and only files whose hash actually changed are
+    re-parsed and re-rendered. If no file changed at all, the previous
+    ContextBuildResult is returned as-is.
+
+    Optionally persisted to a JSON file so a fresh process starts warm.
+    """
+
+    def __init__(self, cache_path: Optional[Path] = None):
+        self.cache_path = Path(cache_path) if cache_path else None
+        self._files: dict[str, _CachedFile] = {}
+        self._results: dict[str, tuple[tuple, ContextBuildResult]] = {}
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.cache_path:
+            self._load()
+
+    def _load(self):
+        try:
+            data = json.loads(self.cache_path.read_text())
+            self._files = {path: _CachedFile(**entry) for path, entry in data.items()}
+        except (OSError, ValueError, TypeError):
+            self._files = {}
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.cache_path.with_suffix(self.cache_path.suffix + ".tmp")
+            tmp.write_text(json.dumps({path: asdict(entry) for path, entry in self._files.items()}))
+            os.replace(tmp, self.cache_path)
+        except OSError as e:
+            logger.warning(f"Could not persist context cache: {e}")
+
+    def lookup(self, path: Path) -> Optional[_CachedFile]:
+        """Return the cached entry if path's mtime and size are unchanged (stat only)."""
+        key = str(path)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            self._files.pop(key, None)
+            return None
+
+        entry = self._files.get(key)
+        if entry and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+            with self._stats_lock:
+                self.hits += 1
+            return entry
+        return None
+
+    def known_sha256(self, path: Path) -> Optional[str]:
+        entry = self._files.get(str(path))
+        return entry.sha256 if entry else None
+
+    def store(self, path: Path, loaded: dict, render) -> _CachedFile:
+        """Record a freshly loaded file, reusing the previous parse if the hash matches."""
+        key = str(path)
+        entry = self._files.get(key)
+        if entry and entry.sha256 == loaded["sha256"]:
+            # Touched but not modified: keep the parse, refresh the key
+            entry.mtime_ns, entry.size = loaded["mtime_ns"], loaded["size"]
+            with self._stats_lock:
+                self.hits += 1
+            return entry
+
+        with self._stats_lock:
+            self.misses += 1
+        entry = _cached_file(loaded, render)
+        self._files[key] = entry
+        return entry
+
+    def get(self, path: Path, render) -> Optional[_CachedFile]:
+        """
+        Return the cached entry for path, re-parsing only if it changed.
+
+        render(variables) -> list[str] builds the context section for the file.
+        Returns None if the file does not exist.
+        """
+        entry = self.lookup(path)
+        if entry:
+            return entry
+        loaded = _load_variables_file(str(path), self.known_sha256(path))
+        if loaded is None:
+            self._files.pop(str(path), None)
+            return None
+        return self.store(path, loaded, render)
+
+    def clear(self):
+        """Drop every cached entry."""
+        with self._lock:
+            self._files.clear()
+            self._results.clear()
+
+
+_CONTEXT_HEADER = [
+    "# PLATFORM CONSTRAINTS",
+    "# These constraints were read from local Terraform files.",
+    "# The LLM can ONLY set these variables. Terraform enforces all constraints.",
+    "",
+]
+
+_CONTEXT_FOOTER = [
+    "## What You CANNOT Do",
+    "- Use machine types other than n1-standard-4 or n1-standard-8",
+    "- Use GPU types other than nvidia-tesla-t4",
+    "- Set disk size outside 50-200 GB range",
+    "- Expose arbitrary ports (only SSH 22 and Streamlit 8501)",
+    "- Create resources outside these modules",
+    "",
+]
+
+
+def _render_root_section(root_variables: list[dict]) -> list[str]:
+    """Format root variables as the 'Available Variables' context section."""
+    lines = ["## Available Variables", ""]
+
+    for var in root_variables:
+        line = f"- **{var['name']}**"
+        if var.get("type"):
+            line += f" ({var['type']})"
+        if var.get("description"):
+            line += f": {var['description']}"
+        if var.get("allowed"):
+            line += f" [ALLOWED: {', '.join(var['allowed'])}]"
+        if var.get("allowed_hint"):
+            line += f" [ALLOWED: {var['allowed_hint']}]"
+        if var.get("min") is not None and var.get("max") is not None:
+            line += f" [RANGE: {var['min']}-{var['max']}]"
+        if var.get("default"):
+            line += f" (default: {var['default']})"
+        lines.append(line)
+
+    lines.append("")
+    return lines
+
+
+def _render_module_section(module_name: str, module_vars: list[dict]) -> list[str]:
+    """Format a module's constrained variables. Empty if nothing is constrained."""
+    # Only include variables with constraints
+    constrained = [v for v in module_vars if v.get("allowed") or v.get("min") is not None]
+    if not constrained:
+        return []
+
+    lines = [f"### {module_name}"]
+    for var in constrained:
+        if var.get("allowed"):
+            lines.append(f"- {var['name']}: only {', '.join(var['allowed'])}")
+        elif var.get("min") is not None:
+            lines.append(f"- {var['name']}: {var.get('min', 0)}-{var.get('max', '∞')}")
+    lines.append("")
+    return lines
+
+
+def _read_variables_file(path: Path, render, cache: Optional[ContextCache]):
+    """Read and parse one variables.tf, through the cache when given one."""
+    if cache is not None:
+        return cache.get(path, render)
+    loaded = _load_variables_file(str(path))
+    if loaded is None:
+        return None
+    return _cached_file(loaded, render)
+
+
+def _read_variables_files(paths: list[Path], renders: list, cache: Optional[ContextCache],
+                          workers: int, executor: str) -> list[Optional[_CachedFile]]:
+    """
+    Read and parse several variables.tf files, concurrently if workers > 1.
+
+    Results are returned in the order of paths regardless of completion order.
+    Cache freshness checks (stat only) stay on the calling thread; only the
+    read + hash + parse of changed files is farmed out to the pool.
+    """
+    if workers <= 1 or len(paths) <= 1:
+        return [_read_variables_file(p, r, cache) for p, r in zip(paths, renders)]
+
+    entries: list[Optional[_CachedFile]] = [None] * len(paths)
+    pending = []
+    for i, path in enumerate(paths):
+        entry = cache.lookup(path) if cache is not None else None
+        if entry:
+            entries[i] = entry
+        else:
+            pending.append(i)
+
+    if not pending:
+        return entries
+
+    pool_cls = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+    with pool_cls(max_workers=min(workers, len(pending))) as pool:
+        loaded = pool.map(
+            _load_variables_file,
+            [str(paths[i]) for i in pending],
+            [cache.known_sha256(paths[i]) if cache is not None else None for i in pending],
+        )
+        for i, data in zip(pending, loaded):
+            if data is None:
+                continue
+            if cache is not None:
+                entries[i] = cache.store(paths[i], data, renders[i])
+            else:
+                entries[i] = _cached_file(data, renders[i])
+
+    return entries
+
+
+def build_platform_context(
+    terraform_dir: Path,
+    cache: Optional[ContextCache] = None,
+    workers: Optional[int] = None,
+    executor: Optional[str] = None,
+) -> ContextBuildResult:
     """
     Build the platform context by reading ONLY these files:
     - terraform/variables.tf
@@ -146,48 +490,46 @@ def build_platform_context(terraform_dir: Path) -> ContextBuildResult:
     - The formatted context string
     - Audit trail of every file read
     - Byte counts and variable counts
+
+    With a ContextCache, unchanged files are not re-read or re-parsed and an
+    unchanged tree returns the previous result.
+
+    With workers > 1, module variables.tf files are read and parsed
+    concurrently in a "thread" (default) or "process" pool. Output order is
+    the same as the serial scan. Defaults come from PROMPTOPS_CONTEXT_WORKERS
+    and PROMPTOPS_CONTEXT_EXECUTOR.
     """
+    workers = CONTEXT_WORKERS if workers is None else workers
+    executor = CONTEXT_EXECUTOR if executor is None else executor
+    if cache is not None:
+        with cache._lock:
+            return _build_platform_context(terraform_dir, cache, workers, executor)
+    return _build_platform_context(terraform_dir, None, workers, executor)
+
+
+def _build_platform_context(terraform_dir: Path, cache: Optional[ContextCache],
+                            workers: int, executor: str) -> ContextBuildResult:
     modules_dir = terraform_dir / "modules"
     root_vars = terraform_dir / "variables.tf"
 
     result = ContextBuildResult(platform_context="", files_read=[], total_bytes=0, total_variables=0)
     context_parts = []
+    fingerprint = []
 
-    context_parts.append("# PLATFORM CONSTRAINTS")
-    context_parts.append("# These constraints were read from local Terraform files.")
-    context_parts.append("# The LLM can ONLY set these variables. Terraform enforces all constraints.")
-    context_parts.append("")
+    context_parts.extend(_CONTEXT_HEADER)
 
     # Read root variables
-    file_record = FileReadRecord(path=str(root_vars), exists=root_vars.exists())
-    if root_vars.exists():
-        root_content = root_vars.read_text()
-        file_record.bytes_read = len(root_content.encode('utf-8'))
-        root_variables = parse_terraform_variables(root_content)
-        file_record.variables_extracted = len(root_variables)
+    file_record = FileReadRecord(path=str(root_vars), exists=False)
+    entry = _read_variables_file(root_vars, _render_root_section, cache)
+    if entry:
+        file_record.exists = True
+        file_record.bytes_read = entry.bytes_read
+        file_record.variables_extracted = len(entry.variables)
+        file_record.error = entry.error
         result.total_bytes += file_record.bytes_read
         result.total_variables += file_record.variables_extracted
-
-        context_parts.append("## Available Variables")
-        context_parts.append("")
-
-        for var in root_variables:
-            line = f"- **{var['name']}**"
-            if var.get("type"):
-                line += f" ({var['type']})"
-            if var.get("description"):
-                line += f": {var['description']}"
-            if var.get("allowed"):
-                line += f" [ALLOWED: {', '.join(var['allowed'])}]"
-            if var.get("allowed_hint"):
-                line += f" [ALLOWED: {var['allowed_hint']}]"
-            if var.get("min") is not None and var.get("max") is not None:
-                line += f" [RANGE: {var['min']}-{var['max']}]"
-            if var.get("default"):
-                line += f" (default: {var['default']})"
-            context_parts.append(line)
-
-        context_parts.append("")
+        context_parts.extend(entry.section)
+        fingerprint.append((str(root_vars), entry.sha256))
 
     result.files_read.append(file_record)
 
@@ -196,50 +538,85 @@ def build_platform_context(terraform_dir: Path) -> ContextBuildResult:
         context_parts.append("## Module Constraints (enforced by Terraform)")
         context_parts.append("")
 
-        for module_dir in sorted(modules_dir.iterdir()):
-            if module_dir.is_dir():
-                vars_file = module_dir / "variables.tf"
-                file_record = FileReadRecord(path=str(vars_file), exists=vars_file.exists())
-
-                if vars_file.exists():
-                    module_content = vars_file.read_text()
-                    file_record.bytes_read = len(module_content.encode('utf-8'))
-                    module_vars = parse_terraform_variables(module_content)
-                    file_record.variables_extracted = len(module_vars)
-                    result.total_bytes += file_record.bytes_read
-                    result.total_variables += file_record.variables_extracted
-
-                    # Only include variables with constraints
-                    constrained = [v for v in module_vars if v.get("allowed") or v.get("min") is not None]
-
-                    if constrained:
-                        context_parts.append(f"### {module_dir.name}")
-                        for var in constrained:
-                            if var.get("allowed"):
-                                context_parts.append(f"- {var['name']}: only {', '.join(var['allowed'])}")
-                            elif var.get("min") is not None:
-                                context_parts.append(f"- {var['name']}: {var.get('min', 0)}-{var.get('max', '∞')}")
-                        context_parts.append("")
-
-                result.files_read.append(file_record)
-
-    context_parts.append("## What You CANNOT Do")
-    context_parts.append("- Use machine types other than n1-standard-4 or n1-standard-8")
-    context_parts.append("- Use GPU types other than nvidia-tesla-t4")
-    context_parts.append("- Set disk size outside 50-200 GB range")
-    context_parts.append("- Expose arbitrary ports (only SSH 22 and Streamlit 8501)")
-    context_parts.append("- Create resources outside these modules")
-    context_parts.append("")
+        module_dirs = [d for d in sorted(modules_dir.iterdir()) if d.is_dir()]
+        vars_files = [d / "variables.tf" for d in module_dirs]
+        renders = [
+            lambda variables, name=d.name: _render_module_section(name, variables)
+            for d in module_dirs
+        ]
+
+        for vars_file, entry in zip(vars_files, _read_variables_files(vars_files, renders, cache, workers, executor)):
+            file_record = FileReadRecord(path=str(vars_file), exists=False)
+
+            if entry:
+                file_record.exists = True
+                file_record.bytes_read = entry.bytes_read
+                file_record.variables_extracted = len(entry.variables)
+                file_record.error = entry.error
+                result.total_bytes += file_record.bytes_read
+                result.total_variables += file_record.variables_extracted
+                context_parts.extend(entry.section)
+                fingerprint.append((str(vars_file), entry.sha256))
+            else:
+                fingerprint.append((str(vars_file), None))
+
+            result.files_read.append(file_record)
+
+    context_parts.extend(_CONTEXT_FOOTER)
 
     result.platform_context = "\n".join(context_parts)
+    result.context_hash = hashlib.sha256(result.platform_context.encode('utf-8')).hexdigest()
+
+    if cache is not None:
+        fingerprint = tuple(fingerprint)
+        previous = cache._results.get(str(terraform_dir))
+        if previous and previous[0] == fingerprint:
+            return previous[1]
+        cache._results[str(terraform_dir)] = (fingerprint, result)
+        cache._save()
+
     return result
 
 
+def _stable_text(text: str) -> str:
+    """Normalise line endings and trailing whitespace so equal content is equal bytes."""
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def build_static_prefix(system_prompt: str, platform_context: str, planning_prompt: str = "") -> str:
+    """
+    The part of the prompt that is identical on every turn.
+
+    Order is fixed: system prompt, platform context, planning instructions.
+    The platform context goes where the {PLATFORM_CONTEXT} placeholder is,
+    or straight after the system prompt if there is none. Line endings and
+    trailing whitespace are normalised, so the CLI, web UI and async service
+    all send the same bytes for the same files.
+    """
+    system = _stable_text(system_prompt)
+    context = _stable_text(platform_context)
+    if "{PLATFORM_CONTEXT}" in system:
+        parts = [system.replace("{PLATFORM_CONTEXT}", context).strip()]
+    else:
+        parts = [system, context]
+    parts.append(_stable_text(planning_prompt))
+    return "\n\n".join(part for part in parts if part)
+
+
+def cacheable_prefix_tokens(messages: list[dict]) -> int:
+    """Estimated tokens in the static system message that starts every prompt."""
+    if not messages or messages[0]["role"] != "system":
+        return 0
+    return estimate_tokens(messages[0]["content"])
+
+
 def build_full_prompt(
     system_prompt: str,
     platform_context: str,
     user_messages: list[dict],
-    debug: bool = False
+    debug: bool = False,
+    planning_prompt: str = "",
 ) -> tuple[list[dict], Optional[str]]:
     """
     Assemble the final prompt that will be sent to the LLM.
@@ -249,14 +626,19 @@ def build_full_prompt(
         platform_context: Generated platform constraints
         user_messages: List of {"role": "user/assistant", "content": "..."} dicts
         debug: If True, return debug info
+        planning_prompt: Planning instructions, sent once after the platform context
 
     Returns:
         Tuple of (messages list for API, debug_output string or None)
 
     This function makes explicit exactly what is sent to the LLM.
+
+    The first message is a byte-stable static prefix (see build_static_prefix);
+    everything that changes per turn - history summaries, user requests,
+    replies - comes after it. Providers cache prompt prefixes, so the prefix
+    is only billed and processed in full on the first request.
     """
-    # Inject platform context into system prompt
-    final_system = system_prompt.replace("{PLATFORM_CONTEXT}", platform_context)
+    final_system = build_static_prefix(system_prompt, platform_context, planning_prompt)
 
     # Build messages array
     messages = [
@@ -266,12 +648,14 @@ def build_full_prompt(
 
     debug_output = None
     if debug:
+        prefix_hash = hashlib.sha256(final_system.encode("utf-8")).hexdigest()[:12]
         debug_lines = [
             "=" * 60,
             "PROMPTOPS DEBUG: EXACT PROMPT SENT TO LLM",
             "=" * 60,
             "",
-            "--- SYSTEM PROMPT ---",
+            f"--- SYSTEM PROMPT (static prefix: {len(final_system)} chars, "
+            f"~{cacheable_prefix_tokens(messages)} tokens, sha256 {prefix_hash}) ---",
             final_system,
             "",
             "--- USER MESSAGES ---",
@@ -284,6 +668,16 @@ def build_full_prompt(
     return messages, debug_output
 
 
+# Process-wide cache shared by get_full_context() and get_context_with_audit().
+# Set PROMPTOPS_CONTEXT_CACHE=/path/to/cache.json to persist it across restarts.
+_context_cache = ContextCache(os.getenv("PROMPTOPS_CONTEXT_CACHE") or None)
+
+
+def get_context_cache() -> ContextCache:
+    """Return the process-wide platform context cache."""
+    return _context_cache
+
+
 def get_full_context(terraform_dir: Path) -> str:
     """
     Get the platform context string for injection into LLM prompt.
@@ -291,7 +685,7 @@ def get_full_context(terraform_dir: Path) -> str:
     This is the simple interface used by web.py.
     For detailed audit info, use build_platform_context() directly.
     """
-    result = build_platform_context(terraform_dir)
+    result = build_platform_context(terraform_dir, cache=_context_cache)
 
     # Log what was read if debug is enabled
     if os.getenv("PROMPTOPS_DEBUG_CONTEXT", "").lower() == "true":
@@ -305,8 +699,160 @@ def get_context_with_audit(terraform_dir: Path) -> ContextBuildResult:
     Get the platform context with full audit trail.
 
     Use this when you need to show users exactly what files were read.
+    Results come from the process-wide cache, so an edited variables.tf is
+    picked up on the next call without a restart.
+    """
+    return build_platform_context(terraform_dir, cache=_context_cache)
+
+
+def get_variable_metadata(terraform_dir: Path) -> tuple[list[dict], dict[str, list[dict]]]:
+    """
+    Parsed variable metadata as (root variables, {module name: variables}).
+
+    Served from the process-wide cache, so files are only re-parsed when
+    they change. Used by validator.py to compile its rule set.
+    """
+    modules = {}
+    with _context_cache._lock:
+        root = _read_variables_file(terraform_dir / "variables.tf", _render_root_section, _context_cache)
+        modules_dir = terraform_dir / "modules"
+        if modules_dir.exists():
+            for d in sorted(modules_dir.iterdir()):
+                if not d.is_dir():
+                    continue
+                entry = _read_variables_file(
+                    d / "variables.tf",
+                    lambda variables, name=d.name: _render_module_section(name, variables),
+                    _context_cache,
+                )
+                if entry:
+                    modules[d.name] = entry.variables
+    return (root.variables if root else []), modules
+
+
+_indexes: dict[str, tuple[str, BM25Index]] = {}
+_indexes_lock = threading.Lock()
+
+
+def _variable_index(terraform_dir: Path, context_hash: str, root_variables: list[dict],
+                    module_variables: dict[str, list[dict]]) -> BM25Index:
+    """BM25 index over root variables and modules, rebuilt only when the context changes."""
+    key = str(terraform_dir)
+    with _indexes_lock:
+        cached = _indexes.get(key)
+        if cached and cached[0] == context_hash:
+            return cached[1]
+
+        used_by: dict[str, list[str]] = {}
+        for module, variables in module_variables.items():
+            for var in variables:
+                used_by.setdefault(var["name"], []).append(module)
+
+        documents = {
+            f"var:{var['name']}": variable_document(var, used_by.get(var["name"], ()))
+            for var in root_variables
+        }
+        for module, variables in module_variables.items():
+            documents[f"module:{module}"] = module_document(module, variables)
+
+        index = BM25Index(documents)
+        _indexes[key] = (context_hash, index)
+        return index
+
+
+def get_relevant_context(
+    terraform_dir: Path,
+    messages: list[dict],
+    top_k: Optional[int] = None,
+    min_tokens: Optional[int] = None,
+) -> RelevantContext:
+    """
+    Platform context for one request: only the variables it needs.
+
+    Ranks root variables (by name, description, allowed values and the
+    modules that use them) against the conversation - see
+    relevance.intent_query - and keeps the top_k variables, the mandatory
+    ones (PROMPTOPS_CONTEXT_MANDATORY) and any variable named verbatim.
+    Module constraint sections are limited to those variables and to the
+    top_k most relevant modules. The header and the "What You CANNOT Do"
+    rules are always included.
+
+    Falls back to the full context when pruning is disabled, the full
+    context is under min_tokens, nothing matches the request, or pruning
+    would not save anything. Validation still uses every variable, so a
+    pruned prompt never makes a valid proposal fail.
     """
-    return build_platform_context(terraform_dir)
+    top_k = CONTEXT_TOP_K if top_k is None else top_k
+    min_tokens = CONTEXT_PRUNE_MIN_TOKENS if min_tokens is None else min_tokens
+
+    full = get_context_with_audit(terraform_dir)
+    full_tokens = estimate_tokens(full.platform_context)
+    result = RelevantContext(
+        platform_context=full.platform_context,
+        context_hash=full.context_hash,
+        full_tokens=full_tokens,
+        tokens=full_tokens,
+    )
+    if top_k <= 0:
+        result.reason = "pruning disabled"
+        return result
+    if full_tokens < min_tokens:
+        result.reason = f"full context under {min_tokens} tokens"
+        return result
+
+    root_variables, module_variables = get_variable_metadata(terraform_dir)
+    index = _variable_index(terraform_dir, full.context_hash, root_variables, module_variables)
+    query = intent_query(messages)
+    scores = index.scores(query)
+    ranked = [key for key in index.keys if key in scores]
+    ranked.sort(key=lambda key: -scores[key])
+
+    root_names = {var["name"] for var in root_variables}
+    selected = {key[len("var:"):] for key in ranked if key.startswith("var:")}
+    selected = set(sorted(selected, key=lambda name: -scores[f"var:{name}"])[:top_k])
+    selected |= (CONTEXT_MANDATORY | set(re.findall(r"\w+", query))) & root_names
+    shown = [var for var in root_variables if var["name"] in selected]
+    if not shown:
+        result.reason = "no variable matches the request"
+        return result
+
+    # Constraint sections of the most relevant modules that constrain a shown variable
+    modules = [
+        module for module in sorted(module_variables, key=lambda m: -scores.get(f"module:{m}", 0.0))
+        if any(var["name"] in selected for var in module_variables[module])
+    ][:top_k]
+
+    parts = list(_CONTEXT_HEADER)
+    parts.append(f"# Only the {len(shown)} of {len(root_variables)} variables relevant to this request are listed.")
+    parts.append("# If the request needs a variable that is not listed, say so instead of guessing.")
+    parts.append("")
+    parts.extend(_render_root_section(shown))
+    module_lines = []
+    for module in sorted(modules):
+        variables = [var for var in module_variables[module] if var["name"] in selected]
+        module_lines.extend(_render_module_section(module, variables))
+    if module_lines:
+        parts.append("## Module Constraints (enforced by Terraform)")
+        parts.append("")
+        parts.extend(module_lines)
+    parts.extend(_CONTEXT_FOOTER)
+
+    platform_context = "\n".join(parts)
+    tokens = estimate_tokens(platform_context)
+    if tokens >= full_tokens:
+        result.reason = "pruning would not save tokens"
+        return result
+
+    logger.debug(f"Context pruned to {len(shown)} variables: {full_tokens} -> {tokens} tokens")
+    return RelevantContext(
+        platform_context=platform_context,
+        context_hash=full.context_hash,
+        full_tokens=full_tokens,
+        tokens=tokens,
+        pruned=True,
+        variables=[var["name"] for var in shown],
+        reason=f"top {top_k} of {len(root_variables)} variables",
+    )
 
 
 if __name__ == "__main__":
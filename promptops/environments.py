@@ -0,0 +1,210 @@
+"""
+Environments - One intent rolled out to several environments.
+
+WHAT THIS FILE DOES:
+1. Finds the environments: terraform/environments/<name>/terraform.tfvars,
+   each layered over the shared terraform/terraform.tfvars
+2. Asks for them all in ONE LLM call: the reply is either a flat ```json
+   block (same values everywhere) or an object keyed by environment name
+   (plus an optional "all" entry) when they should differ
+3. Validates and merges the per-environment proposals concurrently; a
+   violation in any environment becomes one combined repair turn
+4. Builds the variable matrix for the web UI: which variables differ
+   between environments
+
+Nothing here runs Terraform, so the reasoning side (app.py) can import
+it. Planning the environments is in fanout.py, which only web.py uses.
+
+CONFIGURATION:
+- PROMPTOPS_ENVIRONMENTS=dev,staging,prod   default: the directories under terraform/environments/
+- PROMPTOPS_FANOUT_WORKERS=4     environments validated (and planned, fanout.py) at the same time
+"""
+
+import os
+import re
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional
+
+from context_builder import get_variable_metadata
+from tfvars import TfvarsFile
+from validator import RuleSet, Violation
+
+logger = logging.getLogger("promptops.environments")
+
+FANOUT_WORKERS = int(os.getenv("PROMPTOPS_FANOUT_WORKERS", "4"))
+
+# Key of a proposal entry that applies to every environment
+ALL_ENVIRONMENTS = "all"
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+
+@dataclass(frozen=True)
+class Environment:
+    """One deployment target of the shared Terraform configuration."""
+    name: str
+    terraform_dir: Path
+
+    @property
+    def tfvars_path(self) -> Path:
+        return environments_dir(self.terraform_dir) / self.name / "terraform.tfvars"
+
+    @property
+    def data_dir(self) -> Path:
+        """TF_DATA_DIR of this environment's working copy."""
+        return self.terraform_dir / ".terraform-envs" / self.name
+
+
+def environments_dir(terraform_dir: Path) -> Path:
+    return Path(terraform_dir) / "environments"
+
+
+def environment_names(terraform_dir: Path) -> list[str]:
+    """PROMPTOPS_ENVIRONMENTS, else the directories under terraform/environments/."""
+    configured = os.getenv("PROMPTOPS_ENVIRONMENTS", "")
+    if configured.strip():
+        return [name.strip() for name in configured.split(",") if name.strip()]
+    root = environments_dir(terraform_dir)
+    if not root.is_dir():
+        return []
+    return sorted(p.name for p in root.iterdir() if p.is_dir() and not p.name.startswith("."))
+
+
+def get_environments(terraform_dir: Path, names: Optional[Iterable[str]] = None) -> list[Environment]:
+    """
+    Environment objects for names (default: environment_names()).
+    Raises ValueError for a name that cannot be a directory/workspace name.
+    """
+    names = list(dict.fromkeys(names if names is not None else environment_names(terraform_dir)))
+    for name in names:
+        if not _NAME_RE.match(name) or name == ALL_ENVIRONMENTS:
+            raise ValueError(f"Invalid environment name: {name!r}")
+    return [Environment(name, Path(terraform_dir)) for name in names]
+
+
+def environment_instructions(names: list[str]) -> str:
+    """Appended to the user request so one reply covers every environment."""
+    example = ", ".join(f'"{name}": {{...}}' for name in names[:2])
+    return (
+        f"Target environments: {', '.join(names)}.\n"
+        "Reply with ONE ```json block. Use a flat object of variables when every environment "
+        f"gets the same values, or an object keyed by environment name ({example}, "
+        f'optionally "{ALL_ENVIRONMENTS}": {{...}} for shared values) when they should differ.'
+    )
+
+
+def split_proposal(proposal: Optional[dict], names: list[str]) -> dict[str, dict]:
+    """Per-environment variables from a flat or environment-keyed proposal."""
+    if not proposal:
+        return {name: {} for name in names}
+    keyed = set(proposal) <= set(names) | {ALL_ENVIRONMENTS} and all(
+        isinstance(value, dict) for value in proposal.values()
+    )
+    if not keyed:
+        return {name: dict(proposal) for name in names}
+    shared = proposal.get(ALL_ENVIRONMENTS, {})
+    return {name: {**shared, **proposal.get(name, {})} for name in names}
+
+
+@dataclass
+class EnvironmentResult:
+    """A proposal for one environment: its violations and, once written, the file content."""
+    environment: Environment
+    proposal: dict
+    violations: list[Violation] = field(default_factory=list)
+    content: Optional[str] = None
+    changed: list[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+_tfvars_files: dict[Path, TfvarsFile] = {}
+_tfvars_files_lock = threading.Lock()
+
+
+def tfvars_file(environment: Environment) -> TfvarsFile:
+    """Shared TfvarsFile per environment, so unchanged files are parsed once."""
+    with _tfvars_files_lock:
+        if environment.tfvars_path not in _tfvars_files:
+            _tfvars_files[environment.tfvars_path] = TfvarsFile(environment.tfvars_path)
+        return _tfvars_files[environment.tfvars_path]
+
+
+def _pool_map(fn: Callable, items: list, workers: Optional[int] = None) -> list:
+    if len(items) <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(workers or FANOUT_WORKERS, len(items))) as pool:
+        return list(pool.map(fn, items))
+
+
+def check_rollout(environments: list[Environment], proposal: Optional[dict], rules: RuleSet,
+                  workers: Optional[int] = None) -> list[EnvironmentResult]:
+    """Split proposal over environments and validate each one concurrently."""
+    per_environment = split_proposal(proposal, [env.name for env in environments])
+
+    def check(env: Environment) -> EnvironmentResult:
+        vars_dict = per_environment[env.name]
+        return EnvironmentResult(env, vars_dict, rules.validate(vars_dict) if vars_dict else [])
+
+    return _pool_map(check, environments, workers)
+
+
+def rollout_violations(results: list[EnvironmentResult]) -> list[Violation]:
+    """Every violation, its variable prefixed with the environment ("prod: vm_count")."""
+    return [
+        Violation(f"{result.environment.name}: {v.variable}", v.value, v.message)
+        for result in results for v in result.violations
+    ]
+
+
+def write_rollout(results: list[EnvironmentResult], header: str = "",
+                  workers: Optional[int] = None) -> list[EnvironmentResult]:
+    """Merge every valid, non-empty proposal into its environment's terraform.tfvars, concurrently."""
+    def write(result: EnvironmentResult) -> EnvironmentResult:
+        if result.violations or not result.proposal:
+            return result
+        file = tfvars_file(result.environment)
+        file.header = header
+        try:
+            result.content, result.changed = file.merge(result.proposal)
+        except Exception as e:
+            result.error = f"could not update {result.environment.tfvars_path}: {e}"
+        return result
+
+    return _pool_map(write, results, workers)
+
+
+def rollout_text(results: list[EnvironmentResult]) -> str:
+    """All written files as one text, for hashing and the intent log."""
+    return "".join(f"# --- {r.environment.name} ---\n{r.content}" for r in results if r.content is not None)
+
+
+def variable_matrix(environments: list[Environment], shared: Optional[TfvarsFile] = None,
+                    only_differing: bool = False) -> list[dict[str, Any]]:
+    """
+    One row per variable with its value in each environment (falling back
+    to the shared terraform.tfvars, as Terraform does). Values of sensitive
+    variables are masked.
+    """
+    sensitive = set()
+    if environments:
+        root_variables, _ = get_variable_metadata(environments[0].terraform_dir)
+        sensitive = {var["name"] for var in root_variables if var.get("sensitive")}
+    base = shared.load() if shared else {}
+    values = {env.name: {**base, **tfvars_file(env).load()} for env in environments}
+    names = sorted(set(base).union(*(v.keys() for v in values.values())))
+    rows = []
+    for name in names:
+        row = {"variable": name}
+        for env in environments:
+            value = values[env.name].get(name)
+            row[env.name] = "(sensitive)" if name in sensitive and value is not None else value
+        differs = len({repr(values[env.name].get(name)) for env in environments}) > 1
+        if only_differing and not differs:
+            continue
+        row["differs"] = differs
+        rows.append(row)
+    return rows
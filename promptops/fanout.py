@@ -0,0 +1,180 @@
+"""
+Fan-out Planning - `terraform plan` for several environments side by side.
+
+WHAT THIS FILE DOES:
+1. Plans every environment (environments.py) on a bounded pool of
+   workers. Each one has its own Terraform data directory and workspace,
+   so plans never share .terraform/, state or locks. `terraform init` and
+   workspace selection run one environment at a time: they write the
+   shared plugin cache and .terraform.lock.hcl. Only plan and show run
+   side by side
+2. Streams each plan into a summary (plan_summary.py)
+3. Builds the comparison rows for the web UI: status, change counts and
+   timings per environment
+
+Only web.py imports this module; the reasoning side (app.py) never runs
+Terraform.
+
+CONFIGURATION:
+- PROMPTOPS_FANOUT_WORKERS=4     environments planned at the same time (environments.py)
+"""
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+from environments import FANOUT_WORKERS, Environment
+from jobs import RUNNING, SUCCEEDED, Job
+from plan_summary import PlanSummary
+from terraform_runner import TerraformWorkspace
+
+logger = logging.getLogger("promptops.fanout")
+
+# init and workspace selection share TF_PLUGIN_CACHE_DIR and .terraform.lock.hcl
+_SETUP_LOCK = threading.Lock()
+
+
+def environment_workspace(environment: Environment, **kwargs) -> TerraformWorkspace:
+    """The managed working copy of one environment: its own data directory and workspace."""
+    return TerraformWorkspace(environment.terraform_dir, data_dir=environment.data_dir,
+                              workspace=environment.name, **kwargs)
+
+
+@dataclass
+class EnvironmentPlan:
+    """The plan of one environment in a fan-out."""
+    environment: Environment
+    status: str = "queued"
+    # The running or last job: setup while it runs or if it failed, then the plan
+    job: Optional[Job] = None
+    setup_job: Optional[Job] = None
+    summary_file: Optional[Path] = None
+    summary: Optional[PlanSummary] = None
+    error: Optional[str] = None
+
+
+class FanoutPlanner:
+    """
+    `terraform plan` for several environments, at most `workers` at a time.
+
+    Each environment plans in its own TF_DATA_DIR and workspace with its
+    terraform.tfvars as -var-file, and streams its plan into a summary
+    (plan_summary.py). start() returns at once; poll running/plans.
+    """
+
+    def __init__(self, environments: list[Environment], output_dir: Path, quick: bool = False,
+                 timeout: float = 300, workers: Optional[int] = None):
+        self.output_dir = Path(output_dir)
+        self.quick = quick
+        self.timeout = timeout
+        self.workers = workers or FANOUT_WORKERS
+        self.plans = [EnvironmentPlan(env) for env in environments]
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._cancelled = threading.Event()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def start(self) -> "FanoutPlanner":
+        self._pool = ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(self.plans))),
+                                        thread_name_prefix="fanout-plan")
+        futures = [self._pool.submit(self._plan, plan) for plan in self.plans]
+        self._pool.shutdown(wait=False)
+
+        def finished():
+            for future in futures:
+                future.exception()
+            self.finished_at = time.time()
+
+        threading.Thread(target=finished, name="fanout-wait", daemon=True).start()
+        return self
+
+    def _setup(self, plan: EnvironmentPlan, workspace: TerraformWorkspace, env_dir: Path) -> bool:
+        """Run init / workspace select for one environment, one at a time. True if it can plan."""
+        env = plan.environment
+        with _SETUP_LOCK:
+            if self._cancelled.is_set():
+                plan.status = "cancelled"
+                return False
+            steps = workspace.setup_steps()
+            if not steps:
+                return True
+            plan.status = RUNNING
+            timeout = workspace.timeout(self.timeout)
+            plan.job = Job(f"setup {env.name}", steps[-1][1], env.terraform_dir, timeout,
+                           steps=steps, env=workspace.env(), log_file=env_dir / "setup.log")
+            plan.job.start().wait()
+            workspace.job_finished(plan.job)
+        if plan.job.status != SUCCEEDED:
+            plan.status = plan.job.status
+            return False
+        plan.setup_job = plan.job
+        return True
+
+    def _plan(self, plan: EnvironmentPlan):
+        if self._cancelled.is_set():
+            plan.status = "cancelled"
+            return
+        env = plan.environment
+        env_dir = self.output_dir / env.name
+        plan.summary_file = env_dir / "summary.json"
+        try:
+            workspace = environment_workspace(env)
+            if not self._setup(plan, workspace, env_dir):
+                return
+            if self._cancelled.is_set():
+                plan.status = "cancelled"
+                return
+            var_file = env.tfvars_path if env.tfvars_path.exists() else None
+            steps = workspace.plan_steps(env_dir / "plan.tfplan", quick=self.quick,
+                                         summary_file=plan.summary_file, var_file=var_file, setup=False)
+            plan.job = Job(f"plan {env.name}", steps[-1][1], env.terraform_dir, self.timeout,
+                           steps=steps, env=workspace.env(), log_file=env_dir / "output.log")
+            plan.status = RUNNING
+            plan.job.start().wait()
+            workspace.job_finished(plan.job)
+            plan.status = plan.job.status
+            plan.summary = PlanSummary.load(plan.summary_file)
+        except Exception as e:
+            plan.status = "failed"
+            plan.error = str(e)
+            logger.warning(f"plan for {env.name} failed: {e}")
+
+    @property
+    def running(self) -> bool:
+        return self.finished_at is None
+
+    @property
+    def duration(self) -> float:
+        return (self.finished_at or time.time()) - self.started_at
+
+    def cancel(self):
+        """Stop running setups and plans and skip queued ones."""
+        self._cancelled.set()
+        for plan in self.plans:
+            if plan.job is not None:
+                plan.job.cancel()
+
+    def comparison_rows(self) -> list[dict[str, Any]]:
+        """One row per environment: status, change counts and timings."""
+        rows = []
+        for plan in self.plans:
+            summary = plan.summary
+            counts = summary.counts if summary else {}
+            jobs = [job for job in (plan.setup_job, plan.job) if job is not None]
+            rows.append({
+                "environment": plan.environment.name,
+                "status": plan.status,
+                "add": counts.get("create"),
+                "change": counts.get("update"),
+                "replace": counts.get("replace"),
+                "destroy": counts.get("delete"),
+                "drift": summary.drift if summary else None,
+                "duration (s)": round(sum(job.duration for job in jobs), 1) if jobs else None,
+                "phases": ", ".join(filter(None, (job.phase_text() for job in jobs))),
+                "error": plan.error or "",
+            })
+        return rows
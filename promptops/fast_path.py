@@ -0,0 +1,214 @@
+"""
+Fast Path - Answers the common intents locally, without an LLM call.
+
+WHAT THIS FILE DOES:
+1. Classifies a request against a short list of known intents: make it
+   cheaper, enable disk encryption, enable the Streamlit app. A pattern
+   must match the WHOLE request, so anything with extra conditions
+   ("cheaper but keep 2 GPUs", "encryption and Streamlit") is ambiguous
+   and goes to the LLM as before
+2. Resolves the intent from the parsed variable constraints (validator.py)
+   and the current values (terraform.tfvars over the variable defaults):
+   the smallest allowed machine type, the minimum disk size and GPU
+   count, or the bool variable to switch on
+3. Replies in the LLM's format (explanation + ```json block with only the
+   values that change), so validation, writing and the intent log treat
+   it like any other reply
+4. Counts hits and misses; the hit rate is in the metrics (metrics.py)
+
+CONFIGURATION:
+- PROMPTOPS_FAST_PATH=false   send every request to the LLM
+"""
+
+import os
+import re
+import json
+import time
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from context_builder import get_variable_metadata
+from metrics import get_registry
+from validator import RuleSet, get_rule_set
+
+logger = logging.getLogger("promptops.fast_path")
+
+FAST_PATH_ENABLED = os.getenv("PROMPTOPS_FAST_PATH", "true").lower() != "false"
+
+# Recorded as the model of fast-path answers (intent log, metrics)
+FAST_PATH_MODEL = "fast-path"
+
+# Filler around a request that does not change its meaning
+_PREFIX_RE = re.compile(
+    r"^(?:(?:please|pls|hey|ok|okay|now|can you|could you|would you|i want to|i'd like to|"
+    r"i would like to|i need to|let's|lets)\s+)+"
+)
+_SUFFIX_RE = re.compile(r"(?:\s+(?:please|pls|thanks|thank you|now))+$")
+
+_TARGET = (
+    r"(?:(?:the|my|our|this|these|it's|its)\s+)?"
+    r"(?:(?:gpu\s+)?(?:vms?|instances?|machines?|servers?|workers?|setup|infra(?:structure)?|"
+    r"deployment|config(?:uration)?|it|this)\s+)?"
+)
+_CHEAPER_RE = re.compile(
+    rf"(?:make\s+{_TARGET}(?:cheaper|less\s+expensive|as\s+cheap\s+as\s+possible)"
+    rf"|(?:reduce|lower|cut|minimi[sz]e)\s+(?:the\s+|my\s+|our\s+)?(?:costs?|spend(?:ing)?|bill)"
+    rf"|cheaper|save\s+money|cheapest\s+(?:option|config(?:uration)?|setup))"
+)
+_ENCRYPTION_RE = re.compile(
+    r"(?:(?:enable|turn\s+on|switch\s+on|use|add)\s+(?:(?:boot\s+)?disk\s+|boot\s+)?encryption"
+    r"(?:\s+(?:on|for)\s+(?:the\s+)?(?:boot\s+)?disks?)?"
+    r"|encrypt\s+(?:the\s+|my\s+)?(?:boot\s+)?disks?)"
+)
+_STREAMLIT_RE = re.compile(
+    r"(?:enable|allow|open)\s+(?:(?:up\s+)?access\s+(?:to|for)\s+)?(?:the\s+)?streamlit"
+    r"(?:\s+(?:app|application|ui|port))?(?:\s+access)?"
+    r"|open\s+port\s+8501"
+)
+
+# Variables the "cheaper" intent lowers, by name
+_SHAPE_VAR_RE = re.compile(r"(?:machine|instance|node|vm)_(?:type|size)$")
+_SIZE_VAR_RE = re.compile(r"(?:gpu|accelerator)_count$|disk_size")
+
+
+@dataclass
+class FastAnswer:
+    """A locally resolved intent, shaped like an LLM reply."""
+    intent: str
+    # Variables to write: flat, or keyed by environment when they differ
+    proposal: Optional[dict]
+    text: str
+    duration_s: float = 0.0
+    changes: dict[str, dict[str, Any]] = field(default_factory=dict)
+
+
+def normalize(request: str) -> str:
+    """Lower-case request without filler words, punctuation or extra spaces."""
+    text = re.sub(r"\s+", " ", request.lower()).strip()
+    text = re.sub(r"[.!?,;:]+$", "", text).strip()
+    text = _PREFIX_RE.sub("", text)
+    return _SUFFIX_RE.sub("", text).strip()
+
+
+def _size_key(value: str) -> tuple:
+    """Ordering of machine shapes: by the numbers in the name (n1-standard-4 < n1-standard-8)."""
+    return tuple(int(n) for n in re.findall(r"\d+", value)) or (0,), value
+
+
+def _number(value: float):
+    return int(value) if float(value).is_integer() else value
+
+
+def _cheaper(rules: RuleSet) -> tuple[dict, list[str]]:
+    """Smallest allowed shape and the minimum disk / GPU count; VM count is left alone."""
+    target, reasons = {}, []
+    for name, rule in rules.rules.items():
+        if _SHAPE_VAR_RE.search(name) and rule.allowed:
+            target[name] = min(rule.allowed, key=_size_key)
+            reasons.append(f"`{name}` = {target[name]} is the smallest allowed option")
+        elif _SIZE_VAR_RE.search(name) and rule.type == "number" and rule.min is not None:
+            target[name] = _number(rule.min)
+            reasons.append(f"`{name}` = {target[name]} is the platform minimum")
+    return target, reasons
+
+
+def _switch_on(pattern: str, description: str) -> Callable[[RuleSet], tuple[dict, list[str]]]:
+    """Resolver that sets every bool variable whose name matches pattern to true."""
+    def resolve(rules: RuleSet) -> tuple[dict, list[str]]:
+        names = [name for name, rule in rules.rules.items() if rule.type == "bool" and re.search(pattern, name)]
+        return {name: True for name in names}, [f"`{name}` = true {description}" for name in names]
+    return resolve
+
+
+# Intent -> (pattern, resolver returning the target values and why)
+_INTENTS: dict[str, tuple[re.Pattern, Callable[[RuleSet], tuple[dict, list[str]]]]] = {
+    "cheaper": (_CHEAPER_RE, _cheaper),
+    "encryption": (_ENCRYPTION_RE, _switch_on("encrypt", "turns encryption on")),
+    "streamlit": (_STREAMLIT_RE, _switch_on("streamlit", "opens access to the Streamlit app")),
+}
+
+
+def classify(request: str) -> Optional[str]:
+    """The intent a request asks for, None if it is not (only) a known one."""
+    text = normalize(request)
+    matches = [name for name, (pattern, _) in _INTENTS.items() if pattern.fullmatch(text)]
+    return matches[0] if len(matches) == 1 else None
+
+
+def current_values(terraform_dir: Path, tfvars: dict) -> dict[str, Any]:
+    """Effective variable values: the tfvars over the variable defaults."""
+    root_variables, _ = get_variable_metadata(terraform_dir)
+    values = {}
+    for var in root_variables:
+        default = var.get("default")
+        if default is None:
+            continue
+        if var.get("type") in ("number", "bool"):
+            try:
+                default = json.loads(default)
+            except ValueError:
+                continue
+        values[var["name"]] = default
+    values.update(tfvars)
+    return values
+
+
+def _changes(target: dict, current: dict) -> dict[str, Any]:
+    return {name: value for name, value in target.items() if current.get(name) != value}
+
+
+def _same(values: list[dict]) -> bool:
+    return all(value == values[0] for value in values[1:])
+
+
+def _reply(intent: str, reasons: list[str], changes: dict[str, dict]) -> tuple[Optional[dict], str]:
+    """(proposal, reply text) for the per-environment changes ("" key: no environments)."""
+    if not any(changes.values()):
+        return None, "Already in place, nothing to change:\n" + "\n".join(f"- {r}" for r in reasons)
+    # One flat block when every environment gets the same values
+    proposal = next(iter(changes.values())) if _same(list(changes.values())) else dict(changes)
+    lines = [f"Resolved locally ({intent}), using the platform constraints and the current values:"]
+    lines += [f"- {reason}" for reason in reasons]
+    return proposal, (
+        "\n".join(lines) + f"\n\n```json\n{json.dumps(proposal, indent=2)}\n```\n\n"
+        "Run a plan to review the change before applying it."
+    )
+
+
+def answer(request: str, terraform_dir: Path, tfvars: dict[str, dict]) -> Optional[FastAnswer]:
+    """
+    Answer request locally, or None to ask the LLM.
+
+    tfvars maps environment name to its current terraform.tfvars values
+    ({"": values} without environments). Every call counts as a hit or a
+    miss in the fast-path metrics.
+    """
+    if not FAST_PATH_ENABLED:
+        return None
+    start = time.perf_counter()
+    result = _answer(request, Path(terraform_dir), tfvars)
+    duration = time.perf_counter() - start
+    get_registry().record_fast_path(result.intent if result else None, duration)
+    if result:
+        result.duration_s = duration
+        logger.info(f"fast path: {result.intent} in {duration * 1000:.1f} ms")
+    return result
+
+
+def _answer(request: str, terraform_dir: Path, tfvars: dict[str, dict]) -> Optional[FastAnswer]:
+    intent = classify(request)
+    if intent is None or not tfvars:
+        return None
+    rules = get_rule_set(terraform_dir)
+    target, reasons = _INTENTS[intent][1](rules)
+    # No matching variables (another platform) or nothing the rules allow: the LLM decides
+    if not target or rules.validate(target):
+        return None
+    changes = {
+        name: _changes(target, current_values(terraform_dir, values))
+        for name, values in tfvars.items()
+    }
+    proposal, text = _reply(intent, reasons, changes)
+    return FastAnswer(intent, proposal, text, changes=changes)
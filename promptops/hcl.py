@@ -0,0 +1,301 @@
+"""
+HCL Lexer - Single-pass tokenizer and block parser for Terraform files.
+
+WHAT THIS FILE DOES:
+1. Splits HCL source into tokens in one linear pass (no backtracking)
+2. Groups tokens into attributes and (arbitrarily nested) blocks
+3. Yields top-level blocks one at a time so large files stream
+
+This is deliberately NOT a full HCL evaluator. Expressions are kept as
+token lists; callers pick out the pieces they need (string literals,
+type keywords, contains([...]) lists, var.x >= N comparisons).
+
+Used by context_builder.parse_terraform_variables().
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Iterator, Optional, Union
+
+
+# Token kinds
+IDENT = "ident"
+NUMBER = "number"
+STRING = "string"
+HEREDOC = "heredoc"
+PUNCT = "punct"
+NEWLINE = "newline"
+
+
+class HCLSyntaxError(ValueError):
+    """Raised when the source cannot be tokenized or has unbalanced braces."""
+
+
+@dataclass
+class Token:
+    __slots__ = ("kind", "value", "start", "end")
+    kind: str
+    value: str
+    start: int
+    end: int
+
+
+@dataclass
+class Attribute:
+    """name = <expression>"""
+    name: str
+    tokens: list[Token]
+    start: int = 0
+
+    def string_value(self) -> Optional[str]:
+        """The literal value if the expression is a single quoted string or heredoc."""
+        if len(self.tokens) == 1 and self.tokens[0].kind in (STRING, HEREDOC):
+            return self.tokens[0].value
+        return None
+
+
+@dataclass
+class Block:
+    """type "label" ... { body }"""
+    type: str
+    labels: list[str]
+    attributes: dict[str, Attribute] = field(default_factory=dict)
+    blocks: list["Block"] = field(default_factory=list)
+
+    def child_blocks(self, block_type: str) -> list["Block"]:
+        return [b for b in self.blocks if b.type == block_type]
+
+
+# One alternation, tried left to right at each position. Every branch is
+# possessive in practice (no nested quantifiers), so scanning is linear.
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>[ \t\r]+)
+  | (?P<newline>\n)
+  | (?P<comment>\#[^\n]*|//[^\n]*)
+  | (?P<block_comment>/\*)
+  | (?P<heredoc><<-?(?P<marker>[A-Za-z_][A-Za-z0-9_]*)[ \t]*\n)
+  | (?P<string>")
+  | (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_\-]*)
+  | (?P<punct>==|!=|>=|<=|&&|\|\||=>|\.\.\.|[{}\[\]()=,.:?!<>+\-*/%])
+""", re.VERBOSE)
+
+# String body up to a quote, an escape, or a template interpolation
+_STRING_CHUNK_RE = re.compile(r'[^"\\$%]+|\\.|\$\$\{|%%\{|[$%](?!\{)|[$%]\{', re.DOTALL)
+
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", '"': '"', "\\": "\\"}
+
+
+def _scan_string(src: str, pos: int) -> tuple[str, int]:
+    """
+    Scan a quoted string starting just after the opening quote.
+
+    Handles escapes and ${ ... } / %{ ... } templates, including quotes
+    nested inside the template. Returns (decoded value, end position).
+    """
+    parts = []
+    n = len(src)
+    while pos < n:
+        if src[pos] == '"':
+            return "".join(parts), pos + 1
+        m = _STRING_CHUNK_RE.match(src, pos)
+        if not m:
+            break
+        chunk = m.group(0)
+        if chunk[0] == "\\":
+            parts.append(_ESCAPES.get(chunk[1], chunk))
+            pos = m.end()
+        elif chunk in ("$${", "%%{"):
+            # Escaped template sequence: literal ${ / %{
+            parts.append(chunk[1:])
+            pos = m.end()
+        elif chunk in ("${", "%{"):
+            # Copy the template verbatim, tracking brace depth and nested strings
+            depth = 1
+            j = m.end()
+            while j < n and depth:
+                c = src[j]
+                if c == "{":
+                    depth += 1
+                    j += 1
+                elif c == "}":
+                    depth -= 1
+                    j += 1
+                elif c == '"':
+                    _, j = _scan_string(src, j + 1)
+                else:
+                    j += 1
+            parts.append(src[pos:j])
+            pos = j
+        else:
+            parts.append(chunk)
+            pos = m.end()
+    raise HCLSyntaxError(f"Unterminated string at offset {pos}")
+
+
+def tokenize(src: str) -> Iterator[Token]:
+    """Yield tokens from HCL source in a single left-to-right pass."""
+    pos = 0
+    n = len(src)
+    match = _TOKEN_RE.match
+    while pos < n:
+        m = match(src, pos)
+        if not m:
+            raise HCLSyntaxError(f"Unexpected character {src[pos]!r} at offset {pos}")
+        kind = m.lastgroup
+
+        if kind == "ws" or kind == "comment":
+            pos = m.end()
+        elif kind == "block_comment":
+            close = src.find("*/", m.end())
+            if close < 0:
+                raise HCLSyntaxError(f"Unterminated comment at offset {pos}")
+            pos = close + 2
+        elif kind == "newline":
+            yield Token(NEWLINE, "\n", pos, m.end())
+            pos = m.end()
+        elif kind == "string":
+            value, end = _scan_string(src, m.end())
+            yield Token(STRING, value, pos, end)
+            pos = end
+        elif kind == "heredoc":
+            marker = m.group("marker")
+            end_re = re.compile(r"^[ \t]*" + re.escape(marker) + r"[ \t]*$", re.MULTILINE)
+            close = end_re.search(src, m.end())
+            if not close:
+                raise HCLSyntaxError(f"Unterminated heredoc {marker} at offset {pos}")
+            body = src[m.end():close.start()]
+            if m.group(0).startswith("<<-"):
+                lines = body.split("\n")
+                indents = [len(l) - len(l.lstrip()) for l in lines if l.strip()]
+                strip = min(indents) if indents else 0
+                body = "\n".join(l[strip:] for l in lines)
+            yield Token(HEREDOC, body, pos, close.end())
+            pos = close.end()
+        else:
+            yield Token(NUMBER if kind == "number" else IDENT if kind == "ident" else PUNCT,
+                        m.group(0), pos, m.end())
+            pos = m.end()
+
+
+_OPEN = {"{": "}", "[": "]", "(": ")"}
+
+
+class _Parser:
+    """Recursive-descent body parser over a token iterator with one-token lookahead."""
+
+    def __init__(self, tokens: Iterator[Token]):
+        self._tokens = tokens
+        self._peek: Optional[Token] = None
+
+    def _next(self) -> Optional[Token]:
+        if self._peek is not None:
+            tok, self._peek = self._peek, None
+            return tok
+        return next(self._tokens, None)
+
+    def _lookahead(self) -> Optional[Token]:
+        if self._peek is None:
+            self._peek = next(self._tokens, None)
+        return self._peek
+
+    def _expression(self) -> list[Token]:
+        """Collect expression tokens up to a newline at bracket depth zero."""
+        out: list[Token] = []
+        stack: list[str] = []
+        while True:
+            tok = self._lookahead()
+            if tok is None:
+                break
+            if tok.kind == NEWLINE and not stack:
+                break
+            if tok.kind == PUNCT:
+                if tok.value in _OPEN:
+                    stack.append(_OPEN[tok.value])
+                elif tok.value in ("}", "]", ")"):
+                    if not stack:
+                        # Closing brace of the enclosing block (one-line block body)
+                        break
+                    if stack.pop() != tok.value:
+                        raise HCLSyntaxError(f"Mismatched {tok.value!r} at offset {tok.start}")
+            self._next()
+            if tok.kind != NEWLINE:
+                out.append(tok)
+        return out
+
+    def item(self, block_type: Optional[str] = None) -> Union[Attribute, Block, None]:
+        """
+        Parse the next attribute or block in the current body.
+
+        Returns None at a closing brace or end of input. Inside a block
+        (block_type given) end of input means the block was never closed.
+        """
+        while True:
+            tok = self._next()
+            if tok is None:
+                if block_type is not None:
+                    raise HCLSyntaxError(f"Unexpected end of input in block {block_type!r}")
+                return None
+            if tok.kind == NEWLINE:
+                continue
+            if tok.kind == PUNCT and tok.value == "}":
+                return None
+            break
+
+        if tok.kind != IDENT:
+            raise HCLSyntaxError(f"Expected identifier, got {tok.value!r} at offset {tok.start}")
+
+        nxt = self._lookahead()
+        if nxt is not None and nxt.kind == PUNCT and nxt.value == "=":
+            self._next()
+            return Attribute(tok.value, self._expression(), start=tok.start)
+
+        labels = []
+        while True:
+            nxt = self._next()
+            if nxt is None:
+                raise HCLSyntaxError(f"Unexpected end of input in block {tok.value!r}")
+            if nxt.kind in (STRING, IDENT):
+                labels.append(nxt.value)
+            elif nxt.kind == PUNCT and nxt.value == "{":
+                break
+            else:
+                raise HCLSyntaxError(f"Unexpected {nxt.value!r} at offset {nxt.start}")
+
+        block = Block(type=tok.value, labels=labels)
+        while True:
+            child = self.item(tok.value)
+            if child is None:
+                break
+            if isinstance(child, Attribute):
+                block.attributes.setdefault(child.name, child)
+            else:
+                block.blocks.append(child)
+        return block
+
+
+def iter_blocks(src: str) -> Iterator[Block]:
+    """Yield each top-level block of an HCL file as soon as it is closed."""
+    parser = _Parser(tokenize(src))
+    while True:
+        item = parser.item()
+        if item is None:
+            if parser._lookahead() is None:
+                return
+            # Stray closing brace at top level
+            raise HCLSyntaxError("Unbalanced '}' at top level")
+        if isinstance(item, Block):
+            yield item
+
+
+def iter_attributes(src: str) -> Iterator[Attribute]:
+    """Yield each top-level attribute of an HCL file (e.g. a .tfvars file)."""
+    parser = _Parser(tokenize(src))
+    while True:
+        item = parser.item()
+        if item is None:
+            if parser._lookahead() is None:
+                return
+            raise HCLSyntaxError("Unbalanced '}' at top level")
+        if isinstance(item, Attribute):
+            yield item
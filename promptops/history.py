@@ -0,0 +1,144 @@
+"""
+History Manager - Keeps conversation history inside a token budget.
+
+WHAT THIS FILE DOES:
+1. Drops repeated copies of the planning prompt from all but the latest turn
+2. Keeps the most recent turns that fit the token budget
+3. Folds older turns into one short summary message
+4. Carries the merged ```json configuration from folded turns forward,
+   so the latest proposed tfvars state is never lost
+
+The result is what gets sent to the LLM; turn 50 costs about the same as turn 5.
+
+CONFIGURATION:
+- PROMPTOPS_HISTORY_TOKENS=3000   token budget for the conversation history
+"""
+
+import os
+import json
+from typing import Optional
+
+from streaming import extract_json_block
+
+
+SUMMARY_HEADER = "## Earlier conversation (summarized by PromptOps)"
+STATE_HEADER = "Configuration proposed so far:"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English and JSON)."""
+    return max(1, len(text) // 4) if text else 0
+
+
+def _first_line(text: str, limit: int) -> str:
+    line = " ".join(text.strip().split())
+    return line if len(line) <= limit else line[:limit - 3] + "..."
+
+
+class HistoryManager:
+    """
+    Compacts a chat messages list to fit a token budget.
+
+    Leading system messages are always kept. At least `min_recent` of the
+    newest messages are always kept, even if they alone exceed the budget.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 3000,
+        planning_prompt: str = "",
+        min_recent: int = 2,
+        summary_tokens: int = 400,
+    ):
+        self.token_budget = token_budget
+        self.planning_prompt = planning_prompt.strip()
+        self.min_recent = min_recent
+        self.summary_tokens = summary_tokens
+
+    def _strip_planning(self, message: dict) -> dict:
+        content = message["content"]
+        if self.planning_prompt and content.startswith(self.planning_prompt):
+            return {**message, "content": content[len(self.planning_prompt):].lstrip()}
+        return message
+
+    def compact(self, messages: list[dict]) -> list[dict]:
+        """Return a budget-bounded copy of messages. The input is not modified."""
+        head = []
+        rest = list(messages)
+        while rest and rest[0]["role"] == "system" and not rest[0]["content"].startswith(SUMMARY_HEADER):
+            head.append(rest.pop(0))
+
+        prior_summary = None
+        turns = []
+        for message in rest:
+            if message["role"] == "system" and message["content"].startswith(SUMMARY_HEADER):
+                prior_summary = message
+            else:
+                turns.append(message)
+
+        # Only the latest user turn needs the planning instructions
+        last_user = max((i for i, m in enumerate(turns) if m["role"] == "user"), default=-1)
+        turns = [
+            self._strip_planning(m) if m["role"] == "user" and i != last_user else m
+            for i, m in enumerate(turns)
+        ]
+
+        budget = self.token_budget - sum(estimate_tokens(m["content"]) for m in head)
+        if prior_summary:
+            budget -= estimate_tokens(prior_summary["content"])
+
+        kept = []
+        used = 0
+        for message in reversed(turns):
+            cost = estimate_tokens(message["content"])
+            if len(kept) >= self.min_recent and used + cost > budget:
+                break
+            kept.append(message)
+            used += cost
+        kept.reverse()
+
+        dropped = turns[:len(turns) - len(kept)]
+        if not dropped:
+            return head + ([prior_summary] if prior_summary else []) + kept
+
+        return head + [self._summarize(prior_summary, dropped)] + kept
+
+    def _summarize(self, prior_summary: Optional[dict], dropped: list[dict]) -> dict:
+        lines = []
+        state = {}
+        if prior_summary:
+            content = prior_summary["content"]
+            lines = [l for l in content.split("\n") if l.startswith("- ")]
+            state = extract_json_block(content) or {}
+
+        for message in dropped:
+            if message["role"] == "user":
+                lines.append(f"- User: {_first_line(message['content'], 160)}")
+            elif message["role"] == "assistant":
+                block = extract_json_block(message["content"])
+                if block:
+                    state.update(block)
+                text = message["content"].split("```")[0]
+                lines.append(f"- Assistant: {_first_line(text, 160)}")
+
+        # Keep the newest summary lines that fit
+        state_text = f"\n\n{STATE_HEADER}\n```json\n{json.dumps(state, indent=2)}\n```" if state else ""
+        budget = self.summary_tokens - estimate_tokens(SUMMARY_HEADER + state_text)
+        kept_lines = []
+        for line in reversed(lines):
+            budget -= estimate_tokens(line)
+            if budget < 0:
+                break
+            kept_lines.append(line)
+        kept_lines.reverse()
+
+        content = "\n".join([SUMMARY_HEADER, *kept_lines]) + state_text
+        return {"role": "system", "content": content}
+
+
+def history_manager_from_env(planning_prompt: str = "") -> HistoryManager:
+    """Build a HistoryManager with the budget from PROMPTOPS_HISTORY_TOKENS."""
+    return HistoryManager(
+        token_budget=int(os.getenv("PROMPTOPS_HISTORY_TOKENS", "3000")),
+        planning_prompt=planning_prompt,
+    )
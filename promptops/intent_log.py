@@ -0,0 +1,390 @@
+"""
+Intent Log - Append-only, indexed record of every intent PromptOps handled.
+
+WHAT THIS FILE DOES:
+1. Appends one row per request (intent, response, proposed tfvars, the hash
+   of the resulting terraform.tfvars, violations) to a single SQLite file
+   instead of writing a markdown file per request
+2. Gives every record a random id, so concurrent requests never collide
+3. Batches writes: appends are queued and committed together by a
+   background thread (one fsync per batch, not per request)
+4. Indexes timestamp, session and tfvars hash for fast queries
+5. Renders markdown only on demand, from the query/export CLI
+
+Rows are only ever inserted, never updated or deleted.
+
+USAGE:
+    python intent_log.py query --session cli-1a2b --since 2024-05-01
+    python intent_log.py query --tfvars-hash 3f9a
+    python intent_log.py show <id>
+    python intent_log.py export --format markdown --out plans/intent
+
+CONFIGURATION:
+- PROMPTOPS_INTENT_LOG=plans/intents.sqlite   SQLite file location
+- PROMPTOPS_INTENT_LOG_FLUSH_S=0.5            max seconds an append waits for its commit
+"""
+
+import os
+import sys
+import json
+import uuid
+import atexit
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger("promptops.intent_log")
+
+REPO_ROOT = Path(__file__).parent.parent
+DEFAULT_PATH = REPO_ROOT / "plans" / "intents.sqlite"
+
+_COLUMNS = (
+    "id", "timestamp", "session_id", "source", "intent", "response", "model",
+    "tfvars", "tfvars_hash", "tfvars_written", "violations",
+)
+
+
+def content_hash(text: str) -> str:
+    """sha256 of a terraform.tfvars content, as stored in tfvars_hash."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class IntentRecord:
+    """One handled intent."""
+    intent: str
+    response: str = ""
+    session_id: str = ""
+    source: str = "cli"
+    model: str = ""
+    tfvars: Optional[dict[str, Any]] = None
+    tfvars_hash: Optional[str] = None
+    tfvars_written: bool = False
+    violations: list[str] = field(default_factory=list)
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    timestamp: float = field(default_factory=lambda: datetime.now().timestamp())
+
+    @property
+    def time(self) -> datetime:
+        return datetime.fromtimestamp(self.timestamp)
+
+    def _row(self) -> tuple:
+        return (
+            self.id, self.timestamp, self.session_id, self.source, self.intent, self.response, self.model,
+            json.dumps(self.tfvars) if self.tfvars is not None else None,
+            self.tfvars_hash, int(self.tfvars_written), json.dumps(self.violations),
+        )
+
+    @classmethod
+    def _from_row(cls, row: tuple) -> "IntentRecord":
+        values = dict(zip(_COLUMNS, row))
+        values["tfvars"] = json.loads(values["tfvars"]) if values["tfvars"] else None
+        values["tfvars_written"] = bool(values["tfvars_written"])
+        values["violations"] = json.loads(values["violations"] or "[]")
+        return cls(**values)
+
+
+def render_markdown(record: IntentRecord) -> str:
+    """Render one record as the markdown intent document."""
+    if record.tfvars_written:
+        tfvars_status = f"Written (sha256 {record.tfvars_hash[:12]})" if record.tfvars_hash else "Written"
+    elif record.violations:
+        tfvars_status = "Rejected: " + "; ".join(record.violations)
+    else:
+        tfvars_status = "Not yet generated"
+    return f"""# Infrastructure Intent Document
+
+**Date**: {record.time.strftime("%Y-%m-%d %H:%M:%S")}
+
+## User Intent
+
+{record.intent}
+
+## PromptOps Analysis
+
+{record.response}
+
+## Status
+
+- Intent id: {record.id}
+- Session: {record.session_id or "-"} ({record.source})
+- Terraform vars: {tfvars_status}
+- Speculative plan: Run `terraform/speculative/run_plan.sh` to validate
+
+---
+
+This document was generated by the PromptOps reasoning service.
+The service has no execution privileges and cannot apply infrastructure changes.
+"""
+
+
+class IntentLog:
+    """
+    Append-only intent store backed by SQLite.
+
+    append() returns immediately; a daemon thread commits queued records
+    every flush_interval seconds or batch_size records, whichever comes
+    first. Queries flush first, so a caller always reads its own writes.
+    A crash loses at most the last flush_interval seconds of records.
+    """
+
+    def __init__(self, path: Path, flush_interval: float = 0.5, batch_size: int = 64):
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._pending: list[IntentRecord] = []
+        self._wake = threading.Condition(threading.Lock())
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writer: Optional[threading.Thread] = None
+        self._closed = False
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # FULL: each commit (= each batch) is fsynced
+            self._conn.execute("PRAGMA synchronous=FULL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS intents (
+                    id TEXT PRIMARY KEY,
+                    timestamp REAL NOT NULL,
+                    session_id TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    intent TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    tfvars TEXT,
+                    tfvars_hash TEXT,
+                    tfvars_written INTEGER NOT NULL,
+                    violations TEXT NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_intents_timestamp ON intents(timestamp)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_intents_session ON intents(session_id, timestamp)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_intents_tfvars_hash ON intents(tfvars_hash)")
+            self._conn.commit()
+        return self._conn
+
+    def append(self, record: IntentRecord) -> str:
+        """Queue a record for the next batch commit. Returns its id."""
+        with self._wake:
+            self._pending.append(record)
+            closed = self._closed
+            if self._writer is None and not closed:
+                self._writer = threading.Thread(target=self._write_loop, name="intent-log", daemon=True)
+                self._writer.start()
+            if len(self._pending) in (1, self.batch_size):
+                self._wake.notify()
+        if closed:
+            self.flush()
+        return record.id
+
+    def _write_loop(self):
+        while True:
+            with self._wake:
+                if not self._pending and not self._closed:
+                    self._wake.wait()
+                if self._closed and not self._pending:
+                    return
+                # Let more appends join the batch
+                if len(self._pending) < self.batch_size and not self._closed:
+                    self._wake.wait(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Commit every queued record now (one transaction, one fsync)."""
+        with self._lock:
+            with self._wake:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            placeholders = ", ".join("?" for _ in _COLUMNS)
+            try:
+                db = self._db()
+                with db:
+                    db.executemany(
+                        f"INSERT INTO intents ({', '.join(_COLUMNS)}) VALUES ({placeholders})",
+                        [record._row() for record in batch],
+                    )
+            except sqlite3.Error as e:
+                logger.warning(f"Intent log write failed, {len(batch)} records lost: {e}")
+
+    def close(self):
+        """Flush pending records and stop the writer thread."""
+        with self._wake:
+            self._closed = True
+            self._wake.notify()
+        if self._writer is not None:
+            self._writer.join(timeout=5)
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def query(
+        self,
+        session_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        tfvars_hash: Optional[str] = None,
+        text: Optional[str] = None,
+        limit: Optional[int] = 100,
+    ) -> list[IntentRecord]:
+        """
+        Records matching every given filter, newest first.
+
+        tfvars_hash matches as a prefix; text is a substring of the intent.
+        """
+        clauses, params = [], []
+        if session_id:
+            clauses.append("session_id = ?")
+            params.append(session_id)
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since.timestamp())
+        if until:
+            clauses.append("timestamp < ?")
+            params.append(until.timestamp())
+        if tfvars_hash:
+            # Range scan, so the prefix match still uses the index
+            clauses.append("tfvars_hash >= ? AND tfvars_hash < ?")
+            params.extend([tfvars_hash, tfvars_hash + "\uffff"])
+        if text:
+            clauses.append("intent LIKE ?")
+            params.append(f"%{text}%")
+        sql = f"SELECT {', '.join(_COLUMNS)} FROM intents"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY timestamp DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+
+        self.flush()
+        with self._lock:
+            rows = self._db().execute(sql, params).fetchall()
+        return [IntentRecord._from_row(row) for row in rows]
+
+    def get(self, record_id: str) -> Optional[IntentRecord]:
+        """The record with this id (or unique id prefix)."""
+        self.flush()
+        with self._lock:
+            rows = self._db().execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM intents WHERE id >= ? AND id < ? LIMIT 2",
+                (record_id, record_id + "\uffff"),
+            ).fetchall()
+        return IntentRecord._from_row(rows[0]) if len(rows) == 1 else None
+
+
+_logs: dict[str, IntentLog] = {}
+_logs_lock = threading.Lock()
+
+
+def get_intent_log(path: Optional[Path] = None) -> IntentLog:
+    """The process-wide log for path (default PROMPTOPS_INTENT_LOG), flushed at exit."""
+    path = Path(path or os.getenv("PROMPTOPS_INTENT_LOG") or DEFAULT_PATH)
+    with _logs_lock:
+        log = _logs.get(str(path))
+        if log is None:
+            log = IntentLog(path, flush_interval=float(os.getenv("PROMPTOPS_INTENT_LOG_FLUSH_S", "0.5")))
+            _logs[str(path)] = log
+            atexit.register(log.close)
+        return log
+
+
+def _parse_time(value: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not an ISO date/time: {value}")
+
+
+def _export(records: list[IntentRecord], fmt: str, out: Optional[Path]):
+    if fmt == "jsonl":
+        lines = "".join(json.dumps(asdict(record)) + "\n" for record in records)
+        if out:
+            out.parent.mkdir(parents=True, exist_ok=True)
+            out.write_text(lines)
+            print(f"Exported {len(records)} records to {out}")
+        else:
+            sys.stdout.write(lines)
+        return
+
+    if out is None:
+        sys.stdout.write("\n\n".join(render_markdown(record) for record in records))
+        return
+    out.mkdir(parents=True, exist_ok=True)
+    for record in records:
+        name = f"intent_{record.time.strftime('%Y%m%d_%H%M%S')}_{record.id}.md"
+        (out / name).write_text(render_markdown(record))
+    print(f"Exported {len(records)} intent documents to {out}")
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Query and export the PromptOps intent log")
+    parser.add_argument("--log", type=Path, help=f"SQLite file (default: PROMPTOPS_INTENT_LOG or {DEFAULT_PATH})")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    filters = argparse.ArgumentParser(add_help=False)
+    filters.add_argument("--session", help="Only this session id")
+    filters.add_argument("--since", type=_parse_time, help="From this ISO date/time")
+    filters.add_argument("--until", type=_parse_time, help="Before this ISO date/time")
+    filters.add_argument("--tfvars-hash", help="Resulting terraform.tfvars sha256 (prefix)")
+    filters.add_argument("--search", help="Substring of the intent text")
+    filters.add_argument("--limit", type=int, default=100, help="Max records, newest first (0 = all)")
+
+    query = sub.add_parser("query", parents=[filters], help="List matching intents")
+    query.add_argument("--json", action="store_true", help="One JSON object per line")
+
+    show = sub.add_parser("show", help="Print one intent as markdown")
+    show.add_argument("id", help="Intent id (or unique prefix)")
+
+    export = sub.add_parser("export", parents=[filters], help="Export matching intents")
+    export.add_argument("--format", choices=["markdown", "jsonl"], default="markdown")
+    export.add_argument("--out", type=Path, help="Directory (markdown) or file (jsonl); default stdout")
+
+    args = parser.parse_args(argv)
+    log = get_intent_log(args.log)
+
+    if args.command == "show":
+        record = log.get(args.id)
+        if record is None:
+            print(f"No unique intent with id {args.id}")
+            sys.exit(1)
+        print(render_markdown(record))
+        return
+
+    records = log.query(
+        session_id=args.session,
+        since=args.since,
+        until=args.until,
+        tfvars_hash=args.tfvars_hash,
+        text=args.search,
+        limit=args.limit or None,
+    )
+    if args.command == "export":
+        _export(records, args.format, args.out)
+        return
+
+    if args.json:
+        for record in records:
+            print(json.dumps(asdict(record)))
+        return
+    print(f"{'ID':<16}  {'TIME':<19}  {'SESSION':<16}  {'TFVARS':<12}  INTENT")
+    for record in records:
+        status = (record.tfvars_hash or "")[:12] if record.tfvars_written else ("rejected" if record.violations else "-")
+        intent = " ".join(record.intent.split())
+        print(f"{record.id:<16}  {record.time.strftime('%Y-%m-%d %H:%M:%S')}  "
+              f"{record.session_id[:16]:<16}  {status:<12}  {intent[:60]}")
+
+
+if __name__ == "__main__":
+    main()
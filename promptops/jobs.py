@@ -0,0 +1,294 @@
+"""
+Terraform Jobs - Background runner for plan / apply / destroy.
+
+WHAT THIS FILE DOES:
+1. Launches a command (terraform plan, apply, destroy) in a background thread,
+   or several commands in sequence (e.g. init, then plan)
+2. Captures stdout/stderr line by line as it is produced: the full output
+   goes to a log file on disk, memory keeps only the last lines for display
+3. Enforces a timeout and supports cancellation
+4. Keeps a bounded history of finished jobs with their durations and the
+   time spent in each step
+
+web.py polls the current job to stream its output into the
+"Terraform Output" panel while the user keeps chatting.
+
+This module has no Streamlit dependency, so it can be exercised with a
+fake `terraform` executable on PATH (or PROMPTOPS_TERRAFORM_BIN).
+"""
+
+import os
+import time
+import itertools
+import threading
+import subprocess
+from collections import deque
+from pathlib import Path
+from typing import Callable, Optional
+
+
+# Command used for every Terraform invocation
+TERRAFORM_BIN = os.getenv("PROMPTOPS_TERRAFORM_BIN", "terraform")
+
+# Output lines kept in memory per job; the rest is only in the log file
+TAIL_LINES = int(os.getenv("PROMPTOPS_JOB_TAIL_LINES", "2000"))
+
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+TIMED_OUT = "timed out"
+CANCELLED = "cancelled"
+
+_job_ids = itertools.count(1)
+
+
+class Job:
+    """
+    One background command and everything it printed.
+
+    With steps=[(phase, args), ...] the commands run one after another in
+    the same job (stopping at the first failure) and phases records the
+    seconds spent in each. A step (phase, args, sink) hands the command's
+    stdout stream to sink(stream) instead of the output (e.g. to parse
+    `terraform show -json` without holding it in memory); its stderr is
+    still captured.
+
+    With log_file the complete output is written there; memory only keeps
+    the last TAIL_LINES lines.
+    """
+
+    def __init__(self, name: str, args: list[str], cwd: Path, timeout: float,
+                 on_finish: Optional[Callable[["Job"], None]] = None,
+                 steps: Optional[list[tuple]] = None,
+                 env: Optional[dict[str, str]] = None,
+                 log_file: Optional[Path] = None):
+        self.id = next(_job_ids)
+        self.name = name
+        self.args = args
+        self.steps = steps or [(name, args)]
+        self.env = env
+        self.phases: dict[str, float] = {}
+        self.cwd = Path(cwd)
+        self.timeout = timeout
+        self.on_finish = on_finish
+        self.status = RUNNING
+        self.returncode: Optional[int] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.log_file = Path(log_file) if log_file else None
+        self._log = None
+        self._lines: deque[str] = deque(maxlen=TAIL_LINES)
+        self._line_count = 0
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._proc: Optional[subprocess.Popen] = None
+        self._stop_reason: Optional[str] = None
+        self._thread = threading.Thread(target=self._run, name=f"job-{self.id}-{name}", daemon=True)
+
+    def start(self) -> "Job":
+        self._thread.start()
+        return self
+
+    def _append(self, line: str):
+        with self._lock:
+            self._lines.append(line)
+            self._line_count += 1
+            if self._log:
+                self._log.write(line + "\n")
+
+    def _run(self):
+        timer = threading.Timer(self.timeout, self._stop, args=(TIMED_OUT,))
+        timer.daemon = True
+        try:
+            if self.log_file:
+                self.log_file.parent.mkdir(parents=True, exist_ok=True)
+                self._log = open(self.log_file, "w", buffering=1)
+            timer.start()
+            for phase, args, *sink in self.steps:
+                if self._stop_reason:
+                    break
+                if len(self.steps) > 1:
+                    self._append(f"$ {' '.join(args)}")
+                phase_start = time.time()
+                self._proc = subprocess.Popen(
+                    args,
+                    cwd=self.cwd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE if sink else subprocess.STDOUT,
+                    text=True,
+                    bufsize=1,
+                    env=self.env,
+                )
+                if sink:
+                    self.returncode = self._consume(sink[0])
+                else:
+                    for line in self._proc.stdout:
+                        self._append(line.rstrip("\n"))
+                    self.returncode = self._proc.wait()
+                self.phases[phase] = self.phases.get(phase, 0.0) + time.time() - phase_start
+                if self.returncode != 0:
+                    break
+
+            if self._stop_reason:
+                self.status = self._stop_reason
+                self._append(f"Error: {self.name} {self._stop_reason}"
+                             + (f" after {self.timeout:g}s" if self._stop_reason == TIMED_OUT else ""))
+            else:
+                self.status = SUCCEEDED if self.returncode == 0 else FAILED
+        except Exception as e:
+            self.status = FAILED
+            self._append(f"Error: {e}")
+        finally:
+            timer.cancel()
+            if self._log:
+                with self._lock:
+                    self._log.close()
+                    self._log = None
+            self.finished_at = time.time()
+            self._done.set()
+            if self.on_finish:
+                try:
+                    self.on_finish(self)
+                except Exception:
+                    pass
+
+    def _consume(self, sink: Callable) -> int:
+        """
+        Feed stdout to sink; a sink error fails the step. stderr is drained
+        on its own thread meanwhile, so a chatty command cannot fill its
+        pipe and block while the sink waits for more stdout.
+        """
+        def drain():
+            for line in self._proc.stderr:
+                self._append(line.rstrip("\n"))
+
+        stderr_thread = threading.Thread(target=drain, name=f"job-{self.id}-stderr", daemon=True)
+        stderr_thread.start()
+        try:
+            sink(self._proc.stdout)
+        except Exception as e:
+            self._append(f"Error: {e}")
+            self._proc.kill()
+            self._proc.wait()
+            stderr_thread.join()
+            return 1
+        returncode = self._proc.wait()
+        stderr_thread.join()
+        return returncode
+
+    def _stop(self, reason: str):
+        if self._done.is_set():
+            return
+        self._stop_reason = reason
+        if self._proc is None:
+            return
+        self._proc.terminate()
+        try:
+            self._proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+
+    def cancel(self):
+        """Stop the command if it is still running."""
+        self._stop(CANCELLED)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job finishes. Returns False on timeout."""
+        return self._done.wait(timeout)
+
+    @property
+    def running(self) -> bool:
+        return not self._done.is_set()
+
+    @property
+    def duration(self) -> float:
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def line_count(self) -> int:
+        with self._lock:
+            return self._line_count
+
+    def lines(self, start: int = 0) -> list[str]:
+        """Output lines from index start onward (for incremental polling), as far as still in memory."""
+        with self._lock:
+            dropped = self._line_count - len(self._lines)
+            return list(self._lines)[max(0, start - dropped):]
+
+    def output(self) -> str:
+        """The complete output: from the log file when there is one."""
+        if self.log_file and not self.running:
+            try:
+                return self.log_file.read_text().rstrip("\n")
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            return "\n".join(self._lines)
+
+    def tail(self, n: int = 200) -> str:
+        with self._lock:
+            return "\n".join(list(self._lines)[-n:])
+
+    def phase_text(self) -> str:
+        """e.g. "init 12.0s, plan 3.1s" ("" before the first step finishes)."""
+        return ", ".join(f"{phase} {seconds:.1f}s" for phase, seconds in self.phases.items())
+
+    def summary(self) -> dict:
+        return {
+            "job": self.id,
+            "command": self.name,
+            "status": self.status,
+            "exit code": self.returncode,
+            "duration (s)": round(self.duration, 1),
+            "phases": self.phase_text(),
+            "started": time.strftime("%H:%M:%S", time.localtime(self.started_at)),
+        }
+
+
+class JobRunner:
+    """
+    Runs at most one Terraform job at a time (they share state and its lock)
+    and remembers the most recent ones.
+    """
+
+    def __init__(self, max_history: int = 20, log_dir: Optional[Path] = None):
+        self._history: deque[Job] = deque(maxlen=max_history)
+        # Each job logs to log_dir/job-<id>-<name>.log; logs leave with their job
+        self.log_dir = Path(log_dir) if log_dir else None
+        self._lock = threading.Lock()
+
+    @property
+    def current(self) -> Optional[Job]:
+        """The most recently started job, running or not."""
+        return self._history[-1] if self._history else None
+
+    @property
+    def busy(self) -> bool:
+        job = self.current
+        return job is not None and job.running
+
+    @property
+    def history(self) -> list[Job]:
+        """Jobs, newest first."""
+        return list(reversed(self._history))
+
+    def start(self, name: str, args: list[str], cwd: Path, timeout: float,
+              on_finish: Optional[Callable[[Job], None]] = None,
+              steps: Optional[list[tuple]] = None,
+              env: Optional[dict[str, str]] = None) -> Job:
+        """Start a job. Raises RuntimeError if another job is still running."""
+        with self._lock:
+            if self.busy:
+                raise RuntimeError(f"terraform {self.current.name} is still running")
+            job = Job(name, args, cwd, timeout, on_finish, steps, env)
+            if self.log_dir:
+                job.log_file = self.log_dir / f"job-{job.id}-{name}.log"
+            if len(self._history) == self._history.maxlen and self._history[0].log_file:
+                self._history[0].log_file.unlink(missing_ok=True)
+            self._history.append(job)
+        return job.start()
+
+    def terraform(self, command: str, extra_args: list[str], cwd: Path, timeout: float,
+                  on_finish: Optional[Callable[[Job], None]] = None) -> Job:
+        """Start `terraform <command> <extra_args>`."""
+        return self.start(command, [TERRAFORM_BIN, command, *extra_args], cwd, timeout, on_finish)
@@ -0,0 +1,447 @@
+"""
+LLM Backend - One place that knows how to talk to the model.
+
+WHAT THIS FILE DOES:
+1. Picks the backend from the environment (OpenAI, local Ollama, or an
+   offline mock) - app.py, web.py and async_service.py used to each repeat
+   the PROMPTOPS_LOCAL switching
+2. Builds ONE client per process with a pooled, keep-alive HTTP connection
+   pool instead of a new client per Streamlit rerun
+3. Retries 429 / 5xx / connection errors with exponential backoff and full
+   jitter (honouring Retry-After), within a per-call deadline
+4. Stops calling a backend that keeps failing (circuit breaker) so users
+   get an immediate error instead of a minute of retries
+5. Provides a deterministic mock backend so the whole pipeline can be run
+   and benchmarked offline
+
+The backend exposes the same chat.completions.create() interface as the
+OpenAI client, so ChatStream and StructuredOutput work with it unchanged.
+Streams are retried only until the response starts, never mid-stream.
+
+CONFIGURATION:
+- PROMPTOPS_LLM_BACKEND=openai|local|mock   default: local if PROMPTOPS_LOCAL=true, else openai
+- PROMPTOPS_LLM_RETRIES=3                   retries after the first attempt
+- PROMPTOPS_LLM_BACKOFF=0.5                 base backoff in seconds (doubles per retry, max 8s)
+- PROMPTOPS_LLM_TIMEOUT=60                  deadline per call, retries included
+- PROMPTOPS_LLM_POOL_SIZE=20                pooled HTTP connections
+- PROMPTOPS_LLM_BREAKER_THRESHOLD=5         consecutive failures that open the circuit
+- PROMPTOPS_LLM_BREAKER_RESET=30            seconds before a trial call is allowed again
+- PROMPTOPS_MOCK_LATENCY=0                  mock: seconds before the first token
+- PROMPTOPS_MOCK_TOKENS_PER_S=0             mock: generation speed (0 = instant)
+"""
+
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Optional
+
+from history import estimate_tokens
+
+logger = logging.getLogger("promptops.llm")
+
+
+class LLMUnavailableError(RuntimeError):
+    """The circuit breaker is open; the backend is not being called."""
+
+
+@dataclass
+class RetryPolicy:
+    """How often and how patiently to retry one call."""
+    retries: int = 3
+    backoff: float = 0.5
+    max_backoff: float = 8.0
+    timeout: float = 60.0
+
+    def delay(self, attempt: int, error: Optional[Exception] = None) -> float:
+        """Full-jitter exponential backoff, or the server's Retry-After if it sent one."""
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    return getattr(error, "status_code", None)
+
+
+def _retry_after(error: Optional[Exception]) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """True for rate limits, server errors, timeouts and dropped connections."""
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    return (
+        isinstance(error, (ConnectionError, TimeoutError))
+        or type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+    )
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failed calls and rejects calls for
+    `reset_after` seconds; then lets a trial call through (half-open).
+    """
+
+    def __init__(self, threshold: int = 5, reset_after: float = 30.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.reset_after:
+                return "open"
+            return "half-open"
+
+    def before_call(self):
+        """Raise LLMUnavailableError while the circuit is open."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self.reset_after - (time.monotonic() - self._opened_at)
+            if remaining > 0:
+                raise LLMUnavailableError(
+                    f"LLM backend unavailable after {self._failures} consecutive failures; "
+                    f"retrying in {remaining:.0f}s"
+                )
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+
+
+class _Completions:
+    """chat.completions with retry, deadline and circuit breaker."""
+
+    def __init__(self, backend: "LLMBackend"):
+        self._backend = backend
+
+    def create(self, **kwargs):
+        backend = self._backend
+        deadline = time.monotonic() + kwargs.pop("timeout", backend.policy.timeout)
+        attempt = 0
+        while True:
+            backend.breaker.before_call()
+            remaining = deadline - time.monotonic()
+            try:
+                response = backend.raw.chat.completions.create(timeout=max(remaining, 0.1), **kwargs)
+            except Exception as e:
+                # One breaker failure per call: when it gives up, not per attempt
+                if not is_retryable(e):
+                    backend.breaker.failure()
+                    raise
+                delay = backend.policy.delay(attempt, e)
+                if attempt >= backend.policy.retries or time.monotonic() + delay >= deadline:
+                    backend.breaker.failure()
+                    raise
+                attempt += 1
+                backend.retries += 1
+                logger.info(f"LLM call failed ({e}); retry {attempt} in {delay:.2f}s")
+                time.sleep(delay)
+                continue
+            backend.breaker.success()
+            return response
+
+
+class _AsyncCompletions:
+    """Async chat.completions with retry, deadline and circuit breaker."""
+
+    def __init__(self, backend: "AsyncLLMBackend"):
+        self._backend = backend
+
+    async def create(self, **kwargs):
+        backend = self._backend
+        deadline = time.monotonic() + kwargs.pop("timeout", backend.policy.timeout)
+        attempt = 0
+        while True:
+            backend.breaker.before_call()
+            remaining = deadline - time.monotonic()
+            try:
+                response = await backend.raw.chat.completions.create(timeout=max(remaining, 0.1), **kwargs)
+            except Exception as e:
+                # One breaker failure per call: when it gives up, not per attempt
+                if not is_retryable(e):
+                    backend.breaker.failure()
+                    raise
+                delay = backend.policy.delay(attempt, e)
+                if attempt >= backend.policy.retries or time.monotonic() + delay >= deadline:
+                    backend.breaker.failure()
+                    raise
+                attempt += 1
+                backend.retries += 1
+                logger.info(f"LLM call failed ({e}); retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            backend.breaker.success()
+            return response
+
+
+class LLMBackend:
+    """
+    A configured model endpoint. Use it wherever an OpenAI client is expected:
+    backend.chat.completions.create(...).
+    """
+
+    def __init__(self, name: str, model: str, raw, policy: Optional[RetryPolicy] = None,
+                 breaker: Optional[CircuitBreaker] = None, supports_usage: bool = True,
+                 supports_structured: bool = True, supports_n: bool = False, description: str = ""):
+        self.name = name
+        self.model = model
+        self.raw = raw
+        self.policy = policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        # Whether the backend sends stream usage chunks, accepts json_schema
+        # response_format, and returns several choices for n > 1
+        self.supports_usage = supports_usage
+        self.supports_structured = supports_structured
+        self.supports_n = supports_n
+        self.description = description or f"{name}: {model}"
+        self.retries = 0
+        self.chat = SimpleNamespace(completions=self._completions())
+
+    def _completions(self):
+        return _Completions(self)
+
+    def close(self):
+        close = getattr(self.raw, "close", None)
+        if close:
+            close()
+
+
+class AsyncLLMBackend(LLMBackend):
+    """LLMBackend around an async client; chat.completions.create() is awaitable."""
+
+    def _completions(self):
+        return _AsyncCompletions(self)
+
+    async def close(self):
+        close = getattr(self.raw, "close", None)
+        if close:
+            await close()
+
+
+# -----------------------------------------------------------------------------
+# Mock backend
+# -----------------------------------------------------------------------------
+
+# Keyword -> (explanation, proposed vars); first match wins
+_MOCK_PROPOSALS = [
+    (("v100", "a100", "h100"), "The platform only allows nvidia-tesla-t4 GPUs, so this uses a T4.",
+     {"gpu_type": "nvidia-tesla-t4", "gpu_count": 1}),
+    (("port",), "Only SSH (22) and Streamlit (8501) can be opened; enabling Streamlit is the closest option.",
+     {"allow_streamlit": True}),
+    (("cheaper", "cost", "cheap"), "The smallest allowed shape keeps costs down.",
+     {"machine_type": "n1-standard-4", "gpu_count": 1, "disk_size_gb": 50}),
+    (("streamlit",), "Opening the Streamlit port (8501).",
+     {"allow_streamlit": True}),
+    (("encrypt",), "Enabling CMEK encryption for the boot disk.",
+     {"boot_disk_encrypted": True}),
+]
+_MOCK_DEFAULT = ("A single T4 GPU VM on the standard shape.",
+                 {"vm_count": 1, "machine_type": "n1-standard-4", "gpu_type": "nvidia-tesla-t4",
+                  "gpu_count": 1, "disk_size_gb": 100})
+
+
+def mock_proposal(messages: list[dict]) -> tuple[str, dict]:
+    """The deterministic (explanation, vars) the mock gives for a conversation."""
+    last_user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "").lower()
+    request = last_user.rsplit("user request:", 1)[-1]
+    for keywords, explanation, proposal in _MOCK_PROPOSALS:
+        if any(re.search(rf"\b{keyword}", request) for keyword in keywords):
+            return explanation, proposal
+    return _MOCK_DEFAULT
+
+
+def _mock_reply_text(messages: list[dict], structured: bool) -> str:
+    explanation, proposal = mock_proposal(messages)
+    if structured:
+        return json.dumps({"explanation": explanation, "terraform_vars": proposal})
+    return (f"{explanation}\n\n```json\n{json.dumps(proposal, indent=2)}\n```\n\n"
+            "Run a plan to review the change before applying it.")
+
+
+def _mock_pieces(text: str) -> list[str]:
+    # ~4 characters per token, like estimate_tokens()
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+
+def _mock_response(text: str, messages: list[dict]):
+    usage = SimpleNamespace(prompt_tokens=sum(estimate_tokens(m["content"]) for m in messages),
+                            completion_tokens=estimate_tokens(text))
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=usage)
+
+
+class MockLLM:
+    """
+    Deterministic offline stand-in for the OpenAI chat API.
+
+    Replies depend only on the last user message. latency is the delay
+    before the first token; tokens_per_s paces the rest (0 = instant).
+    """
+
+    def __init__(self, latency: float = 0.0, tokens_per_s: float = 0.0):
+        self.latency = latency
+        self.tokens_per_s = tokens_per_s
+        self.chat = SimpleNamespace(completions=self)
+
+    def _generation_s(self, text: str) -> float:
+        return estimate_tokens(text) / self.tokens_per_s if self.tokens_per_s else 0.0
+
+    def create(self, messages: list[dict], stream: bool = False, response_format=None,
+               stream_options: Optional[dict] = None, **kwargs):
+        text = _mock_reply_text(messages, structured=response_format is not None)
+        if stream:
+            return self._stream(text, messages, bool(stream_options and stream_options.get("include_usage")))
+        time.sleep(self.latency + self._generation_s(text))
+        return _mock_response(text, messages)
+
+    def _stream(self, text: str, messages: list[dict], include_usage: bool):
+        time.sleep(self.latency)
+        delay = 1 / self.tokens_per_s if self.tokens_per_s else 0.0
+        for piece in _mock_pieces(text):
+            if delay:
+                time.sleep(delay)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))], usage=None)
+        if include_usage:
+            yield SimpleNamespace(choices=[], usage=_mock_response(text, messages).usage)
+
+
+class AsyncMockLLM(MockLLM):
+    """MockLLM with an awaitable create(); a stream is an async iterator of chunks."""
+
+    async def create(self, messages: list[dict], stream: bool = False, response_format=None,
+                     stream_options: Optional[dict] = None, **kwargs):
+        text = _mock_reply_text(messages, structured=response_format is not None)
+        if stream:
+            return self._astream(text, messages, bool(stream_options and stream_options.get("include_usage")))
+        await asyncio.sleep(self.latency + self._generation_s(text))
+        return _mock_response(text, messages)
+
+    async def _astream(self, text: str, messages: list[dict], include_usage: bool):
+        await asyncio.sleep(self.latency)
+        delay = 1 / self.tokens_per_s if self.tokens_per_s else 0.0
+        for piece in _mock_pieces(text):
+            if delay:
+                await asyncio.sleep(delay)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))], usage=None)
+        if include_usage:
+            yield SimpleNamespace(choices=[], usage=_mock_response(text, messages).usage)
+
+
+# -----------------------------------------------------------------------------
+# Construction from the environment
+# -----------------------------------------------------------------------------
+
+def _http_client(is_async: bool):
+    """A keep-alive connection pool for the OpenAI SDK (None = SDK default)."""
+    pool_size = int(os.getenv("PROMPTOPS_LLM_POOL_SIZE", "20"))
+    try:
+        import httpx
+        from openai import DefaultAsyncHttpxClient, DefaultHttpxClient
+    except ImportError:
+        return None
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size, keepalive_expiry=60)
+    return (DefaultAsyncHttpxClient if is_async else DefaultHttpxClient)(limits=limits)
+
+
+def backend_name_from_env() -> str:
+    name = os.getenv("PROMPTOPS_LLM_BACKEND", "").lower()
+    if name:
+        return name
+    return "local" if os.getenv("PROMPTOPS_LOCAL", "").lower() == "true" else "openai"
+
+
+def backend_from_env(is_async: bool = False) -> LLMBackend:
+    """
+    Build the configured backend. Raises ValueError if it is misconfigured
+    (e.g. OPENAI_API_KEY missing).
+    """
+    name = backend_name_from_env()
+    policy = RetryPolicy(
+        retries=int(os.getenv("PROMPTOPS_LLM_RETRIES", "3")),
+        backoff=float(os.getenv("PROMPTOPS_LLM_BACKOFF", "0.5")),
+        timeout=float(os.getenv("PROMPTOPS_LLM_TIMEOUT", "60")),
+    )
+    breaker = CircuitBreaker(
+        threshold=int(os.getenv("PROMPTOPS_LLM_BREAKER_THRESHOLD", "5")),
+        reset_after=float(os.getenv("PROMPTOPS_LLM_BREAKER_RESET", "30")),
+    )
+    backend_cls = AsyncLLMBackend if is_async else LLMBackend
+
+    if name == "mock":
+        mock_cls = AsyncMockLLM if is_async else MockLLM
+        raw = mock_cls(
+            latency=float(os.getenv("PROMPTOPS_MOCK_LATENCY", "0")),
+            tokens_per_s=float(os.getenv("PROMPTOPS_MOCK_TOKENS_PER_S", "0")),
+        )
+        return backend_cls("mock", "mock", raw, policy, breaker, description="offline mock model")
+
+    try:
+        from openai import AsyncOpenAI, OpenAI
+    except ImportError:
+        raise ValueError("openai package not installed. Run: pip install -r requirements.txt")
+    client_cls = AsyncOpenAI if is_async else OpenAI
+
+    if name == "local":
+        local_url = os.getenv("PROMPTOPS_LOCAL_URL", "http://localhost:11434/v1")
+        model = os.getenv("PROMPTOPS_LOCAL_MODEL", "llama3.1")
+        # Retries are ours; the SDK's own retry loop is turned off
+        raw = client_cls(base_url=local_url, api_key="ollama", max_retries=0, http_client=_http_client(is_async))
+        return backend_cls("local", model, raw, policy, breaker, supports_usage=False,
+                           supports_structured=False, description=f"local model {model} via {local_url}")
+
+    if name != "openai":
+        raise ValueError(f"Unknown PROMPTOPS_LLM_BACKEND: {name} (expected openai, local or mock)")
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError(
+            "OPENAI_API_KEY environment variable not set.\n"
+            "Set OPENAI_API_KEY for OpenAI, or PROMPTOPS_LOCAL=true for Ollama.\n"
+            "This service should NEVER have GCP, AWS, or Ansible credentials."
+        )
+    model = os.getenv("PROMPTOPS_MODEL", "gpt-4o")
+    raw = client_cls(api_key=api_key, max_retries=0, http_client=_http_client(is_async))
+    return backend_cls("openai", model, raw, policy, breaker, supports_n=True, description=f"OpenAI {model}")
+
+
+_backend: Optional[LLMBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> LLMBackend:
+    """The process-wide synchronous backend (one connection pool per process)."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = backend_from_env()
+        return _backend
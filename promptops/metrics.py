@@ -0,0 +1,267 @@
+"""
+Metrics - Token accounting and latency instrumentation.
+
+WHAT THIS FILE DOES:
+1. Records one RequestMetrics per LLM request (tokens, latencies, cache hit)
+2. Aggregates them into counters and histograms
+3. Counts requests answered by the local fast path (fast_path.py) and
+   those that fell through to the LLM, for the hit rate
+4. Renders the aggregate in Prometheus text exposition format
+
+EXPOSURE:
+- PROMPTOPS_METRICS_FILE=/path/promptops.prom   rewritten after every request
+  (suitable for the node_exporter textfile collector)
+- PROMPTOPS_METRICS_PORT=9464                    serves /metrics over HTTP
+- web.py shows the latest requests in the PROMPTOPS_DEBUG_CONTEXT panel
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+from history import estimate_tokens
+
+logger = logging.getLogger("promptops.metrics")
+
+
+# Histogram buckets (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+@dataclass
+class RequestMetrics:
+    """Measurements for a single LLM request."""
+    source: str = "web"
+    model: str = ""
+    cached: bool = False
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    context_tokens: int = 0
+    context_saved_tokens: int = 0
+    history_tokens: int = 0
+    prefix_tokens: int = 0
+    cached_tokens: int = 0
+    tokens_estimated: bool = True
+    context_build_s: float = 0.0
+    first_token_s: Optional[float] = None
+    total_s: float = 0.0
+    json_extract_s: float = 0.0
+    timestamp: float = 0.0
+
+
+def fill_token_counts(metrics: RequestMetrics, messages: list[dict], response_text: str, usage=None):
+    """
+    Set prompt/completion token counts on metrics.
+
+    Uses the API-reported usage when available, otherwise estimates from text.
+    """
+    if usage is not None and getattr(usage, "prompt_tokens", None) is not None:
+        metrics.prompt_tokens = usage.prompt_tokens
+        metrics.completion_tokens = usage.completion_tokens or 0
+        metrics.tokens_estimated = False
+        # Prompt tokens the provider served from its prefix cache
+        details = getattr(usage, "prompt_tokens_details", None)
+        metrics.cached_tokens = getattr(details, "cached_tokens", None) or 0
+    else:
+        metrics.prompt_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+        metrics.completion_tokens = estimate_tokens(response_text)
+        metrics.tokens_estimated = True
+
+
+class _Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.total += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def render(self, name: str, labels: str) -> list[str]:
+        sep = "," if labels else ""
+        lines = [
+            f'{name}_bucket{{{labels}{sep}le="{bound}"}} {count}'
+            for bound, count in zip(self.buckets, self.counts)
+        ]
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.total:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+_COUNTERS = {
+    "promptops_requests_total": "LLM requests handled",
+    "promptops_prompt_tokens_total": "Prompt tokens sent to the LLM",
+    "promptops_completion_tokens_total": "Completion tokens received from the LLM",
+    "promptops_context_tokens_total": "Prompt tokens spent on platform context",
+    "promptops_context_saved_tokens_total": "Platform context tokens left out by relevance pruning (estimated)",
+    "promptops_history_tokens_total": "Prompt tokens spent on conversation history",
+    "promptops_prefix_tokens_total": "Prompt tokens in the static, cacheable prompt prefix (estimated)",
+    "promptops_cached_prompt_tokens_total": "Prompt tokens the provider served from its prompt cache",
+    "promptops_fast_path_requests_total": "Requests checked by the local fast path, by result (hit/miss)",
+}
+
+_HISTOGRAMS = {
+    "promptops_llm_latency_seconds": ("total_s", "Total LLM request latency"),
+    "promptops_first_token_seconds": ("first_token_s", "Time to first token"),
+    "promptops_context_build_seconds": ("context_build_s", "Platform context build time"),
+    "promptops_json_extract_seconds": ("json_extract_s", "JSON extraction time"),
+}
+
+
+class MetricsRegistry:
+    """Thread-safe aggregate of RequestMetrics with Prometheus rendering."""
+
+    def __init__(self, keep_recent: int = 50, textfile: Optional[Path] = None):
+        self._lock = threading.Lock()
+        self.recent: deque[RequestMetrics] = deque(maxlen=keep_recent)
+        self.textfile = Path(textfile) if textfile else None
+        self._counters: dict[tuple[str, str], float] = {}
+        self._histograms: dict[tuple[str, str], _Histogram] = {}
+        self._fast_path = {"hit": 0, "miss": 0}
+
+    def record(self, metrics: RequestMetrics):
+        if not metrics.timestamp:
+            metrics.timestamp = time.time()
+        labels = f'source="{metrics.source}",cached="{str(metrics.cached).lower()}"'
+        with self._lock:
+            self.recent.append(metrics)
+            for name, value in (
+                ("promptops_requests_total", 1),
+                ("promptops_prompt_tokens_total", metrics.prompt_tokens),
+                ("promptops_completion_tokens_total", metrics.completion_tokens),
+                ("promptops_context_tokens_total", metrics.context_tokens),
+                ("promptops_context_saved_tokens_total", metrics.context_saved_tokens),
+                ("promptops_history_tokens_total", metrics.history_tokens),
+                ("promptops_prefix_tokens_total", metrics.prefix_tokens),
+                ("promptops_cached_prompt_tokens_total", metrics.cached_tokens),
+            ):
+                self._counters[(name, labels)] = self._counters.get((name, labels), 0) + value
+            for name, (attr, _) in _HISTOGRAMS.items():
+                value = getattr(metrics, attr)
+                if value is not None:
+                    self._histograms.setdefault((name, labels), _Histogram()).observe(value)
+        if self.textfile:
+            self.write_textfile(self.textfile)
+
+    def record_fast_path(self, intent: Optional[str], duration_s: float):
+        """Count one fast-path lookup: a hit for intent, a miss (sent to the LLM) for None."""
+        result = "hit" if intent else "miss"
+        labels = f'result="{result}",intent="{intent or ""}"'
+        with self._lock:
+            self._fast_path[result] += 1
+            key = ("promptops_fast_path_requests_total", labels)
+            self._counters[key] = self._counters.get(key, 0) + 1
+            self._histograms.setdefault(("promptops_fast_path_seconds", f'result="{result}"'),
+                                        _Histogram()).observe(duration_s)
+        if self.textfile:
+            self.write_textfile(self.textfile)
+
+    def fast_path_stats(self) -> dict:
+        """Fast-path hits, misses and hit rate (None before the first lookup)."""
+        with self._lock:
+            hits, misses = self._fast_path["hit"], self._fast_path["miss"]
+        return {"hits": hits, "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else None}
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, help_text in _COUNTERS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for (metric, labels), value in sorted(self._counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{{{labels}}} {value if isinstance(value, int) else repr(value)}")
+            for name, (_, help_text) in _HISTOGRAMS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, labels), hist in sorted(self._histograms.items(), key=lambda kv: kv[0]):
+                    if metric == name:
+                        lines.extend(hist.render(name, labels))
+            lines.append("# HELP promptops_fast_path_seconds Time to classify and resolve a request locally")
+            lines.append("# TYPE promptops_fast_path_seconds histogram")
+            for (metric, labels), hist in sorted(self._histograms.items(), key=lambda kv: kv[0]):
+                if metric == "promptops_fast_path_seconds":
+                    lines.extend(hist.render(metric, labels))
+            hits, misses = self._fast_path["hit"], self._fast_path["miss"]
+            lines.append("# HELP promptops_fast_path_hit_ratio Share of requests answered without an LLM call")
+            lines.append("# TYPE promptops_fast_path_hit_ratio gauge")
+            lines.append(f"promptops_fast_path_hit_ratio {hits / (hits + misses) if hits + misses else 0:g}")
+        return "\n".join(lines) + "\n"
+
+    def recent_rows(self) -> list[dict]:
+        """Recent requests, newest first, as plain dicts for display."""
+        with self._lock:
+            return [asdict(m) for m in reversed(self.recent)]
+
+    def write_textfile(self, path: Path):
+        """Atomically write the Prometheus text to path."""
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(path.suffix + ".tmp")
+            tmp.write_text(self.render_prometheus())
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Could not write metrics file {path}: {e}")
+
+
+_registry = MetricsRegistry(textfile=os.getenv("PROMPTOPS_METRICS_FILE") or None)
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def get_registry() -> MetricsRegistry:
+    """Return the process-wide metrics registry."""
+    return _registry
+
+
+def start_metrics_server(port: int, registry: Optional[MetricsRegistry] = None) -> ThreadingHTTPServer:
+    """Serve GET /metrics on a daemon thread. Safe to call more than once."""
+    global _server
+    if _server is not None:
+        return _server
+    registry = registry or _registry
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    _server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    logger.info(f"Metrics available at http://127.0.0.1:{port}/metrics")
+    return _server
+
+
+def start_metrics_server_from_env() -> Optional[ThreadingHTTPServer]:
+    """Start the /metrics server if PROMPTOPS_METRICS_PORT is set."""
+    port = os.getenv("PROMPTOPS_METRICS_PORT")
+    if not port:
+        return None
+    try:
+        return start_metrics_server(int(port))
+    except OSError as e:
+        logger.warning(f"Could not start metrics server on port {port}: {e}")
+        return None
@@ -0,0 +1,239 @@
+"""
+Plan Cache - Reuse `terraform plan` results while nothing has changed.
+
+WHAT THIS FILE DOES:
+1. Computes a key from everything a plan depends on locally: every .tf
+   file under terraform/ (modules included), terraform.tfvars and
+   *.auto.tfvars, .terraform.lock.hcl, the selected workspace, and the
+   state serial and lineage
+2. Keeps the output, the binary plan (`terraform plan -out`) and the
+   resource-change summary (plan_summary.py) of the last successful plans
+   under that key
+3. Returns a stored plan instantly when the key is unchanged, so "Run Plan"
+   after a no-op chat turn costs nothing
+4. Lets apply use the stored plan file, so what is applied is exactly what
+   was reviewed
+
+Quick (-refresh=false) plans are stored under their own key variant and
+are never used for apply.
+
+Files are only re-hashed when their mtime or size changes. Any change to an
+input gives a new key, so stale plans are never returned. A plan whose
+inputs changed while it was running is not stored.
+
+Terraform also refreshes remote resources during plan; drift outside
+Terraform is not visible locally, so entries expire after a TTL, and
+apply/destroy clear the cache. Remote backends have no local state serial;
+for them the TTL is the only guard against another operator's apply.
+
+CONFIGURATION:
+- PROMPTOPS_PLAN_CACHE=false        always run a fresh plan
+- PROMPTOPS_PLAN_CACHE_TTL=900      seconds a stored plan stays valid
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Optional
+
+from plan_summary import PlanSummary
+from terraform_runner import in_data_dir
+
+logger = logging.getLogger("promptops.plan_cache")
+
+PLAN_FILE = "plan.tfplan"
+OUTPUT_FILE = "output.txt"
+SUMMARY_FILE = "summary.json"
+META_FILE = "meta.json"
+
+
+@dataclass
+class CachedPlan:
+    """A successful plan stored under its input key."""
+    key: str
+    plan_file: str
+    output_file: str
+    created_at: float
+    duration_s: float
+    refreshed: bool = True
+    summary_file: str = ""
+
+    def output(self) -> str:
+        try:
+            return Path(self.output_file).read_text()
+        except FileNotFoundError:
+            return ""
+
+    def summary(self) -> Optional[PlanSummary]:
+        return PlanSummary.load(Path(self.summary_file)) if self.summary_file else None
+
+
+class PlanCache:
+    """Stored plans for one Terraform directory, keyed on their inputs."""
+
+    def __init__(self, terraform_dir: Path, cache_dir: Path, max_entries: int = 10,
+                 ttl_seconds: float = 900, enabled: bool = True):
+        self.terraform_dir = Path(terraform_dir)
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # path -> (mtime_ns, size, sha256): unchanged files are never re-read
+        self._hashes: dict[str, tuple[int, int, str]] = {}
+        self._state: Optional[tuple[tuple, str]] = None
+
+    def _inputs(self) -> list[Path]:
+        tf_dir = self.terraform_dir
+        paths = [p for p in tf_dir.rglob("*.tf") if not in_data_dir(p.relative_to(tf_dir))]
+        paths.extend(tf_dir.glob("*.auto.tfvars"))
+        paths.extend(p for p in (tf_dir / "terraform.tfvars", tf_dir / ".terraform.lock.hcl") if p.exists())
+        return sorted(paths)
+
+    def _file_hash(self, path: Path) -> str:
+        stat = path.stat()
+        cached = self._hashes.get(str(path))
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()
+        self._hashes[str(path)] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
+
+    def _state_identity(self) -> str:
+        """Workspace plus lineage/serial of the local state ("" parts when absent)."""
+        workspace_file = self.terraform_dir / ".terraform" / "environment"
+        workspace = workspace_file.read_text().strip() if workspace_file.exists() else "default"
+        state_file = (
+            self.terraform_dir / "terraform.tfstate" if workspace == "default"
+            else self.terraform_dir / "terraform.tfstate.d" / workspace / "terraform.tfstate"
+        )
+        try:
+            stat = state_file.stat()
+        except FileNotFoundError:
+            return f"{workspace}:no-local-state"
+
+        fingerprint = (str(state_file), stat.st_mtime_ns, stat.st_size)
+        if self._state and self._state[0] == fingerprint:
+            return self._state[1]
+        try:
+            state = json.loads(state_file.read_text() or "{}")
+            identity = f"{workspace}:{state.get('lineage', '')}:{state.get('serial', '')}"
+        except (OSError, json.JSONDecodeError):
+            # Mid-write or unreadable: never match a stored plan
+            identity = f"{workspace}:unreadable:{time.time()}"
+        self._state = (fingerprint, identity)
+        return identity
+
+    def key(self, variant: str = "") -> str:
+        """
+        Hash of every local input of `terraform plan`. variant separates
+        plans of the same inputs made with different flags (e.g. "quick").
+        """
+        with self._lock:
+            digest = hashlib.sha256(f"variant\0{variant}\n".encode())
+            for path in self._inputs():
+                try:
+                    file_hash = self._file_hash(path)
+                except FileNotFoundError:
+                    continue
+                digest.update(f"{path.relative_to(self.terraform_dir)}\0{file_hash}\n".encode())
+            digest.update(f"state\0{self._state_identity()}\n".encode())
+            return digest.hexdigest()
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.cache_dir / key[:32]
+
+    def plan_path(self, key: str) -> Path:
+        """Where `terraform plan -out` should write the plan for key."""
+        entry = self._entry_dir(key)
+        entry.mkdir(parents=True, exist_ok=True)
+        # A half-written entry from an earlier run must not look complete
+        (entry / META_FILE).unlink(missing_ok=True)
+        return entry / PLAN_FILE
+
+    def get(self, key: str) -> Optional[CachedPlan]:
+        """The stored plan for key, or None on miss, expiry or bypass."""
+        if not self.enabled:
+            return None
+        entry = self._entry_dir(key)
+        # Under the lock that guards the entries, so concurrent plans count correctly
+        with self._lock:
+            try:
+                meta = json.loads((entry / META_FILE).read_text())
+                plan = CachedPlan(**meta)
+            except (OSError, json.JSONDecodeError, TypeError):
+                self.misses += 1
+                return None
+            if plan.key != key or not Path(plan.plan_file).exists() or time.time() - plan.created_at > self.ttl_seconds:
+                self.discard(key)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return plan
+
+    def store(self, key: str, output_file: Optional[Path], returncode: int, duration_s: float,
+              variant: str = "", refreshed: bool = True,
+              summary_file: Optional[Path] = None) -> Optional[CachedPlan]:
+        """
+        Record a finished plan, copying its output log and summary file into
+        the entry. Only successful plans whose inputs are still unchanged are
+        kept; anything else is discarded. refreshed=False marks a
+        -refresh=false plan, which apply must not use.
+        """
+        entry = self._entry_dir(key)
+        if not self.enabled or returncode != 0 or not (entry / PLAN_FILE).exists() or self.key(variant) != key:
+            self.discard(key)
+            return None
+        plan = CachedPlan(
+            key=key,
+            plan_file=str(entry / PLAN_FILE),
+            output_file=str(entry / OUTPUT_FILE),
+            created_at=time.time(),
+            duration_s=duration_s,
+            refreshed=refreshed,
+        )
+        for source, name in ((output_file, OUTPUT_FILE), (summary_file, SUMMARY_FILE)):
+            if source and Path(source).exists():
+                shutil.copyfile(source, entry / name)
+        if (entry / SUMMARY_FILE).exists():
+            plan.summary_file = str(entry / SUMMARY_FILE)
+        tmp = entry / (META_FILE + ".tmp")
+        tmp.write_text(json.dumps(asdict(plan)))
+        os.replace(tmp, entry / META_FILE)
+        self._evict()
+        return plan
+
+    def discard(self, key: str):
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def invalidate(self):
+        """Drop every stored plan (after apply/destroy)."""
+        with self._lock:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def _evict(self):
+        with self._lock:
+            entries = sorted(
+                (p for p in self.cache_dir.iterdir() if (p / META_FILE).exists()),
+                key=lambda p: (p / META_FILE).stat().st_mtime,
+            )
+            for stale in entries[:-self.max_entries] if self.max_entries else entries:
+                shutil.rmtree(stale, ignore_errors=True)
+
+
+def plan_cache_from_env(terraform_dir: Path, cache_dir: Path) -> PlanCache:
+    """PlanCache configured from PROMPTOPS_PLAN_CACHE / PROMPTOPS_PLAN_CACHE_TTL."""
+    return PlanCache(
+        terraform_dir,
+        cache_dir,
+        ttl_seconds=float(os.getenv("PROMPTOPS_PLAN_CACHE_TTL", "900")),
+        enabled=os.getenv("PROMPTOPS_PLAN_CACHE", "true").lower() != "false",
+    )
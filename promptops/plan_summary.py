@@ -0,0 +1,284 @@
+"""
+Plan Summary - Compact resource-change summary of a Terraform plan.
+
+WHAT THIS FILE DOES:
+1. Reads `terraform show -json <planfile>` as a stream, in fixed-size chunks
+2. Picks out only resource_changes, resource_drift, output_changes and the
+   version fields; prior_state, planned_values and configuration (the bulk
+   of a large plan) are scanned past without being kept
+3. Reduces each resource change to its address, action (create, update,
+   replace, delete, read) and the attributes that change, with short
+   before/after values
+4. Stores the summary as a small JSON file that the web UI pages through
+
+Memory use is bounded by the largest single resource change, not by the
+size of the plan.
+"""
+
+import os
+import re
+import json
+import logging
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Callable, Optional, TextIO
+
+logger = logging.getLogger("promptops.plan_summary")
+
+CHUNK_SIZE = 64 * 1024
+
+# Attributes listed per resource and characters per before/after value
+MAX_ATTRIBUTES = 50
+MAX_VALUE_CHARS = 120
+
+ACTIONS = ("create", "update", "replace", "delete", "read")
+ACTION_SYMBOLS = {"create": "+", "update": "~", "replace": "-/+", "delete": "-", "read": "<="}
+
+# A JSON string (group 1 is None if the chunk ends inside it) or a structural character
+_TOKEN_RE = re.compile(r'"(?:[^"\\]|\\.)*(")?|[\[\]{},:]', re.S)
+_STRING_REST_RE = re.compile(r'(?:[^"\\]|\\.)*(")?', re.S)
+
+# Top-level keys kept whole, and top-level arrays read element by element
+_VALUE_KEYS = frozenset({"format_version", "terraform_version", "errored", "output_changes"})
+_ELEMENT_KEYS = frozenset({"resource_changes", "resource_drift"})
+
+
+@dataclass
+class ResourceChange:
+    """One resource that the plan changes."""
+    address: str
+    action: str
+    type: str = ""
+    module: str = ""
+    # attribute -> [before, after], values shortened to MAX_VALUE_CHARS
+    attributes: dict[str, list[str]] = field(default_factory=dict)
+    replace_paths: list[str] = field(default_factory=list)
+
+
+@dataclass
+class PlanSummary:
+    """What a plan does, without the plan."""
+    terraform_version: str = ""
+    format_version: str = ""
+    errored: bool = False
+    counts: dict[str, int] = field(default_factory=lambda: {action: 0 for action in ACTIONS})
+    changes: list[ResourceChange] = field(default_factory=list)
+    unchanged: int = 0
+    drift: int = 0
+    outputs: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def total(self) -> int:
+        return len(self.changes)
+
+    def headline(self) -> str:
+        """e.g. "2 to add, 1 to change, 1 to replace, 0 to destroy"."""
+        if not self.changes:
+            return "No changes"
+        c = self.counts
+        text = f"{c['create']} to add, {c['update']} to change, {c['replace']} to replace, {c['delete']} to destroy"
+        if c["read"]:
+            text += f", {c['read']} to read"
+        return text
+
+    def save(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(asdict(self)))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["PlanSummary"]:
+        try:
+            data = json.loads(Path(path).read_text())
+        except (OSError, json.JSONDecodeError):
+            return None
+        data["changes"] = [ResourceChange(**change) for change in data.get("changes", [])]
+        return cls(**data)
+
+
+def action_of(actions: list[str]) -> str:
+    """Terraform's actions list as one word ("no-op" for nothing to do)."""
+    if "delete" in actions and "create" in actions:
+        return "replace"
+    for action in ("create", "update", "delete", "read"):
+        if action in actions:
+            return action
+    return "no-op"
+
+
+def _short(value) -> str:
+    text = json.dumps(value, sort_keys=True) if not isinstance(value, str) else value
+    return text if len(text) <= MAX_VALUE_CHARS else text[:MAX_VALUE_CHARS - 1] + "…"
+
+
+def _flag(mask, name: str) -> bool:
+    """True if a before_sensitive/after_unknown style mask marks attribute name."""
+    return mask is True or (isinstance(mask, dict) and bool(mask.get(name)))
+
+
+def resource_change(rc: dict) -> Optional[ResourceChange]:
+    """Compact form of one resource_changes entry; None for no-ops."""
+    change = rc.get("change") or {}
+    action = action_of(change.get("actions") or [])
+    if action == "no-op":
+        return None
+
+    before = change.get("before") if isinstance(change.get("before"), dict) else {}
+    after = change.get("after") if isinstance(change.get("after"), dict) else {}
+    unknown = change.get("after_unknown") or {}
+    attributes: dict[str, list[str]] = {}
+    for name in sorted(set(before) | set(after) | (set(unknown) if isinstance(unknown, dict) else set())):
+        if len(attributes) >= MAX_ATTRIBUTES:
+            break
+        if _flag(unknown, name):
+            new = "(known after apply)"
+        elif _flag(change.get("after_sensitive"), name):
+            new = "(sensitive)"
+        else:
+            new = _short(after.get(name))
+        old = "(sensitive)" if _flag(change.get("before_sensitive"), name) else _short(before.get(name))
+        if action in ("create", "delete") or old != new:
+            attributes[name] = [old if action != "create" else "", new if action != "delete" else ""]
+
+    return ResourceChange(
+        address=rc.get("address", ""),
+        action=action,
+        type=rc.get("type", ""),
+        module=rc.get("module_address", ""),
+        attributes=attributes,
+        replace_paths=[".".join(str(p) for p in path) for path in change.get("replace_paths") or []],
+    )
+
+
+class _PlanScanner:
+    """
+    Incremental scanner over the plan JSON document.
+
+    Only the structure is tracked (strings and brackets, matched by one
+    regex); values are json-decoded only for the keys above. The buffer is
+    trimmed after every chunk to the part still needed.
+    """
+
+    def __init__(self, summary: PlanSummary):
+        self.summary = summary
+        self.buf = ""
+        self.pos = 0
+        self.depth = 0
+        self.expect_key = False
+        self.key: Optional[str] = None
+        self.value_start: Optional[int] = None
+        self.element_start: Optional[int] = None
+        # Set while a string runs past the end of the buffer
+        self.in_string = False
+        self.string_start: Optional[int] = None
+
+    def feed(self, chunk: str):
+        self.buf += chunk
+        buf = self.buf
+        pos = self.pos
+        if self.in_string:
+            # Resume inside the string instead of re-scanning it from its start
+            match = _STRING_REST_RE.match(buf, pos)
+            pos = match.end()
+            if match.group(1) is not None:
+                self.in_string = False
+                self._string(buf, self.string_start, pos)
+        if not self.in_string:
+            pos = self._scan(buf, pos)
+
+        keep = min(p for p in (pos, self.value_start, self.element_start, self.string_start) if p is not None)
+        self.buf = buf[keep:]
+        self.pos = pos - keep
+        for name in ("value_start", "element_start", "string_start"):
+            if getattr(self, name) is not None:
+                setattr(self, name, getattr(self, name) - keep)
+
+    def _scan(self, buf: str, pos: int) -> int:
+        for match in _TOKEN_RE.finditer(buf, pos):
+            token = match.group()
+            pos = match.end()
+            if token[0] == '"':
+                if match.group(1) is None:
+                    # Continues in the next chunk; keep its start only if it is a key
+                    self.in_string = True
+                    self.string_start = match.start() if self.depth == 1 and self.expect_key else None
+                    break
+                self._string(buf, match.start(), pos)
+            elif token in "{[":
+                self.depth += 1
+                if self.depth == 1:
+                    self.expect_key = True
+                elif self.depth == 3 and token == "{" and self.key in _ELEMENT_KEYS:
+                    self.element_start = match.start()
+            elif token in "}]":
+                if self.depth == 3 and self.element_start is not None:
+                    self._element(json.loads(buf[self.element_start:pos]))
+                    self.element_start = None
+                elif self.depth == 1:
+                    self._value(buf, match.start())
+                self.depth -= 1
+            elif self.depth == 1:
+                if token == ":" and self.key in _VALUE_KEYS:
+                    self.value_start = pos
+                elif token == ",":
+                    self._value(buf, match.start())
+                    self.expect_key = True
+        return pos
+
+    def _string(self, buf: str, start: Optional[int], end: int):
+        if start is not None and self.depth == 1 and self.expect_key:
+            self.key = json.loads(buf[start:end])
+            self.expect_key = False
+        self.string_start = None
+
+    def _value(self, buf: str, end: int):
+        if self.value_start is None:
+            return
+        value = json.loads(buf[self.value_start:end])
+        self.value_start = None
+        summary = self.summary
+        if self.key == "output_changes":
+            for name, change in (value or {}).items():
+                action = action_of((change or {}).get("actions") or [])
+                if action != "no-op":
+                    summary.outputs[name] = action
+        elif self.key == "errored":
+            summary.errored = bool(value)
+        else:
+            setattr(summary, self.key, str(value))
+
+    def _element(self, element: dict):
+        if self.key == "resource_drift":
+            self.summary.drift += 1
+            return
+        change = resource_change(element)
+        if change is None:
+            self.summary.unchanged += 1
+        else:
+            self.summary.counts[change.action] += 1
+            self.summary.changes.append(change)
+
+
+def parse_plan_json(stream: TextIO, chunk_size: int = CHUNK_SIZE) -> PlanSummary:
+    """Summarize `terraform show -json` output read from stream."""
+    summary = PlanSummary()
+    scanner = _PlanScanner(summary)
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        scanner.feed(chunk)
+    if scanner.depth != 0 or not summary.format_version:
+        raise ValueError("terraform show -json output was incomplete")
+    return summary
+
+
+def summary_sink(summary_file: Path) -> Callable[[TextIO], None]:
+    """A jobs.Job step sink that writes the plan summary to summary_file."""
+    def sink(stream: TextIO):
+        summary = parse_plan_json(stream)
+        summary.save(summary_file)
+        logger.info(f"plan summary: {summary.headline()} ({summary.unchanged} unchanged)")
+    return sink
@@ -0,0 +1,157 @@
+"""
+Relevance - Local lexical (BM25) index over Terraform variables.
+
+WHAT THIS FILE DOES:
+1. Indexes every root variable (name, description, type, allowed values and
+   the modules that constrain it) and every module (name and constrained
+   variables) as small text documents
+2. Scores a request against them with Okapi BM25 - pure Python, no network,
+   no embeddings; a 100-module catalog is indexed in milliseconds
+3. Builds the query from the recent user turns plus the variables already
+   proposed in the conversation, so follow-ups ("make it 3") still find
+   the variables they refer to
+
+context_builder.get_relevant_context() uses this to send only the
+variables a request needs instead of the whole catalog.
+"""
+
+import re
+import math
+from collections import Counter
+from typing import Iterable
+
+from history import SUMMARY_HEADER
+from streaming import extract_json_block
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+_STOP_WORDS = frozenset(
+    "a an and are as at be by can do for from i in is it me my of on or please "
+    "request set should so that the this to use user want we with would you".split()
+)
+
+# A few infrastructure synonyms, so "instance" finds vm_count and "encrypt"
+# finds boot_disk_encrypted without any model in the loop
+_ALIASES = {
+    "instance": ("vm", "machine"),
+    "server": ("vm", "machine"),
+    "node": ("vm",),
+    "machine": ("vm",),
+    "vm": ("instance", "machine"),
+    "gpu": ("nvidia",),
+    "storage": ("disk",),
+    "encrypt": ("encrypted", "cmek", "kms"),
+    "encryption": ("encrypted", "cmek", "kms"),
+    "firewall": ("allow", "port"),
+    "port": ("allow",),
+    "public": ("ip",),
+    "bigger": ("size", "type"),
+    "larger": ("size", "type"),
+    "smaller": ("size", "type"),
+    "cpu": ("machine", "type"),
+    "memory": ("machine", "type"),
+}
+
+
+def _stem(token: str) -> str:
+    """Crude plural folding: vms -> vm, gpus -> gpu, disks -> disk."""
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased, plural-folded word tokens; snake_case names split into words."""
+    return [_stem(t) for t in _TOKEN_RE.findall(text.lower()) if t not in _STOP_WORDS]
+
+
+def expand_query(tokens: Iterable[str]) -> list[str]:
+    """Query tokens plus their synonyms."""
+    expanded = []
+    for token in tokens:
+        expanded.append(token)
+        expanded.extend(_ALIASES.get(token, ()))
+    return expanded
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a fixed set of documents.
+
+    documents maps a key to its text; keys keep their insertion order so
+    equal scores rank deterministically.
+    """
+
+    def __init__(self, documents: dict[str, str], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.keys = list(documents)
+        self._terms = {key: Counter(tokenize(text)) for key, text in documents.items()}
+        self._lengths = {key: sum(terms.values()) for key, terms in self._terms.items()}
+        self._avg_length = (sum(self._lengths.values()) / len(self._lengths)) if self._lengths else 1.0
+
+        document_frequency = Counter()
+        for terms in self._terms.values():
+            document_frequency.update(terms.keys())
+        n = len(documents)
+        self._idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+
+    def scores(self, query: str) -> dict[str, float]:
+        """BM25 score of every document that matches at least one query term."""
+        query_terms = Counter(expand_query(tokenize(query)))
+        results: dict[str, float] = {}
+        for key in self.keys:
+            terms = self._terms[key]
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[key] / (self._avg_length or 1.0))
+            score = 0.0
+            for term, weight in query_terms.items():
+                tf = terms.get(term)
+                if tf:
+                    score += weight * self._idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            if score > 0:
+                results[key] = score
+        return results
+
+    def top(self, query: str, k: int) -> list[tuple[str, float]]:
+        """The k best (key, score) pairs, best first."""
+        order = {key: i for i, key in enumerate(self.keys)}
+        ranked = sorted(self.scores(query).items(), key=lambda kv: (-kv[1], order[kv[0]]))
+        return ranked[:k]
+
+
+def variable_document(var: dict, modules: Iterable[str] = ()) -> str:
+    """Indexed text for one root variable. The name counts twice."""
+    parts = [var["name"], var["name"], var.get("description") or "", var.get("type") or ""]
+    parts.extend(var.get("allowed") or [])
+    parts.append(var.get("allowed_hint") or "")
+    parts.extend(modules)
+    return " ".join(parts)
+
+
+def module_document(name: str, variables: list[dict]) -> str:
+    """Indexed text for one module: its name (twice) and its variables."""
+    parts = [name, name]
+    for var in variables:
+        parts.append(var["name"])
+        parts.append(var.get("description") or "")
+    return " ".join(parts)
+
+
+def intent_query(messages: list[dict], user_turns: int = 3) -> str:
+    """
+    Query text for a conversation: the latest user turns plus the variable
+    names of every ```json proposal in it (including a history summary).
+    Other system messages are ignored: their examples are not proposals.
+    """
+    user_texts = [m["content"] for m in messages if m["role"] == "user"][-user_turns:]
+    proposed = []
+    for message in messages:
+        if message["role"] == "assistant" or message["content"].startswith(SUMMARY_HEADER):
+            block = extract_json_block(message["content"])
+            if block:
+                proposed.extend(block)
+    return "\n".join(user_texts + proposed)
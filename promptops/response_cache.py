@@ -0,0 +1,181 @@
+"""
+Response Cache - On-disk cache of LLM responses for repeated prompts.
+
+WHAT THIS FILE DOES:
+1. Keys each response on model, temperature, the exact messages sent
+   (as assembled by build_full_prompt) and the platform-context hash
+2. Stores responses in a single SQLite file
+3. Expires entries after a TTL and evicts least-recently-used entries
+   once the entry count or total size bound is exceeded
+
+The same canned scenario sent twice returns the stored reply in
+milliseconds and costs nothing. Errors are never cached.
+
+CONFIGURATION:
+- PROMPTOPS_RESPONSE_CACHE=false          bypass the cache entirely
+- PROMPTOPS_RESPONSE_CACHE_PATH=...       SQLite file location
+- PROMPTOPS_RESPONSE_CACHE_TTL=86400      seconds before an entry expires
+- PROMPTOPS_RESPONSE_CACHE_MAX_ENTRIES=500
+- PROMPTOPS_RESPONSE_CACHE_MAX_BYTES=52428800
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger("promptops.response_cache")
+
+
+def hash_messages(messages: list[dict]) -> str:
+    """Stable hash of a chat messages list."""
+    payload = json.dumps(messages, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Size-bounded, TTL-expiring LRU cache of LLM responses backed by SQLite."""
+
+    def __init__(
+        self,
+        path: Path,
+        max_entries: int = 500,
+        max_bytes: int = 50 * 1024 * 1024,
+        ttl_seconds: float = 24 * 3600,
+        enabled: bool = True,
+    ):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses(last_access)")
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def make_key(model: str, temperature: float, messages: list[dict], context_hash: str = "",
+                 structured: bool = False, candidates: int = 1) -> str:
+        """
+        Cache key for one LLM call. structured (JSON-schema replies) and
+        candidates (samples per request) change the reply, so they are
+        part of the key.
+        """
+        parts = json.dumps(
+            {
+                "model": model,
+                "temperature": temperature,
+                "messages": hash_messages(messages),
+                "context": context_hash,
+                "structured": structured,
+                "candidates": candidates,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(parts.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response, or None on miss, expiry or bypass."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            try:
+                db = self._db()
+                row = db.execute(
+                    "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                response, created_at = row
+                if now - created_at > self.ttl_seconds:
+                    db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    db.commit()
+                    self.misses += 1
+                    return None
+                db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                db.commit()
+                self.hits += 1
+                return response
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache read failed: {e}")
+                return None
+
+    def put(self, key: str, response: str):
+        """Store a response and evict expired / least-recently-used entries."""
+        if not self.enabled or not response:
+            return
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            try:
+                db = self._db()
+                db.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, response, size, now, now),
+                )
+                self._evict(db, now)
+                db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Response cache write failed: {e}")
+
+    def _evict(self, db: sqlite3.Connection, now: float):
+        db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        count, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # Walk from least recently used, dropping until both bounds hold
+        drop = []
+        for key, size in db.execute("SELECT key, size FROM responses ORDER BY last_access ASC"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            drop.append((key,))
+            count -= 1
+            total -= size
+        db.executemany("DELETE FROM responses WHERE key = ?", drop)
+
+    def clear(self):
+        """Remove every cached response."""
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM responses")
+            db.commit()
+
+
+def response_cache_from_env(default_path: Path) -> ResponseCache:
+    """Build a ResponseCache configured from PROMPTOPS_RESPONSE_CACHE_* variables."""
+    return ResponseCache(
+        path=Path(os.getenv("PROMPTOPS_RESPONSE_CACHE_PATH", str(default_path))),
+        max_entries=int(os.getenv("PROMPTOPS_RESPONSE_CACHE_MAX_ENTRIES", "500")),
+        max_bytes=int(os.getenv("PROMPTOPS_RESPONSE_CACHE_MAX_BYTES", str(50 * 1024 * 1024))),
+        ttl_seconds=float(os.getenv("PROMPTOPS_RESPONSE_CACHE_TTL", str(24 * 3600))),
+        enabled=os.getenv("PROMPTOPS_RESPONSE_CACHE", "true").lower() != "false",
+    )
@@ -0,0 +1,234 @@
+"""
+Streaming - Incremental LLM responses for the CLI and web UI.
+
+WHAT THIS FILE DOES:
+1. Wraps a streaming chat.completions call as a plain iterator of text deltas
+2. Watches the text as it arrives for a fenced ```json block
+3. Parses that block the moment its closing fence arrives, not at end of response
+4. Parses leniently: prose around the object, trailing commas, // comments
+   and a missing closing fence (truncated reply) are tolerated
+5. Records time-to-first-token, total latency, JSON scan time and token usage
+
+The iterator works directly with st.write_stream() and with a print loop.
+"""
+
+import json
+import time
+from typing import Callable, Iterator, Optional
+
+
+JSON_FENCE = "```json"
+FENCE = "```"
+
+
+_decoder = json.JSONDecoder()
+
+
+def _relax(text: str) -> str:
+    """Drop // comments and trailing commas outside strings, in one pass."""
+    out = []
+    i, n = 0, len(text)
+    in_string = False
+    while i < n:
+        c = text[i]
+        if in_string:
+            out.append(c)
+            if c == "\\" and i + 1 < n:
+                out.append(text[i + 1])
+                i += 1
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+            out.append(c)
+        elif c == "/" and text.startswith("//", i):
+            newline = text.find("\n", i)
+            i = n if newline < 0 else newline
+            continue
+        elif c in "}]":
+            # Remove a comma left dangling before the closing bracket
+            j = len(out) - 1
+            while j >= 0 and out[j].isspace():
+                j -= 1
+            if j >= 0 and out[j] == ",":
+                del out[j]
+            out.append(c)
+        else:
+            out.append(c)
+        i += 1
+    return "".join(out)
+
+
+def parse_json_object(text: str) -> Optional[dict]:
+    """
+    Parse the first JSON object in text, or None.
+
+    Text before the opening brace and after the closing one is ignored,
+    and a second attempt forgives trailing commas and // comments.
+    """
+    start = text.find("{")
+    if start < 0:
+        return None
+    for candidate in (text, _relax(text)):
+        start = candidate.find("{")
+        try:
+            parsed, _ = _decoder.raw_decode(candidate, start)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(parsed, dict):
+            return parsed
+    return None
+
+
+class JsonBlockDetector:
+    """
+    Incremental detector for ```json { ... } ``` blocks.
+
+    Feed it text chunks as they arrive; each completed block that parses to a
+    JSON object is returned from feed() and appended to .blocks. Scanning only
+    looks at new text (plus a few characters of overlap for split fences), so
+    the total work is linear in the response length.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.blocks: list[dict] = []
+        self._scan_from = 0
+        self._block_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> list[dict]:
+        self.buffer += chunk
+        found = []
+        while True:
+            if self._block_start is None:
+                opener = self.buffer.find(JSON_FENCE, self._scan_from)
+                if opener < 0:
+                    # Keep enough overlap to catch a fence split across chunks
+                    self._scan_from = max(self._scan_from, len(self.buffer) - len(JSON_FENCE) + 1)
+                    return found
+                self._block_start = opener + len(JSON_FENCE)
+                self._scan_from = self._block_start
+
+            closer = self.buffer.find(FENCE, self._scan_from)
+            if closer < 0:
+                self._scan_from = max(self._scan_from, len(self.buffer) - len(FENCE) + 1)
+                return found
+
+            body = self.buffer[self._block_start:closer].strip()
+            self._block_start = None
+            self._scan_from = closer + len(FENCE)
+            if body.startswith("{"):
+                parsed = parse_json_object(body)
+                if parsed is not None:
+                    self.blocks.append(parsed)
+                    found.append(parsed)
+
+    def finish(self) -> list[dict]:
+        """
+        Call at end of response: parse a block whose closing fence never came
+        (reply cut off at max_tokens, or the model forgot it).
+        """
+        if self._block_start is None:
+            return []
+        body = self.buffer[self._block_start:].strip()
+        self._block_start = None
+        self._scan_from = len(self.buffer)
+        parsed = parse_json_object(body) if body.startswith("{") else None
+        if parsed is None:
+            return []
+        self.blocks.append(parsed)
+        return [parsed]
+
+    @property
+    def first_block(self) -> Optional[dict]:
+        return self.blocks[0] if self.blocks else None
+
+
+def extract_json_block(text: str) -> Optional[dict]:
+    """
+    Return the first ```json object block in a complete response, or None.
+
+    A reply that is a bare JSON object (no fence) is parsed as a whole.
+    """
+    detector = JsonBlockDetector()
+    detector.feed(text)
+    detector.finish()
+    if detector.first_block is None and text.lstrip().startswith("{"):
+        return parse_json_object(text)
+    return detector.first_block
+
+
+class ChatStream:
+    """
+    A streaming chat completion exposed as an iterator of text deltas.
+
+    Usage:
+        stream = ChatStream(client, model=..., messages=..., on_json=handle_vars)
+        for delta in stream:
+            print(delta, end="", flush=True)
+        stream.text          # full response
+        stream.json_block    # first ```json object, parsed as soon as it closed
+
+    on_json is called once, with the first JSON object block, while the rest
+    of the response is still streaming.
+
+    With include_usage=True the API is asked for a final usage chunk
+    (stream_options.include_usage); .usage is None if the backend sends none.
+    """
+
+    def __init__(self, client, on_json: Optional[Callable[[dict], None]] = None,
+                 include_usage: bool = False, **create_kwargs):
+        self.client = client
+        self.create_kwargs = create_kwargs
+        if include_usage:
+            self.create_kwargs["stream_options"] = {"include_usage": True}
+        self.on_json = on_json
+        self.detector = JsonBlockDetector()
+        self.parts: list[str] = []
+        self.first_token_s: Optional[float] = None
+        self.total_s: Optional[float] = None
+        self.json_extract_s = 0.0
+        self.usage = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    @property
+    def json_block(self) -> Optional[dict]:
+        return self.detector.first_block
+
+    def __iter__(self) -> Iterator[str]:
+        start = time.perf_counter()
+        response = self.client.chat.completions.create(stream=True, **self.create_kwargs)
+        try:
+            for chunk in response:
+                if getattr(chunk, "usage", None):
+                    self.usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                if self.first_token_s is None:
+                    self.first_token_s = time.perf_counter() - start
+                self.parts.append(delta)
+
+                had_block = bool(self.detector.blocks)
+                scan_start = time.perf_counter()
+                self.detector.feed(delta)
+                self.json_extract_s += time.perf_counter() - scan_start
+                if self.on_json and not had_block and self.detector.blocks:
+                    self.on_json(self.detector.first_block)
+
+                yield delta
+
+            had_block = bool(self.detector.blocks)
+            self.detector.finish()
+            if self.on_json and not had_block and self.detector.blocks:
+                self.on_json(self.detector.first_block)
+        finally:
+            self.total_s = time.perf_counter() - start
+            close = getattr(response, "close", None)
+            if close:
+                close()
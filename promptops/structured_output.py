@@ -0,0 +1,177 @@
+"""
+Structured Output - JSON-schema constrained replies generated from Terraform variables.
+
+WHAT THIS FILE DOES:
+1. Builds a JSON Schema for the reply from the compiled rule set in
+   validator.py: types from `type`, enums from `allowed`, bounds from min/max
+2. Passes it as response_format on non-streaming calls, so the backend
+   itself can only produce a well-formed, in-range proposal
+3. Renders the structured reply back into the usual markdown + ```json
+   block, so history, the response cache and intent documents are unchanged
+4. Turns itself off (once, with a warning) if the backend rejects
+   response_format; streaming calls always use the tolerant incremental
+   extractor in streaming.py instead
+
+CONFIGURATION:
+- PROMPTOPS_STRUCTURED_OUTPUT=auto   auto (on unless the backend is a local model), true or false
+"""
+
+import os
+import json
+import logging
+from functools import lru_cache
+from typing import Any, Optional
+
+from validator import RuleSet
+
+logger = logging.getLogger("promptops.structured_output")
+
+
+_JSON_TYPES = {
+    "string": "string",
+    "number": "number",
+    "bool": "boolean",
+    "list": "array",
+    "set": "array",
+    "tuple": "array",
+}
+
+
+def _property_schema(rule) -> Optional[dict]:
+    """Schema for one variable (always nullable: null means "leave as is")."""
+    json_type = _JSON_TYPES.get(rule.type or "string")
+    if json_type is None:
+        # map/object variables have no fixed shape to describe in strict mode
+        return None
+
+    schema: dict[str, Any] = {"type": [json_type, "null"]}
+    if json_type == "array":
+        schema["items"] = {"type": "string"}
+    if rule.allowed is not None and json_type == "string":
+        schema["enum"] = sorted(rule.allowed) + [None]
+    if json_type == "number":
+        if rule.min is not None:
+            schema["minimum"] = rule.min
+        if rule.max is not None:
+            schema["maximum"] = rule.max
+    return schema
+
+
+def proposal_schema(rules: RuleSet) -> dict:
+    """JSON Schema for a reply: an explanation plus the proposed variables."""
+    properties = {}
+    for name, rule in rules.rules.items():
+        schema = _property_schema(rule)
+        if schema is not None:
+            properties[name] = schema
+
+    return {
+        "type": "object",
+        "properties": {
+            "explanation": {
+                "type": "string",
+                "description": "Reasoning for the operator, in markdown.",
+            },
+            "terraform_vars": {
+                "anyOf": [
+                    {
+                        "type": "object",
+                        "properties": properties,
+                        "required": list(properties),
+                        "additionalProperties": False,
+                    },
+                    {"type": "null"},
+                ],
+                "description": "Variables to set; null for every variable left unchanged, "
+                               "or null entirely if no configuration change is proposed.",
+            },
+        },
+        "required": ["explanation", "terraform_vars"],
+        "additionalProperties": False,
+    }
+
+
+# Rule sets are rebuilt when variables change, so caching per instance is safe
+@lru_cache(maxsize=8)
+def response_format(rules: RuleSet) -> dict:
+    """The response_format argument for chat.completions.create()."""
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": "terraform_proposal", "strict": True, "schema": proposal_schema(rules)},
+    }
+
+
+def render_reply(content: str) -> str:
+    """
+    Turn a structured reply into markdown with a ```json block.
+
+    Content that is not a structured reply is returned unchanged.
+    """
+    try:
+        parsed = json.loads(content)
+    except (TypeError, json.JSONDecodeError):
+        return content
+    if not isinstance(parsed, dict) or "explanation" not in parsed:
+        return content
+
+    text = str(parsed.get("explanation") or "").strip()
+    tf_vars = {k: v for k, v in (parsed.get("terraform_vars") or {}).items() if v is not None}
+    if tf_vars:
+        text += f"\n\n```json\n{json.dumps(tf_vars, indent=2)}\n```"
+    return text
+
+
+def _is_unsupported(error: Exception) -> bool:
+    message = str(error).lower()
+    return getattr(error, "status_code", None) in (400, 422) and (
+        "response_format" in message or "json_schema" in message
+    )
+
+
+class StructuredOutput:
+    """
+    Adds response_format to non-streaming completions while the backend accepts it.
+
+    create()/acreate() return (response, text) where text is already rendered
+    back to markdown.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+
+    def _rejected(self, error: Exception) -> bool:
+        if self.enabled and _is_unsupported(error):
+            logger.warning(f"Backend does not support structured output, falling back to text: {error}")
+            self.enabled = False
+            return True
+        return False
+
+    def create(self, client, rules: RuleSet, **kwargs):
+        if self.enabled:
+            try:
+                response = client.chat.completions.create(response_format=response_format(rules), **kwargs)
+                return response, render_reply(response.choices[0].message.content or "")
+            except Exception as e:
+                if not self._rejected(e):
+                    raise
+        response = client.chat.completions.create(**kwargs)
+        return response, response.choices[0].message.content or ""
+
+    async def acreate(self, client, rules: RuleSet, **kwargs):
+        if self.enabled:
+            try:
+                response = await client.chat.completions.create(response_format=response_format(rules), **kwargs)
+                return response, render_reply(response.choices[0].message.content or "")
+            except Exception as e:
+                if not self._rejected(e):
+                    raise
+        response = await client.chat.completions.create(**kwargs)
+        return response, response.choices[0].message.content or ""
+
+
+def structured_output_from_env(supported: bool = True) -> StructuredOutput:
+    """StructuredOutput configured from PROMPTOPS_STRUCTURED_OUTPUT (auto = if the backend supports it)."""
+    setting = os.getenv("PROMPTOPS_STRUCTURED_OUTPUT", "auto").lower()
+    if setting == "auto":
+        return StructuredOutput(enabled=supported)
+    return StructuredOutput(enabled=setting == "true")
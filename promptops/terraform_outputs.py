@@ -0,0 +1,89 @@
+"""
+Terraform Outputs - Cached `terraform output -json`.
+
+WHAT THIS FILE DOES:
+1. Reads all Terraform outputs with ONE `terraform output -json` call
+2. Caches the result keyed on the state file's mtime and size
+3. Re-reads only when the state file changes or invalidate() is called
+   (web.py calls it when an apply or destroy job finishes)
+
+Ordinary Streamlit reruns therefore start no subprocesses at all.
+"""
+
+import json
+import logging
+import subprocess
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+from jobs import TERRAFORM_BIN
+
+logger = logging.getLogger("promptops.terraform_outputs")
+
+
+class OutputsCache:
+    """All outputs of one Terraform directory, refreshed only when state changes."""
+
+    def __init__(self, terraform_dir: Path, timeout: float = 10.0, env: Optional[dict[str, str]] = None):
+        self.terraform_dir = Path(terraform_dir)
+        self.timeout = timeout
+        self.env = env
+        self._lock = threading.Lock()
+        self._fingerprint: Optional[tuple] = None
+        self._outputs: dict[str, Any] = {}
+        self._valid = False
+        self.refreshes = 0
+
+    def _state_fingerprint(self) -> tuple:
+        """(mtime_ns, size) of the local state file(s); cheap stat() calls only."""
+        parts = []
+        for path in (
+            self.terraform_dir / "terraform.tfstate",
+            self.terraform_dir / ".terraform" / "terraform.tfstate",
+            self.terraform_dir / ".terraform" / "environment",
+        ):
+            try:
+                stat = path.stat()
+                parts.append((str(path), stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                parts.append((str(path), None, None))
+        return tuple(parts)
+
+    def invalidate(self):
+        """Force the next get() to re-read outputs."""
+        with self._lock:
+            self._valid = False
+
+    def get(self) -> dict[str, Any]:
+        """Return {output_name: value}. Empty if there is no state or terraform fails."""
+        fingerprint = self._state_fingerprint()
+        with self._lock:
+            if self._valid and fingerprint == self._fingerprint:
+                return self._outputs
+            self._outputs = self._read_outputs()
+            self._fingerprint = fingerprint
+            self._valid = True
+            self.refreshes += 1
+            return self._outputs
+
+    def _read_outputs(self) -> dict[str, Any]:
+        try:
+            result = subprocess.run(
+                [TERRAFORM_BIN, "output", "-json"],
+                cwd=self.terraform_dir,
+                capture_output=True,
+                text=True,
+                timeout=self.timeout,
+                env=self.env,
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logger.info(f"terraform output unavailable: {e}")
+            return {}
+        if result.returncode != 0:
+            return {}
+        try:
+            raw = json.loads(result.stdout or "{}")
+        except json.JSONDecodeError:
+            return {}
+        return {name: entry.get("value") for name, entry in raw.items() if isinstance(entry, dict)}
@@ -0,0 +1,198 @@
+"""
+Terraform Runner - One warm, managed Terraform working directory.
+
+WHAT THIS FILE DOES:
+1. Runs `terraform init` only when it is needed: no .terraform/ yet, or a
+   `terraform {}` / `module {}` block or .terraform.lock.hcl changed since
+   the last successful init
+2. Shares one provider plugin cache (TF_PLUGIN_CACHE_DIR) across working
+   directories and re-inits, so providers are downloaded once per machine
+3. Builds the plan / apply / destroy command sequences with a tuned
+   -parallelism and non-interactive flags (-input=false, TF_IN_AUTOMATION)
+4. Offers a quick plan (-refresh=false) for chat-driven iteration: it skips
+   reading every resource back from the cloud. Apply never uses a quick
+   plan; it applies a fully refreshed plan, refreshing first if needed
+5. Follows a plan with `terraform show -json`, streamed into a compact
+   resource-change summary (plan_summary.py) instead of the job output
+6. Runs each sequence as one job, so jobs.Job.phases reports the time
+   spent in init, plan, show and apply separately
+
+CONFIGURATION:
+- PROMPTOPS_TF_PLUGIN_CACHE=~/.terraform.d/plugin-cache   shared provider cache
+- PROMPTOPS_TF_PARALLELISM=20     concurrent resource operations (Terraform's default is 10)
+- PROMPTOPS_TF_QUICK_PLAN=false   default for the web UI's quick plan toggle
+- PROMPTOPS_TF_INIT_TIMEOUT=600   extra seconds a job gets when it has to run init
+"""
+
+import os
+import hashlib
+import logging
+from pathlib import Path
+from typing import Optional
+
+from hcl import Block, HCLSyntaxError, iter_blocks
+from jobs import SUCCEEDED, TERRAFORM_BIN, Job
+from plan_summary import summary_sink
+
+logger = logging.getLogger("promptops.terraform_runner")
+
+QUICK_PLAN_DEFAULT = os.getenv("PROMPTOPS_TF_QUICK_PLAN", "false").lower() == "true"
+
+# Written into .terraform/ after a successful init
+_INIT_STAMP = "promptops-init"
+
+
+def in_data_dir(relative_path: Path) -> bool:
+    """True for paths under .terraform/ or a per-environment .terraform-envs/ (downloaded modules)."""
+    return any(part.startswith(".terraform") for part in relative_path.parts[:-1])
+
+
+def _block_signature(block: Block) -> str:
+    """Canonical text of a block: type, labels, attributes and nested blocks."""
+    attributes = ";".join(
+        f"{name}={' '.join(tok.value for tok in attr.tokens)}"
+        for name, attr in sorted(block.attributes.items())
+    )
+    children = ";".join(_block_signature(child) for child in block.blocks)
+    return f"{block.type}[{','.join(block.labels)}]{{{attributes}|{children}}}"
+
+
+class TerraformWorkspace:
+    """
+    Builds job steps for one Terraform directory and keeps it initialized.
+
+    Each *_steps() method returns [(phase, args), ...] for JobRunner.start();
+    pass job_finished as (part of) on_finish so a successful init is recorded.
+
+    data_dir (TF_DATA_DIR) and workspace give one directory several
+    independent working copies, e.g. one per environment, that can plan
+    side by side without sharing .terraform/ or state.
+    """
+
+    def __init__(self, terraform_dir: Path, plugin_cache_dir: Optional[Path] = None,
+                 parallelism: Optional[int] = None, data_dir: Optional[Path] = None,
+                 workspace: Optional[str] = None, init_timeout: Optional[float] = None):
+        self.terraform_dir = Path(terraform_dir)
+        self.data_dir = Path(data_dir) if data_dir else self.terraform_dir / ".terraform"
+        self.workspace = workspace
+        self.plugin_cache_dir = Path(
+            plugin_cache_dir
+            or os.getenv("PROMPTOPS_TF_PLUGIN_CACHE")
+            or Path.home() / ".terraform.d" / "plugin-cache"
+        ).expanduser()
+        self.parallelism = parallelism or int(os.getenv("PROMPTOPS_TF_PARALLELISM", "20"))
+        self.init_timeout = init_timeout or float(os.getenv("PROMPTOPS_TF_INIT_TIMEOUT", "600"))
+
+    def env(self) -> dict[str, str]:
+        """Environment for every terraform subprocess."""
+        self.plugin_cache_dir.mkdir(parents=True, exist_ok=True)
+        env = {
+            **os.environ,
+            "TF_PLUGIN_CACHE_DIR": str(self.plugin_cache_dir),
+            "TF_IN_AUTOMATION": "1",
+            "TF_INPUT": "0",
+        }
+        if self.data_dir != self.terraform_dir / ".terraform":
+            env["TF_DATA_DIR"] = str(self.data_dir)
+        return env
+
+    def init_fingerprint(self) -> str:
+        """Hash of everything `terraform init` depends on."""
+        digest = hashlib.sha256()
+        tf_dir = self.terraform_dir
+        for path in sorted(tf_dir.rglob("*.tf")):
+            if in_data_dir(path.relative_to(tf_dir)):
+                continue
+            try:
+                blocks = [b for b in iter_blocks(path.read_text()) if b.type in ("terraform", "module")]
+            except (OSError, HCLSyntaxError):
+                # Let terraform itself report the problem
+                digest.update(f"{path}:unparsed:{path.stat().st_mtime_ns}".encode())
+                continue
+            for block in blocks:
+                digest.update(f"{path.relative_to(tf_dir)}:{_block_signature(block)}\n".encode())
+        lock_file = tf_dir / ".terraform.lock.hcl"
+        if lock_file.exists():
+            digest.update(lock_file.read_bytes())
+        return digest.hexdigest()
+
+    def needs_init(self) -> bool:
+        stamp = self.data_dir / _INIT_STAMP
+        try:
+            return stamp.read_text().strip() != self.init_fingerprint()
+        except FileNotFoundError:
+            return True
+
+    def timeout(self, seconds: float) -> float:
+        """Job timeout for a command that needs seconds, plus the init budget when init is due."""
+        return seconds + (self.init_timeout if self.needs_init() else 0)
+
+    def job_finished(self, job: Job):
+        """Record a successful init so later jobs skip it."""
+        init_ok = "init" in job.phases and (job.status == SUCCEEDED or len(job.phases) > 1)
+        if init_ok:
+            stamp = self.data_dir / _INIT_STAMP
+            stamp.parent.mkdir(parents=True, exist_ok=True)
+            # Fingerprint after init: init may have written .terraform.lock.hcl
+            stamp.write_text(self.init_fingerprint())
+        if job.phases:
+            logger.info(f"terraform {job.name} {job.status}: "
+                        + ", ".join(f"{phase} {seconds:.1f}s" for phase, seconds in job.phases.items()))
+
+    def selected_workspace(self) -> str:
+        try:
+            return (self.data_dir / "environment").read_text().strip() or "default"
+        except FileNotFoundError:
+            return "default"
+
+    def setup_steps(self) -> list[tuple]:
+        """init (if needed) and selecting the workspace: the steps every command starts with."""
+        steps = []
+        if self.needs_init():
+            steps.append(("init", [TERRAFORM_BIN, "init", "-input=false", "-no-color"]))
+        if self.workspace and self.selected_workspace() != self.workspace:
+            steps.append(("workspace", [TERRAFORM_BIN, "workspace", "select", "-or-create", self.workspace]))
+        return steps
+
+    def plan_steps(self, plan_file: Path, quick: bool = False,
+                   summary_file: Optional[Path] = None, var_file: Optional[Path] = None,
+                   setup: bool = True) -> list[tuple]:
+        """
+        init (if needed), then plan into plan_file; quick skips the refresh.
+        With summary_file, `terraform show -json` summarizes the plan there.
+        var_file is layered over terraform.tfvars. setup=False leaves out
+        setup_steps(), for callers that run them separately.
+        """
+        args = [TERRAFORM_BIN, "plan", "-input=false", "-no-color", f"-parallelism={self.parallelism}"]
+        if quick:
+            args.append("-refresh=false")
+        if var_file:
+            args.append(f"-var-file={var_file}")
+        args.append(f"-out={plan_file}")
+        steps = (self.setup_steps() if setup else []) + [("plan", args)]
+        if summary_file:
+            Path(summary_file).unlink(missing_ok=True)
+            steps.append(("show", [TERRAFORM_BIN, "show", "-json", "-no-color", str(plan_file)],
+                          summary_sink(summary_file)))
+        return steps
+
+    def apply_steps(self, plan_file: Optional[Path] = None) -> list[tuple]:
+        """
+        Apply a fully refreshed plan. Without a stored one, plan with a
+        full refresh first and apply exactly that plan.
+        """
+        steps = self.setup_steps()
+        if plan_file is None:
+            plan_file = self.data_dir / "promptops-apply.tfplan"
+            steps.append(self.plan_steps(plan_file)[-1])
+        steps.append(("apply", [
+            TERRAFORM_BIN, "apply", "-input=false", "-no-color", "-auto-approve",
+            f"-parallelism={self.parallelism}", str(plan_file),
+        ]))
+        return steps
+
+    def destroy_steps(self) -> list[tuple]:
+        return self.setup_steps() + [("destroy", [
+            TERRAFORM_BIN, "destroy", "-input=false", "-no-color", "-auto-approve",
+            f"-parallelism={self.parallelism}",
+        ])]
@@ -0,0 +1,271 @@
+"""
+Tfvars Codec - Read, merge and write terraform.tfvars with round-trip fidelity.
+
+WHAT THIS FILE DOES:
+1. Parses terraform.tfvars with the HCL lexer in hcl.py (multi-line maps
+   and lists, heredocs and comments all handled)
+2. Keeps the original text and the source span of every value
+3. On merge, rewrites ONLY the values that actually changed and appends
+   new keys; comments, ordering and untouched values stay byte-for-byte
+4. Writes atomically (temp file + rename), and skips the write entirely
+   when nothing changed
+5. Caches the parsed file on mtime/size so chat turns don't re-read it
+
+Shared by web.py and app.py.
+"""
+
+import os
+import json
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+from hcl import HEREDOC, IDENT, NUMBER, PUNCT, STRING, Token, iter_attributes
+
+
+class _Unparseable(Exception):
+    """Expression is not a plain literal (function call, reference, ...)."""
+
+
+def _decode(tokens: list[Token], pos: int = 0) -> tuple[Any, int]:
+    """Decode one literal value from expression tokens. Returns (value, next position)."""
+    if pos >= len(tokens):
+        raise _Unparseable()
+    tok = tokens[pos]
+
+    if tok.kind in (STRING, HEREDOC):
+        return tok.value, pos + 1
+    if tok.kind == NUMBER:
+        return (float(tok.value) if any(c in tok.value for c in ".eE") else int(tok.value)), pos + 1
+    if tok.kind == PUNCT and tok.value == "-" and pos + 1 < len(tokens) and tokens[pos + 1].kind == NUMBER:
+        value, nxt = _decode(tokens, pos + 1)
+        return -value, nxt
+    if tok.kind == IDENT and tok.value in ("true", "false", "null"):
+        return {"true": True, "false": False, "null": None}[tok.value], pos + 1
+
+    if tok.kind == PUNCT and tok.value == "[":
+        items = []
+        pos += 1
+        while pos < len(tokens) and tokens[pos].value != "]":
+            item, pos = _decode(tokens, pos)
+            items.append(item)
+            if pos < len(tokens) and tokens[pos].value == ",":
+                pos += 1
+        if pos >= len(tokens):
+            raise _Unparseable()
+        return items, pos + 1
+
+    if tok.kind == PUNCT and tok.value == "{":
+        obj = {}
+        pos += 1
+        while pos < len(tokens) and tokens[pos].value != "}":
+            key_tok = tokens[pos]
+            if key_tok.kind not in (IDENT, STRING):
+                raise _Unparseable()
+            if pos + 1 >= len(tokens) or tokens[pos + 1].value not in ("=", ":"):
+                raise _Unparseable()
+            value, pos = _decode(tokens, pos + 2)
+            obj[key_tok.value] = value
+            if pos < len(tokens) and tokens[pos].value == ",":
+                pos += 1
+        if pos >= len(tokens):
+            raise _Unparseable()
+        return obj, pos + 1
+
+    raise _Unparseable()
+
+
+def decode_expression(tokens: list[Token], source: str) -> Any:
+    """Python value of a literal expression, or its raw source text if not a literal."""
+    try:
+        value, end = _decode(tokens)
+        if end == len(tokens):
+            return value
+    except _Unparseable:
+        pass
+    return source[tokens[0].start:tokens[-1].end] if tokens else None
+
+
+def encode_value(value: Any, indent: int = 0) -> str:
+    """Render a Python value as an HCL expression."""
+    # bool before int: bool is a subclass of int
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if value is None:
+        return "null"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, str):
+        # Literal ${ and %{ must be escaped so Terraform doesn't template them
+        return json.dumps(value, ensure_ascii=False).replace("${", "$${").replace("%{", "%%{")
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(encode_value(v, indent) for v in value) + "]"
+    if isinstance(value, dict):
+        if not value:
+            return "{}"
+        pad = "  " * (indent + 1)
+        lines = [f"{pad}{_encode_key(k)} = {encode_value(v, indent + 1)}" for k, v in value.items()]
+        return "{\n" + "\n".join(lines) + "\n" + "  " * indent + "}"
+    return json.dumps(value)
+
+
+def _encode_key(key: str) -> str:
+    return key if key.replace("_", "").replace("-", "").isalnum() and not key[0].isdigit() else json.dumps(key)
+
+
+def dumps(vars_dict: dict[str, Any]) -> str:
+    """Render a dict as tfvars assignments, one per line."""
+    return "".join(f"{key} = {encode_value(value)}\n" for key, value in vars_dict.items())
+
+
+class TfvarsDocument:
+    """
+    A parsed tfvars file that remembers where every value came from.
+
+    values holds decoded Python values; changed holds the keys modified
+    since parsing. render() splices only changed values into the original
+    text and appends new keys at the end.
+    """
+
+    def __init__(self, text: str = ""):
+        self.text = text
+        self.values: dict[str, Any] = {}
+        self._spans: dict[str, tuple[int, int]] = {}
+        self.changed: set[str] = set()
+        for attr in iter_attributes(text):
+            if not attr.tokens:
+                continue
+            self.values[attr.name] = decode_expression(attr.tokens, text)
+            self._spans[attr.name] = (attr.tokens[0].start, attr.tokens[-1].end)
+
+    def as_dict(self) -> dict[str, Any]:
+        return dict(self.values)
+
+    def copy(self) -> "TfvarsDocument":
+        """An independent copy with no pending changes."""
+        doc = TfvarsDocument()
+        doc.text = self.text
+        doc.values = dict(self.values)
+        doc._spans = dict(self._spans)
+        return doc
+
+    def update(self, new_vars: dict[str, Any]) -> list[str]:
+        """Apply new values; returns the keys whose value actually changed."""
+        changed = []
+        for key, value in new_vars.items():
+            if key in self.values and self.values[key] == value and type(self.values[key]) is type(value):
+                continue
+            self.values[key] = value
+            self.changed.add(key)
+            changed.append(key)
+        return changed
+
+    def render(self) -> str:
+        if not self.changed:
+            return self.text
+
+        edits = sorted(
+            (self._spans[key], key) for key in self.changed if key in self._spans
+        )
+        out = []
+        cursor = 0
+        for (start, end), key in edits:
+            out.append(self.text[cursor:start])
+            out.append(encode_value(self.values[key]))
+            cursor = end
+        out.append(self.text[cursor:])
+
+        added = {key: self.values[key] for key in self.values if key in self.changed and key not in self._spans}
+        if added:
+            if out[-1] and not out[-1].endswith("\n"):
+                out.append("\n")
+            out.append(dumps(added))
+        return "".join(out)
+
+
+def loads(text: str) -> TfvarsDocument:
+    return TfvarsDocument(text)
+
+
+def atomic_write(path: Path, content: str):
+    """Write content to path via a temp file in the same directory and rename."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    try:
+        # mkstemp creates 0600; keep the existing file's mode (or a normal 0644)
+        os.chmod(tmp, path.stat().st_mode & 0o777 if path.exists() else 0o644)
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+class TfvarsFile:
+    """
+    A terraform.tfvars on disk, parsed once and re-read only when it changes.
+
+    header is written at the top when the file is first created.
+    """
+
+    def __init__(self, path: Path, header: str = ""):
+        self.path = Path(path)
+        self.header = header
+        self._lock = threading.Lock()
+        self._key: Optional[tuple] = None
+        self._doc: Optional[TfvarsDocument] = None
+
+    def _stat_key(self) -> Optional[tuple]:
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _load(self) -> TfvarsDocument:
+        key = self._stat_key()
+        if self._doc is None or key != self._key:
+            self._doc = TfvarsDocument(self.path.read_text() if key else "")
+            self._key = key
+        return self._doc
+
+    def load(self) -> dict[str, Any]:
+        """Current values as a dict (a copy)."""
+        with self._lock:
+            return self._load().as_dict()
+
+    def text(self) -> str:
+        with self._lock:
+            doc = self._load()
+            return doc.text
+
+    def merge(self, new_vars: dict[str, Any]) -> tuple[str, list[str]]:
+        """
+        Merge new_vars into the file, touching only keys whose value changed.
+
+        Returns (file content, changed keys). Nothing is written if no key changed.
+        Raises HCLSyntaxError if the existing file cannot be parsed.
+        """
+        with self._lock:
+            doc = self._load()
+            working = doc.copy()
+            if not working.text.strip() and self.header:
+                working.text = self.header
+
+            changed = working.update(new_vars)
+            if not changed and self.path.exists():
+                return doc.text, []
+
+            content = working.render()
+            atomic_write(self.path, content)
+            self._doc = TfvarsDocument(content)
+            self._key = self._stat_key()
+            return content, changed
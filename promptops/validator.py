@@ -0,0 +1,216 @@
+"""
+Validator - Local constraint checks for LLM-proposed Terraform variables.
+
+WHAT THIS FILE DOES:
+1. Compiles the metadata context_builder already extracts (type, allowed
+   values, min/max, ALLOWED: hints) into a rule set indexed by variable name
+2. Checks every extracted JSON dict against it before tfvars are written
+   (a dict lookup and a set/range test per key - microseconds)
+3. Formats violations as a repair message that is sent back to the LLM,
+   so a bad proposal is fixed in one more turn instead of failing a
+   full `terraform plan`
+
+Terraform still enforces every constraint; this only catches the common
+mistakes early. Root variables.tf defines which keys may be set; module
+validation blocks with the same variable name tighten the rules.
+
+CONFIGURATION:
+- PROMPTOPS_REPAIR_ATTEMPTS=1   repair turns before giving up (0 disables)
+"""
+
+import os
+import re
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from context_builder import get_context_with_audit, get_variable_metadata
+
+
+REPAIR_ATTEMPTS = int(os.getenv("PROMPTOPS_REPAIR_ATTEMPTS", "1"))
+
+# "1-10", "50-200 GB"
+_RANGE_HINT_RE = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*-\s*(-?\d+(?:\.\d+)?)\b")
+
+_PYTHON_TYPES = {
+    "string": (str,),
+    "number": (int, float),
+    "bool": (bool,),
+    "list": (list, tuple),
+    "set": (list, tuple),
+    "tuple": (list, tuple),
+    "map": (dict,),
+    "object": (dict,),
+}
+
+
+@dataclass
+class Rule:
+    """Constraints for one variable."""
+    name: str
+    type: Optional[str] = None
+    allowed: Optional[frozenset] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+
+
+@dataclass
+class Violation:
+    """One value that breaks a platform constraint."""
+    variable: str
+    value: Any
+    message: str
+
+    def __str__(self) -> str:
+        return f"{self.variable} = {self.value!r}: {self.message}"
+
+
+def _as_number(value: Any) -> Optional[float]:
+    """Numeric value of an int/float or numeric string (Terraform converts those)."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+
+def _hcl_text(value: Any) -> str:
+    """value as it would appear in HCL, for comparison with allowed values (true, 22, "x")."""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _constraints(var: dict) -> tuple[Optional[set], Optional[float], Optional[float]]:
+    """(allowed, min, max) from one parsed variable, including its ALLOWED: hint."""
+    allowed = set(var["allowed"]) if var.get("allowed") else None
+    low, high = var.get("min"), var.get("max")
+
+    hint = var.get("allowed_hint")
+    if hint:
+        match = _RANGE_HINT_RE.match(hint)
+        if match:
+            low = float(match.group(1)) if low is None else low
+            high = float(match.group(2)) if high is None else high
+        elif allowed is None:
+            allowed = {item.strip() for item in hint.split(",") if item.strip()}
+    return allowed, low, high
+
+
+def _range_text(rule: Rule) -> str:
+    if rule.min is not None and rule.max is not None:
+        return f"must be between {rule.min:g} and {rule.max:g}"
+    if rule.min is not None:
+        return f"must be at least {rule.min:g}"
+    return f"must be at most {rule.max:g}"
+
+
+class RuleSet:
+    """Variable rules indexed by name."""
+
+    def __init__(self, rules: dict[str, Rule]):
+        self.rules = rules
+
+    @classmethod
+    def from_variables(cls, root_variables: list[dict], module_variables: Iterable[list[dict]] = ()) -> "RuleSet":
+        """
+        Compile parsed variables into rules.
+
+        Only root variables can be set; a module variable with the same name
+        adds its constraints (allowed sets intersect, ranges narrow).
+        """
+        rules: dict[str, Rule] = {}
+        for var in root_variables:
+            allowed, low, high = _constraints(var)
+            rules[var["name"]] = Rule(
+                name=var["name"],
+                type=var.get("type"),
+                allowed=frozenset(allowed) if allowed is not None else None,
+                min=low,
+                max=high,
+            )
+
+        for variables in module_variables:
+            for var in variables:
+                rule = rules.get(var["name"])
+                if rule is None:
+                    continue
+                allowed, low, high = _constraints(var)
+                if allowed is not None:
+                    rule.allowed = frozenset(allowed) if rule.allowed is None else rule.allowed & allowed
+                if low is not None:
+                    rule.min = low if rule.min is None else max(rule.min, low)
+                if high is not None:
+                    rule.max = high if rule.max is None else min(rule.max, high)
+        return cls(rules)
+
+    def validate(self, vars_dict: dict[str, Any]) -> list[Violation]:
+        """
+        Check a proposed set of variables. Returns [] if everything is allowed.
+
+        An empty rule set (no variables.tf found) allows everything.
+        """
+        if not self.rules:
+            return []
+        violations = []
+        for name, value in vars_dict.items():
+            rule = self.rules.get(name)
+            if rule is None:
+                violations.append(Violation(name, value, "not a variable the platform exposes"))
+                continue
+
+            if rule.type == "number":
+                number = _as_number(value)
+                if number is None:
+                    violations.append(Violation(name, value, "must be a number"))
+                    continue
+                if (rule.min is not None and number < rule.min) or (rule.max is not None and number > rule.max):
+                    violations.append(Violation(name, value, _range_text(rule)))
+                    continue
+            elif rule.type in _PYTHON_TYPES and value is not None:
+                expected = _PYTHON_TYPES[rule.type]
+                if not isinstance(value, expected) or (rule.type != "bool" and isinstance(value, bool)):
+                    violations.append(Violation(name, value, f"must be a {rule.type}"))
+                    continue
+
+            if rule.allowed is not None and _hcl_text(value) not in rule.allowed:
+                violations.append(Violation(name, value, f"allowed values: {', '.join(sorted(rule.allowed))}"))
+        return violations
+
+
+def repair_prompt(violations: list[Violation]) -> str:
+    """User message asking the LLM to fix its last proposal."""
+    lines = ["Your proposed configuration violates platform constraints:"]
+    lines.extend(f"- {violation}" for violation in violations)
+    lines.append("")
+    lines.append(
+        "Return a corrected ```json block that satisfies these constraints. "
+        "If the request cannot be met within them, explain why and propose the closest allowed configuration."
+    )
+    return "\n".join(lines)
+
+
+_rule_sets: dict[str, tuple[str, RuleSet]] = {}
+_rule_sets_lock = threading.Lock()
+
+
+def get_rule_set(terraform_dir: Path) -> RuleSet:
+    """Rule set for a Terraform tree, recompiled only when its variables change."""
+    context_hash = get_context_with_audit(terraform_dir).context_hash
+    key = str(terraform_dir)
+    with _rule_sets_lock:
+        cached = _rule_sets.get(key)
+        if cached and cached[0] == context_hash:
+            return cached[1]
+        root_variables, module_variables = get_variable_metadata(terraform_dir)
+        rule_set = RuleSet.from_variables(root_variables, module_variables.values())
+        _rule_sets[key] = (context_hash, rule_set)
+        return rule_set
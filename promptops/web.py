@@ -6,19 +6,46 @@ Run with: streamlit run web.py
 """
 
 import os
-import re
-import json
-import subprocess
+import time
+import uuid
+from collections import deque
 import streamlit as st
 from pathlib import Path
-from openai import OpenAI
-from context_builder import get_context_with_audit, build_full_prompt
+from context_builder import (
+    get_context_with_audit, get_relevant_context, build_full_prompt, build_static_prefix, cacheable_prefix_tokens,
+)
+import candidates
+import fast_path
+from llm import backend_from_env
+from streaming import ChatStream, extract_json_block
+from response_cache import ResponseCache, response_cache_from_env
+from history import history_manager_from_env, estimate_tokens
+from environments import (
+    check_rollout, environment_instructions, environment_names, get_environments,
+    rollout_text, rollout_violations, tfvars_file, variable_matrix, write_rollout,
+)
+from fanout import FanoutPlanner
+from intent_log import IntentRecord, content_hash, get_intent_log
+from jobs import SUCCEEDED, JobRunner
+from plan_cache import plan_cache_from_env
+from plan_summary import ACTIONS, ACTION_SYMBOLS, PlanSummary
+from terraform_outputs import OutputsCache
+from terraform_runner import QUICK_PLAN_DEFAULT, TerraformWorkspace
+from tfvars import TfvarsFile
+from validator import REPAIR_ATTEMPTS, get_rule_set, repair_prompt
+from structured_output import structured_output_from_env
+from metrics import RequestMetrics, fill_token_counts, get_registry, start_metrics_server_from_env
 
 # Paths
 REPO_ROOT = Path(__file__).parent.parent
 TF_DIR = REPO_ROOT / "terraform"
 TFVARS_PATH = TF_DIR / "terraform.tfvars"
 PROMPTS_DIR = Path(__file__).parent / "prompts"
+# Full terraform output of each job; the page only holds the last lines
+JOBS_DIR = REPO_ROOT / ".promptops" / "jobs"
+
+# Resource changes per page in the plan summary
+PLAN_PAGE_SIZE = 25
 
 # Page config
 st.set_page_config(
@@ -30,7 +57,15 @@ st.set_page_config(
 # Debug mode - set PROMPTOPS_DEBUG_CONTEXT=true to enable
 DEBUG_CONTEXT = os.getenv("PROMPTOPS_DEBUG_CONTEXT", "").lower() == "true"
 
-# Load base system prompt (without context injection)
+# Metrics - PROMPTOPS_METRICS_FILE / PROMPTOPS_METRICS_PORT expose Prometheus text
+start_metrics_server_from_env()
+
+# Stream LLM tokens into the chat as they arrive - set PROMPTOPS_STREAM=false to disable.
+# Sampling several candidates (PROMPTOPS_CANDIDATES > 1) needs whole replies.
+STREAM_RESPONSES = os.getenv("PROMPTOPS_STREAM", "true").lower() != "false" and candidates.CANDIDATES <= 1
+
+# Load base system and planning prompts (without context injection).
+# build_full_prompt() puts them in a fixed order around the platform context.
 @st.cache_data
 def load_base_prompt():
     system_file = PROMPTS_DIR / "system.txt"
@@ -39,11 +74,12 @@ def load_base_prompt():
     system = system_file.read_text() if system_file.exists() else "You are an infrastructure planning assistant."
     planning = planning_file.read_text() if planning_file.exists() else ""
 
-    return f"{system}\n\n{planning}"
+    return system, planning
 
 
 # Build platform context with audit trail
-@st.cache_data
+# Not wrapped in st.cache_data: context_builder keeps its own mtime/hash-keyed
+# cache, so edits to variables.tf show up without restarting Streamlit.
 def load_platform_context():
     """
     Build platform context from Terraform files.
@@ -53,62 +89,146 @@ def load_platform_context():
     return result.platform_context, result.summary(), result.files_read
 
 
+# One managed working directory: init once, shared plugin cache, tuned -parallelism
+@st.cache_resource
+def get_workspace():
+    return TerraformWorkspace(TF_DIR)
+
+
+# Terraform outputs for the app status panel, shared by all sessions
+@st.cache_resource
+def get_outputs_cache():
+    return OutputsCache(TF_DIR, env=get_workspace().env())
+
+
+# Stored plans keyed on every plan input: "Run Plan" with nothing changed is instant
+# (PROMPTOPS_PLAN_CACHE=false to always plan)
+@st.cache_resource
+def get_plan_cache():
+    return plan_cache_from_env(TF_DIR, REPO_ROOT / ".promptops" / "plans")
+
+
+# Identical prompts + identical platform context -> reuse the stored reply
+# (PROMPTOPS_RESPONSE_CACHE=false to bypass)
+@st.cache_resource
+def get_response_cache():
+    return response_cache_from_env(REPO_ROOT / ".promptops" / "response_cache.sqlite")
+
+
+# JSON-schema constrained replies for non-streamed calls (PROMPTOPS_STRUCTURED_OUTPUT).
+# Shared so a backend that rejects response_format is only tried once.
+@st.cache_resource
+def get_structured_output():
+    return structured_output_from_env(get_llm_backend().supports_structured)
+
+
 def get_final_system_prompt():
     """Get the complete system prompt with platform context injected."""
-    base_prompt = load_base_prompt()
+    system_prompt, planning_prompt = load_base_prompt()
     platform_context, _, _ = load_platform_context()
-    return base_prompt.replace("{PLATFORM_CONTEXT}", platform_context)
+    return build_static_prefix(system_prompt, platform_context, planning_prompt)
+
+
+# Parsed once, re-read only when the file changes on disk
+@st.cache_resource
+def get_tfvars_file():
+    return TfvarsFile(TFVARS_PATH, header="# Generated by PromptOps\n\n")
 
 
 def load_existing_tfvars():
     """Load existing terraform.tfvars as a dict"""
-    if not TFVARS_PATH.exists():
-        return {}
-
-    content = TFVARS_PATH.read_text()
-    result = {}
-
-    for line in content.split('\n'):
-        line = line.strip()
-        if not line or line.startswith('#'):
-            continue
-        if '=' in line:
-            key, value = line.split('=', 1)
-            key = key.strip()
-            value = value.strip()
-
-            # Parse value
-            if value.startswith('"') and value.endswith('"'):
-                result[key] = value[1:-1]
-            elif value == 'true':
-                result[key] = True
-            elif value == 'false':
-                result[key] = False
-            elif value.isdigit():
-                result[key] = int(value)
-            else:
-                try:
-                    result[key] = json.loads(value)
-                except:
-                    result[key] = value
-
-    return result
-
-
-def save_tfvars(vars_dict):
-    """Save dict to terraform.tfvars"""
-    tfvars = "# Generated by PromptOps\n\n"
-    for key, value in vars_dict.items():
-        if isinstance(value, str):
-            tfvars += f'{key} = "{value}"\n'
-        elif isinstance(value, bool):
-            tfvars += f'{key} = {str(value).lower()}\n'
+    return get_tfvars_file().load()
+
+
+def apply_config_update(new_vars):
+    """Merge LLM-proposed vars into terraform.tfvars (so partial updates work)."""
+    # Only changed keys are rewritten; comments and other values are kept
+    content, _ = get_tfvars_file().merge(new_vars)
+    st.session_state.tfvars_content = content
+    return content
+
+
+def selected_environments():
+    """Environments the chat targets; empty means terraform/terraform.tfvars."""
+    return get_environments(TF_DIR, st.session_state.target_envs)
+
+
+def apply_if_valid(new_vars):
+    """Save a streamed proposal early only if it passes local validation."""
+    if not get_rule_set(TF_DIR).validate(new_vars):
+        apply_config_update(new_vars)
+
+
+def check_proposal(messages, assistant_msg, new_vars, environments=()):
+    """
+    Validate the proposed vars against the platform constraints.
+
+    Valid vars are saved. Violations are sent back to the LLM as a repair
+    turn (up to PROMPTOPS_REPAIR_ATTEMPTS) instead of surfacing minutes later
+    in terraform plan. With environments the proposal is split, checked and
+    written per environment; it is only written if every environment is valid.
+
+    Returns (assistant message to show, final proposal, resulting
+    terraform.tfvars content or None if nothing was applied, violations).
+    """
+    rules = get_rule_set(TF_DIR)
+    notes = []
+    content = None
+    for attempt in range(REPAIR_ATTEMPTS + 1):
+        if environments and new_vars:
+            results = check_rollout(environments, new_vars, rules)
+            violations = rollout_violations(results)
         else:
-            tfvars += f'{key} = {json.dumps(value)}\n'
+            violations = rules.validate(new_vars) if new_vars else []
+        if not violations:
+            if new_vars and environments:
+                content = rollout_text(write_rollout(results, header="# Generated by PromptOps\n\n")) or None
+            elif new_vars:
+                content = apply_config_update(new_vars)
+            break
+        details = "\n".join(f"- {v}" for v in violations)
+        if attempt == REPAIR_ATTEMPTS:
+            notes.append(f"⚠️ Not applied, this proposal violates platform constraints:\n{details}")
+            break
+
+        notes.append(f"_Corrected automatically, the first proposal violated platform constraints:_\n{details}")
+        messages = messages + [
+            {"role": "assistant", "content": assistant_msg},
+            {"role": "user", "content": repair_prompt(violations)},
+        ]
+        request_metrics = RequestMetrics(source="web", model=LLM_MODEL,
+                                         prefix_tokens=cacheable_prefix_tokens(messages))
+        request_start = time.perf_counter()
+        with st.spinner("Fixing proposal..."):
+            best, usage = candidates.generate(
+                client,
+                get_structured_output(),
+                rules,
+                model=LLM_MODEL,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=2000,
+                timeout=60
+            )
+        assistant_msg = best.text
+        request_metrics.total_s = time.perf_counter() - request_start
+        fill_token_counts(request_metrics, messages, assistant_msg, usage)
+        get_registry().record(request_metrics)
+        new_vars = extract_json_block(assistant_msg)
 
-    TFVARS_PATH.parent.mkdir(parents=True, exist_ok=True)
-    TFVARS_PATH.write_text(tfvars)
-    return tfvars
+    if notes:
+        assistant_msg = assistant_msg + "\n\n" + "\n\n".join(notes)
+    return assistant_msg, new_vars, content, violations
+
+
+def fast_answer(prompt, environments):
+    """Answer a common intent from the current tfvars, without the LLM (fast_path.py)."""
+    shared = load_existing_tfvars()
+    if environments:
+        current = {env.name: {**shared, **tfvars_file(env).load()} for env in environments}
+    else:
+        current = {"": shared}
+    return fast_path.answer(prompt, TF_DIR, current)
 
 
 # Initialize session state
@@ -120,28 +240,159 @@ if "plan_output" not in st.session_state:
     st.session_state.plan_output = ""
 if "last_debug_output" not in st.session_state:
     st.session_state.last_debug_output = None
+if "last_context" not in st.session_state:
+    st.session_state.last_context = None
+if "session_id" not in st.session_state:
+    # Groups this browser session's requests in the intent log
+    st.session_state.session_id = f"web-{uuid.uuid4().hex[:8]}"
+if "job_runner" not in st.session_state:
+    st.session_state.job_runner = JobRunner(log_dir=JOBS_DIR / st.session_state.session_id)
+if "cached_plan" not in st.session_state:
+    st.session_state.cached_plan = None
+if "plan_summary" not in st.session_state:
+    # (job id, summary file) of the last plan job
+    st.session_state.plan_summary = None
+if "quick_plan" not in st.session_state:
+    st.session_state.quick_plan = QUICK_PLAN_DEFAULT
+if "target_envs" not in st.session_state:
+    st.session_state.target_envs = []
+if "fanout" not in st.session_state:
+    # FanoutPlanner of the last multi-environment plan
+    st.session_state.fanout = None
 
 # Header
 st.title("🏗️ PromptOps")
 st.markdown("*Tell the AI what you need. It figures out the config. You approve and execute.*")
 
-# LLM Provider configuration
-# Set PROMPTOPS_LOCAL=true to use Ollama instead of OpenAI
-USE_LOCAL = os.getenv("PROMPTOPS_LOCAL", "").lower() == "true"
-LOCAL_MODEL = os.getenv("PROMPTOPS_LOCAL_MODEL", "llama3.1")
-LOCAL_URL = os.getenv("PROMPTOPS_LOCAL_URL", "http://localhost:11434/v1")
-
-if USE_LOCAL:
-    client = OpenAI(base_url=LOCAL_URL, api_key="ollama")
-    LLM_MODEL = LOCAL_MODEL
-    st.info(f"🏠 Using local model: **{LOCAL_MODEL}** via {LOCAL_URL}")
-else:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        st.error("⚠️ OPENAI_API_KEY not set. Run: `export OPENAI_API_KEY='sk-...'` or use `PROMPTOPS_LOCAL=true` for Ollama.")
-        st.stop()
-    client = OpenAI(api_key=api_key)
-    LLM_MODEL = os.getenv("PROMPTOPS_MODEL", "gpt-4o")
+# LLM backend, built once per process so its connection pool is reused across reruns.
+# Set PROMPTOPS_LOCAL=true to use Ollama, PROMPTOPS_LLM_BACKEND=mock to run offline.
+@st.cache_resource
+def get_llm_backend():
+    return backend_from_env()
+
+
+try:
+    client = get_llm_backend()
+except ValueError as e:
+    st.error(f"⚠️ {e}\n\nRun: `export OPENAI_API_KEY='sk-...'` or use `PROMPTOPS_LOCAL=true` for Ollama.")
+    st.stop()
+LLM_MODEL = client.model
+if client.name != "openai":
+    st.info(f"🏠 Using {client.description}")
+
+
+def ask_llm(prompt, environments, container):
+    """
+    Send the conversation to the LLM (or the response cache).
+
+    Returns (messages sent, assistant message, extracted vars). When
+    streaming, the reply is rendered into container as it arrives.
+    """
+    # Build the full prompt explicitly
+    system_prompt, planning_prompt = load_base_prompt()
+    # Full history stays on screen; only a budgeted copy is sent
+    history = history_manager_from_env().compact(st.session_state.messages)
+    if environments:
+        # One reply for every target environment
+        instructions = environment_instructions([env.name for env in environments])
+        history = history[:-1] + [{**history[-1], "content": f"{history[-1]['content']}\n\n{instructions}"}]
+    context_start = time.perf_counter()
+    # Large catalogs are pruned to the variables this conversation needs
+    context = get_relevant_context(TF_DIR, history)
+    request_metrics = RequestMetrics(
+        source="web",
+        model=LLM_MODEL,
+        context_build_s=time.perf_counter() - context_start,
+        context_tokens=context.tokens,
+        context_saved_tokens=context.saved_tokens,
+    )
+    messages, debug_output = build_full_prompt(
+        system_prompt=system_prompt,
+        platform_context=context.platform_context,
+        user_messages=history,
+        debug=DEBUG_CONTEXT,
+        planning_prompt=planning_prompt,
+    )
+    request_metrics.history_tokens = sum(estimate_tokens(m["content"]) for m in messages[1:])
+    request_metrics.prefix_tokens = cacheable_prefix_tokens(messages)
+
+    # Log to console if debug enabled
+    if DEBUG_CONTEXT and debug_output:
+        print(debug_output)
+
+    # Store for UI display
+    st.session_state.last_debug_output = debug_output
+    st.session_state.last_context = context
+
+    response_cache = get_response_cache()
+    # Streaming replies are single, plain-text completions
+    cache_key = ResponseCache.make_key(
+        LLM_MODEL, 0.7, messages, context.context_hash,
+        structured=not STREAM_RESPONSES and get_structured_output().enabled,
+        candidates=1 if STREAM_RESPONSES else candidates.CANDIDATES,
+    )
+    request_start = time.perf_counter()
+    cached_msg = response_cache.get(cache_key)
+    usage = None
+
+    if cached_msg is not None:
+        assistant_msg = cached_msg
+        request_metrics.cached = True
+        extract_start = time.perf_counter()
+        new_vars = extract_json_block(assistant_msg)
+        request_metrics.json_extract_s = time.perf_counter() - extract_start
+    elif STREAM_RESPONSES:
+        # Render tokens as they arrive; the config is saved the moment
+        # the ```json block closes (if valid), not after the whole response.
+        with container:
+            with st.chat_message("user"):
+                st.markdown(prompt)
+            with st.chat_message("assistant"):
+                stream = ChatStream(
+                    client,
+                    # A rollout is only written once every environment is valid
+                    on_json=None if environments else apply_if_valid,
+                    include_usage=client.supports_usage,
+                    model=LLM_MODEL,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=2000,
+                    timeout=60
+                )
+                st.write_stream(stream)
+        assistant_msg = stream.text
+        new_vars = stream.json_block
+        usage = stream.usage
+        request_metrics.first_token_s = stream.first_token_s
+        request_metrics.json_extract_s = stream.json_extract_s
+        response_cache.put(cache_key, assistant_msg)
+    else:
+        with st.spinner("Thinking..."):
+            # Best of PROMPTOPS_CANDIDATES samples (one call by default)
+            best, usage = candidates.generate(
+                client,
+                get_structured_output(),
+                get_rule_set(TF_DIR),
+                model=LLM_MODEL,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=2000,
+                timeout=60
+            )
+
+        assistant_msg = best.text
+        response_cache.put(cache_key, assistant_msg)
+
+        # Extract JSON config if present
+        extract_start = time.perf_counter()
+        new_vars = extract_json_block(assistant_msg)
+        request_metrics.json_extract_s = time.perf_counter() - extract_start
+
+    request_metrics.total_s = time.perf_counter() - request_start
+    fill_token_counts(request_metrics, messages, assistant_msg, usage)
+    get_registry().record(request_metrics)
+    return messages, assistant_msg, new_vars
+
 
 # Layout: 2 columns
 col1, col2 = st.columns([1, 1])
@@ -157,60 +408,39 @@ with col1:
             with st.chat_message(msg["role"]):
                 st.markdown(msg["content"])
 
-    # Chat input
-    if prompt := st.chat_input("Ask for infrastructure or changes..."):
+    # Chat input; the example buttons below queue their prompt for the next run
+    prompt = st.chat_input("Ask for infrastructure or changes...") or st.session_state.pop("pending_prompt", None)
+    if prompt:
         # Add user message
         st.session_state.messages.append({"role": "user", "content": prompt})
 
-        # Call GPT-4
-        with st.spinner("Thinking..."):
-            try:
-                # Build the full prompt explicitly
-                base_prompt = load_base_prompt()
-                platform_context, _, _ = load_platform_context()
-                messages, debug_output = build_full_prompt(
-                    system_prompt=base_prompt,
-                    platform_context=platform_context,
-                    user_messages=st.session_state.messages,
-                    debug=DEBUG_CONTEXT
-                )
-
-                # Log to console if debug enabled
-                if DEBUG_CONTEXT and debug_output:
-                    print(debug_output)
-
-                # Store for UI display
-                st.session_state.last_debug_output = debug_output
-
-                response = client.chat.completions.create(
-                    model=LLM_MODEL,
-                    messages=messages,
-                    temperature=0.7,
-                    max_tokens=2000,
-                    timeout=60
-                )
-
-                assistant_msg = response.choices[0].message.content
-                st.session_state.messages.append({"role": "assistant", "content": assistant_msg})
-
-                # Extract JSON config if present
-                json_match = re.search(r'```json\s*(\{.*?\})\s*```', assistant_msg, re.DOTALL)
-                if json_match:
-                    try:
-                        new_vars = json.loads(json_match.group(1))
-
-                        # Merge with existing config (so partial updates work)
-                        existing_vars = load_existing_tfvars()
-                        existing_vars.update(new_vars)
-
-                        # Save merged config
-                        st.session_state.tfvars_content = save_tfvars(existing_vars)
-
-                    except json.JSONDecodeError:
-                        pass
-
-            except Exception as e:
-                st.session_state.messages.append({"role": "assistant", "content": f"⚠️ Error calling LLM: {e}"})
+        # Call GPT-4 (unless the fast path answers)
+        try:
+            environments = selected_environments()
+            # Common intents are answered from the current tfvars, without a round trip
+            fast = fast_answer(prompt, environments)
+            if fast:
+                messages = history_manager_from_env().compact(st.session_state.messages)
+                assistant_msg, new_vars = fast.text, fast.proposal
+            else:
+                messages, assistant_msg, new_vars = ask_llm(prompt, environments, chat_container)
+
+            assistant_msg, new_vars, tfvars_content, violations = check_proposal(messages, assistant_msg, new_vars, environments)
+            st.session_state.messages.append({"role": "assistant", "content": assistant_msg})
+            get_intent_log().append(IntentRecord(
+                intent=prompt,
+                response=assistant_msg,
+                session_id=st.session_state.session_id,
+                source="web",
+                model=fast_path.FAST_PATH_MODEL if fast else LLM_MODEL,
+                tfvars=new_vars,
+                tfvars_hash=content_hash(tfvars_content) if tfvars_content is not None else None,
+                tfvars_written=tfvars_content is not None,
+                violations=[str(v) for v in violations],
+            ))
+
+        except Exception as e:
+            st.session_state.messages.append({"role": "assistant", "content": f"⚠️ Error calling LLM: {e}"})
 
         st.rerun()
 
@@ -220,108 +450,201 @@ with col1:
     col_ex1, col_ex2 = st.columns(2)
     with col_ex1:
         if st.button("🖥️ Create a VM", use_container_width=True):
-            st.session_state.messages.append({"role": "user", "content": "I need a GPU VM"})
+            st.session_state.pending_prompt = "I need a GPU VM"
             st.rerun()
         if st.button("💰 Make it cheaper", use_container_width=True):
-            st.session_state.messages.append({"role": "user", "content": "Make the VM cheaper"})
+            st.session_state.pending_prompt = "Make the VM cheaper"
             st.rerun()
         if st.button("🔓 Enable Streamlit", use_container_width=True):
-            st.session_state.messages.append({"role": "user", "content": "Enable access to the Streamlit app"})
+            st.session_state.pending_prompt = "Enable access to the Streamlit app"
             st.rerun()
     with col_ex2:
         if st.button("❌ Use V100 (invalid)", use_container_width=True):
-            st.session_state.messages.append({"role": "user", "content": "Use a V100 GPU"})
+            st.session_state.pending_prompt = "Use a V100 GPU"
             st.rerun()
         if st.button("❌ Open port 9000 (invalid)", use_container_width=True):
-            st.session_state.messages.append({"role": "user", "content": "Open port 9000"})
+            st.session_state.pending_prompt = "Open port 9000"
             st.rerun()
         if st.button("🔒 Enable encryption", use_container_width=True):
-            st.session_state.messages.append({"role": "user", "content": "Enable disk encryption"})
+            st.session_state.pending_prompt = "Enable disk encryption"
             st.rerun()
 
 # RIGHT COLUMN: Config & Plan
 with col2:
     st.subheader("📄 Configuration")
 
-    # Load current tfvars if exists
-    if TFVARS_PATH.exists() and not st.session_state.tfvars_content:
-        st.session_state.tfvars_content = TFVARS_PATH.read_text()
-
-    # Show tfvars
-    tfvars_display = st.session_state.tfvars_content or "# No configuration yet\n# Chat to generate one"
-    st.code(tfvars_display, language="hcl")
+    # Several environments: one request is rolled out to each of them
+    env_options = environment_names(TF_DIR)
+    st.session_state.target_envs = [name for name in st.session_state.target_envs if name in env_options]
+    if env_options:
+        st.multiselect("Target environments", env_options, key="target_envs",
+                       placeholder="terraform/terraform.tfvars",
+                       help="Pick environments under terraform/environments/ to roll each request out to all of them")
+
+    if st.session_state.target_envs:
+        # Values per environment, layered over the shared terraform.tfvars
+        only_differing = st.toggle("Only differing variables", key="only_differing")
+        st.dataframe(variable_matrix(selected_environments(), get_tfvars_file(), only_differing),
+                     use_container_width=True, hide_index=True)
+    else:
+        # Load current tfvars if exists
+        if TFVARS_PATH.exists() and not st.session_state.tfvars_content:
+            st.session_state.tfvars_content = get_tfvars_file().text()
+
+        # Show tfvars
+        tfvars_display = st.session_state.tfvars_content or "# No configuration yet\n# Chat to generate one"
+        st.code(tfvars_display, language="hcl")
 
 # Full width: Plan output and actions
 st.divider()
 
 col_plan, col_actions = st.columns([3, 1])
 
+def fanout_running():
+    return st.session_state.fanout is not None and st.session_state.fanout.running
+
+
+def refuse_during_fanout():
+    """True (and say so in the output panel) while a fan-out plan is still running."""
+    if not fanout_running():
+        return False
+    st.session_state.plan_output = "Error: the environment plans are still running. Wait for them to finish or cancel them."
+    return True
+
+
+def start_terraform_job(command, steps, timeout, on_finish=None):
+    """Launch terraform steps (init if needed, then command) in the background; the output panel streams them."""
+    # A running fan-out uses the same configuration and plugin cache; never orphan it
+    if refuse_during_fanout():
+        return None
+    workspace = get_workspace()
+    then = on_finish
+    # apply/destroy change outputs and state; drop cached outputs and plans when they finish
+    invalidate = command in ("apply", "destroy")
+    outputs_cache = get_outputs_cache()
+    plan_cache = get_plan_cache()
+
+    def on_finish(job):
+        workspace.job_finished(job)
+        if invalidate:
+            outputs_cache.invalidate()
+            plan_cache.invalidate()
+        if then:
+            then(job)
+    try:
+        job = st.session_state.job_runner.start(
+            command, steps[-1][1], cwd=TF_DIR, timeout=timeout,
+            on_finish=on_finish, steps=steps, env=workspace.env(),
+        )
+        st.session_state.plan_output = ""
+        st.session_state.cached_plan = None
+        st.session_state.fanout = None
+        return job
+    except RuntimeError as e:
+        st.session_state.plan_output = f"Error: {e}. Wait for it to finish or cancel it."
+        return None
+
+
+def run_plan():
+    """Show the stored plan if no input changed since it ran, else start `terraform plan -out`."""
+    if refuse_during_fanout():
+        return
+    quick = st.session_state.quick_plan
+    variant = "quick" if quick else ""
+    plan_cache = get_plan_cache()
+    key = plan_cache.key(variant)
+    # Before plan_path(), which clears the stored entry for key
+    if st.session_state.job_runner.busy:
+        st.session_state.plan_output = "Error: terraform is still running. Wait for it to finish or cancel it."
+        return
+    cached = plan_cache.get(key)
+    if cached is not None:
+        st.session_state.cached_plan = cached
+        st.session_state.plan_output = ""
+        return
+
+    plan_file = plan_cache.plan_path(key)
+    summary_file = st.session_state.job_runner.log_dir / "plan.summary.json"
+
+    def store_plan(job):
+        returncode = job.returncode if job.status == SUCCEEDED else 1
+        plan_cache.store(key, job.log_file, returncode, job.phases.get("plan", job.duration),
+                         variant=variant, refreshed=not quick, summary_file=summary_file)
+
+    workspace = get_workspace()
+    steps = workspace.plan_steps(plan_file, quick=quick, summary_file=summary_file)
+    job = start_terraform_job("plan", steps, timeout=workspace.timeout(120), on_finish=store_plan)
+    if job is not None:
+        st.session_state.plan_summary = (job.id, summary_file)
+
+
+def run_fanout_plan():
+    """Plan every target environment on a bounded worker pool (PROMPTOPS_FANOUT_WORKERS)."""
+    if st.session_state.job_runner.busy or fanout_running():
+        st.session_state.plan_output = "Error: terraform is still running. Wait for it to finish or cancel it."
+        return
+    output_dir = JOBS_DIR / st.session_state.session_id / "fanout"
+    st.session_state.fanout = FanoutPlanner(selected_environments(), output_dir,
+                                            quick=st.session_state.quick_plan).start()
+    st.session_state.cached_plan = None
+    st.session_state.plan_output = ""
+
+
+def apply_steps():
+    """
+    Apply the reviewed plan file when it was fully refreshed and still matches
+    every input; otherwise refresh, plan and apply that plan in one job.
+    """
+    plan_cache = get_plan_cache()
+    cached = plan_cache.get(plan_cache.key())
+    return get_workspace().apply_steps(Path(cached.plan_file) if cached is not None else None)
+
+
 with col_actions:
     st.subheader("⚡ Actions")
 
+    # Quick plans skip the refresh for fast chat iteration; apply always refreshes
+    st.toggle("Quick plan (no refresh)", key="quick_plan",
+              help="terraform plan -refresh=false: fast, but blind to drift. Apply still refreshes first.")
+
     # Run Plan button
-    if st.button("🔍 Run Plan", use_container_width=True):
-        with st.spinner("Running terraform plan..."):
-            try:
-                result = subprocess.run(
-                    ["terraform", "plan", "-no-color"],
-                    cwd=TF_DIR,
-                    capture_output=True,
-                    text=True,
-                    timeout=120
-                )
-                st.session_state.plan_output = result.stdout + result.stderr
-            except subprocess.TimeoutExpired:
-                st.session_state.plan_output = "Error: Plan timed out"
-            except Exception as e:
-                st.session_state.plan_output = f"Error: {e}"
+    fanout_targets = st.session_state.target_envs
+    if st.button(f"🔍 Plan {len(fanout_targets)} environments" if fanout_targets else "🔍 Run Plan",
+                 use_container_width=True):
+        if fanout_targets:
+            run_fanout_plan()
+        else:
+            run_plan()
         st.rerun()
 
+    # Apply/Destroy act on the shared configuration, one environment at a time
+    if fanout_targets:
+        st.caption("Apply and Destroy use terraform/terraform.tfvars; clear the target environments to use them.")
+
     # Apply button
-    if st.button("🚀 Apply", use_container_width=True, type="primary"):
+    if st.button("🚀 Apply", use_container_width=True, type="primary", disabled=bool(fanout_targets)):
         st.warning("This creates REAL infrastructure on GCP!")
         st.session_state.show_apply_confirm = True
 
     if st.session_state.get("show_apply_confirm"):
         if st.button("✅ Yes, apply changes", use_container_width=True):
-            with st.spinner("Applying..."):
-                try:
-                    result = subprocess.run(
-                        ["terraform", "apply", "-auto-approve", "-no-color"],
-                        cwd=TF_DIR,
-                        capture_output=True,
-                        text=True,
-                        timeout=600
-                    )
-                    st.session_state.plan_output = result.stdout + result.stderr
-                    st.session_state.show_apply_confirm = False
-                except Exception as e:
-                    st.session_state.plan_output = f"Error: {e}"
+            start_terraform_job("apply", apply_steps(), timeout=get_workspace().timeout(600))
+            st.session_state.show_apply_confirm = False
             st.rerun()
         if st.button("❌ Cancel", use_container_width=True):
             st.session_state.show_apply_confirm = False
             st.rerun()
 
     # Destroy button
-    if st.button("💥 Destroy", use_container_width=True):
+    if st.button("💥 Destroy", use_container_width=True, disabled=bool(fanout_targets)):
         st.session_state.show_destroy_confirm = True
 
     if st.session_state.get("show_destroy_confirm"):
         st.error("This will DELETE all infrastructure!")
         if st.button("✅ Yes, destroy", use_container_width=True):
-            with st.spinner("Destroying..."):
-                try:
-                    result = subprocess.run(
-                        ["terraform", "destroy", "-auto-approve", "-no-color"],
-                        cwd=TF_DIR,
-                        capture_output=True,
-                        text=True,
-                        timeout=300
-                    )
-                    st.session_state.plan_output = result.stdout + result.stderr
-                    st.session_state.show_destroy_confirm = False
-                except Exception as e:
-                    st.session_state.plan_output = f"Error: {e}"
+            start_terraform_job("destroy", get_workspace().destroy_steps(),
+                                timeout=get_workspace().timeout(300))
+            st.session_state.show_destroy_confirm = False
             st.rerun()
         if st.button("❌ Cancel", use_container_width=True, key="cancel_destroy"):
             st.session_state.show_destroy_confirm = False
@@ -334,55 +657,181 @@ with col_actions:
         st.session_state.messages = []
         st.rerun()
 
-with col_plan:
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def load_plan_summary(path, mtime_ns):
+    """Parsed summary file; mtime_ns in the cache key picks up a rewritten file."""
+    return PlanSummary.load(Path(path))
+
+
+def tail_file(path, n=500):
+    """Last n lines of a log file, read line by line."""
+    try:
+        with open(path) as f:
+            return "\n".join(line.rstrip("\n") for line in deque(f, maxlen=n))
+    except OSError:
+        return ""
+
+
+def render_plan_summary(summary, key):
+    """Change counts, one page of resource changes, and attribute detail for the one picked."""
+    if summary.errored:
+        st.error("Terraform reported errors while planning")
+    for col, action, label in zip(st.columns(len(ACTIONS)), ACTIONS, ("Add", "Change", "Replace", "Destroy", "Read")):
+        col.metric(f"{ACTION_SYMBOLS[action]} {label}", summary.counts.get(action, 0))
+    notes = [f"{summary.unchanged} unchanged"]
+    if summary.drift:
+        notes.append(f"{summary.drift} changed outside Terraform")
+    if summary.outputs:
+        notes.append("outputs: " + ", ".join(f"{name} ({action})" for name, action in summary.outputs.items()))
+    st.caption(" · ".join(notes))
+    if not summary.changes:
+        st.info("No changes. Your infrastructure matches the configuration.")
+        return
+
+    present = [action for action in ACTIONS if summary.counts.get(action)]
+    shown = st.multiselect("Show", present, default=present, key=f"{key}_actions")
+    rows = [change for change in summary.changes if change.action in shown]
+    pages = max(1, -(-len(rows) // PLAN_PAGE_SIZE))
+    page = st.number_input(f"Page (of {pages})", 1, pages, 1, key=f"{key}_page") if pages > 1 else 1
+    page_rows = rows[(page - 1) * PLAN_PAGE_SIZE:page * PLAN_PAGE_SIZE]
+    st.dataframe(
+        [{"": ACTION_SYMBOLS[c.action], "action": c.action, "address": c.address,
+          "changed attributes": len(c.attributes)} for c in page_rows],
+        use_container_width=True, hide_index=True,
+    )
+
+    selected = st.selectbox("Details", [c.address for c in page_rows], index=None,
+                            placeholder="Pick a resource to see its attribute changes", key=f"{key}_detail")
+    if selected:
+        change = next(c for c in page_rows if c.address == selected)
+        lines = [f"{ACTION_SYMBOLS[change.action]} {change.address}"]
+        for name, (before, after) in change.attributes.items():
+            forces = "  # forces replacement" if name in change.replace_paths else ""
+            lines.append(f"    {name}: {before or '-'} -> {after or '-'}{forces}")
+        st.code("\n".join(lines), language=None)
+
+
+def render_fanout(fanout):
+    """Side-by-side results of a multi-environment plan, with one environment's detail on demand."""
+    done = sum(1 for plan in fanout.plans if plan.job is not None and not plan.job.running)
+    if fanout.running:
+        col_status, col_cancel = st.columns([3, 1])
+        col_status.info(f"⏳ Planning {len(fanout.plans)} environments, {fanout.workers} at a time "
+                        f"({done} done, {fanout.duration:.0f}s)")
+        if col_cancel.button("⏹️ Cancel", use_container_width=True, key="cancel_fanout"):
+            fanout.cancel()
+    else:
+        failed = [plan.environment.name for plan in fanout.plans if plan.status != SUCCEEDED]
+        message = f"{len(fanout.plans)} environments planned in {fanout.duration:.1f}s"
+        if failed:
+            st.error(f"❌ {message}; failed: {', '.join(failed)}")
+        else:
+            st.success(f"✅ {message}")
+    st.dataframe(fanout.comparison_rows(), use_container_width=True, hide_index=True)
+
+    names = [plan.environment.name for plan in fanout.plans if plan.job is not None and not plan.job.running]
+    selected = st.selectbox("Environment detail", names, index=None, key="fanout_detail",
+                            placeholder="Pick an environment to see its changes")
+    if selected:
+        plan = next(plan for plan in fanout.plans if plan.environment.name == selected)
+        if plan.summary is not None:
+            render_plan_summary(plan.summary, f"fanout_{selected}_{id(fanout)}")
+        with st.expander("Raw output", expanded=plan.summary is None):
+            st.code(plan.job.tail(500), language="bash", line_numbers=False)
+
+
+# While a job runs this fragment re-runs on its own every second, so output
+# streams into the panel without blocking (or re-running) the rest of the page.
+@st.fragment(run_every=1 if st.session_state.job_runner.busy or fanout_running() else None)
+def render_terraform_output():
     st.subheader("📋 Terraform Output")
 
-    plan_display = st.session_state.plan_output or "# No output yet\n# Click 'Run Plan' to see what will change"
-    st.code(plan_display, language="bash", line_numbers=False)
+    if st.session_state.fanout is not None:
+        if st.session_state.plan_output:
+            st.warning(st.session_state.plan_output)
+        render_fanout(st.session_state.fanout)
+        return
+
+    runner = st.session_state.job_runner
+    job = runner.current
+
+    cached_plan = st.session_state.cached_plan
+    if cached_plan is not None:
+        created = time.strftime("%H:%M:%S", time.localtime(cached_plan.created_at))
+        reuse = "Apply will use it" if cached_plan.refreshed else "quick plan; Apply will refresh first"
+        st.success(f"⚡ Nothing changed since the plan at {created} "
+                   f"(took {cached_plan.duration_s:.1f}s) - showing the stored plan; {reuse}")
+        summary = cached_plan.summary()
+        if summary is not None:
+            render_plan_summary(summary, f"plan_{cached_plan.key[:12]}")
+        with st.expander("Raw output", expanded=summary is None):
+            st.code(tail_file(cached_plan.output_file), language="bash", line_numbers=False)
+        return
+
+    if job is None:
+        plan_display = st.session_state.plan_output or "# No output yet\n# Click 'Run Plan' to see what will change"
+        st.code(plan_display, language="bash", line_numbers=False)
+        return
+
+    if st.session_state.plan_output:
+        st.warning(st.session_state.plan_output)
+
+    if job.running:
+        col_status, col_cancel = st.columns([3, 1])
+        phases = f" - {job.phase_text()}" if job.phases else ""
+        col_status.info(f"⏳ terraform {job.name} running ({job.duration:.0f}s){phases}")
+        if col_cancel.button("⏹️ Cancel", use_container_width=True, key=f"cancel_job_{job.id}"):
+            job.cancel()
+    elif job.status == "succeeded":
+        phases = f" ({job.phase_text()})" if len(job.phases) > 1 else ""
+        st.success(f"✅ terraform {job.name} finished in {job.duration:.1f}s{phases}")
+    else:
+        phases = f", {job.phase_text()}" if job.phases else ""
+        st.error(f"❌ terraform {job.name} {job.status} after {job.duration:.1f}s (exit code {job.returncode}{phases})")
+
+    summary = None
+    plan_summary = st.session_state.plan_summary
+    if not job.running and plan_summary and plan_summary[0] == job.id and plan_summary[1].exists():
+        summary = load_plan_summary(str(plan_summary[1]), plan_summary[1].stat().st_mtime_ns)
+    if summary is not None:
+        render_plan_summary(summary, f"plan_job_{job.id}")
+        with st.expander("Raw output", expanded=False):
+            st.code(job.tail(500), language="bash", line_numbers=False)
+    else:
+        st.code(job.tail(500) or "# Waiting for output...", language="bash", line_numbers=False)
+    if job.log_file and not job.running:
+        st.caption(f"Full output: {job.log_file}")
+
+    if len(runner.history) > 1 or not job.running:
+        with st.expander("Job history", expanded=False):
+            st.dataframe([j.summary() for j in runner.history], use_container_width=True)
+
+
+with col_plan:
+    render_terraform_output()
 
 # Demo App Status
 st.divider()
 
 # Check if we have outputs and show app status
-try:
-    app_status_result = subprocess.run(
-        ["terraform", "output", "-raw", "app_status"],
-        cwd=TF_DIR,
-        capture_output=True,
-        text=True,
-        timeout=5
-    )
+# One cached `terraform output -json`, refreshed only when state changes
+outputs = get_outputs_cache().get()
 
-    app_accessible_result = subprocess.run(
-        ["terraform", "output", "-raw", "app_accessible"],
-        cwd=TF_DIR,
-        capture_output=True,
-        text=True,
-        timeout=5
-    )
+if outputs.get("app_status") is not None:
+    app_status = outputs["app_status"]
+    is_accessible = bool(outputs.get("app_accessible", outputs.get("streamlit_enabled")))
 
-    if app_status_result.returncode == 0:
-        app_status = app_status_result.stdout.strip()
-        is_accessible = app_accessible_result.stdout.strip() == "true"
+    st.subheader("🎯 Demo App Status")
 
-        st.subheader("🎯 Demo App Status")
-
-        if is_accessible:
-            st.success(f"**{app_status}**")
-            app_url_result = subprocess.run(
-                ["terraform", "output", "-raw", "app_url"],
-                cwd=TF_DIR,
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            if app_url_result.returncode == 0:
-                st.markdown(f"### [Open Demo App]({app_url_result.stdout.strip()})")
-        else:
-            st.warning(f"**{app_status}**")
-            st.info("💡 Say: *'Open access to the app'* to enable the firewall")
-except:
-    pass  # No outputs yet, that's fine
+    if is_accessible:
+        st.success(f"**{app_status}**")
+        app_url = outputs.get("app_url") or next(iter(outputs.get("app_urls") or []), None)
+        if app_url:
+            st.markdown(f"### [Open Demo App]({app_url})")
+    else:
+        st.warning(f"**{app_status}**")
+        st.info("💡 Say: *'Open access to the app'* to enable the firewall")
 
 # Footer
 st.divider()
@@ -407,7 +856,36 @@ if DEBUG_CONTEXT:
         platform_context, _, _ = load_platform_context()
         st.code(platform_context, language="markdown")
 
+        last_context = st.session_state.last_context
+        if last_context is not None:
+            if last_context.pruned:
+                st.caption(
+                    f"Last request used {len(last_context.variables)} relevant variables: "
+                    f"{last_context.full_tokens} -> {last_context.tokens} tokens "
+                    f"({last_context.saved_tokens} saved)"
+                )
+            else:
+                st.caption(f"Last request used the full context ({last_context.reason})")
+
         # Show last full prompt sent
         if st.session_state.last_debug_output:
             st.markdown("### Last Prompt Sent to LLM")
             st.code(st.session_state.last_debug_output, language="text")
+
+        # Show token and latency metrics
+        st.markdown("### Request Metrics")
+        metrics_rows = get_registry().recent_rows()
+        if metrics_rows:
+            st.dataframe(metrics_rows, use_container_width=True)
+        else:
+            st.text("No LLM requests yet")
+        fast_path_stats = get_registry().fast_path_stats()
+        if fast_path_stats["hit_rate"] is not None:
+            st.caption(
+                f"Fast path: {fast_path_stats['hits']} of "
+                f"{fast_path_stats['hits'] + fast_path_stats['misses']} requests answered locally "
+                f"({fast_path_stats['hit_rate']:.0%})"
+            )
+        # Expanders cannot nest, so the exposition text sits behind a checkbox
+        if st.checkbox("Show Prometheus metrics", value=False):
+            st.code(get_registry().render_prometheus(), language="text")